@@ -1,41 +1,72 @@
 import os
-import json
 import datetime
 from flask import Flask
 from loguru import logger
-from src.blueprints.routemanager import routemanager
+from src.utils.compression import init_compression
+from src.utils.server import limit_compute_threads, server_settings
+from src.utils.settings import load_settings
 
 # Load settings from appsettings.json
-with open("appsettings.json", "r", encoding="utf-8") as settings_file:
-    settings = json.load(settings_file)
-
-# Configure log directory
-log_directory = settings.get("log_directory", "static/logs")
-os.makedirs(log_directory, exist_ok=True)
-log_file_path = os.path.join(
-    log_directory, f"application_{datetime.datetime.today().strftime('%Y-%m-%d')}.log"
-)
-
-# Configure Loguru
-logger.add(
-    log_file_path,
-    rotation="10 MB",
-    level="DEBUG",
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
-    "<cyan>{module}</cyan>.<cyan>{function}</cyan>:<cyan>{line}</cyan> | "
-    "<level>{level}</level> | <level>{message}</level>",
-)
-
-# Create Flask app
-app = Flask(__name__)
-app.register_blueprint(routemanager, url_prefix="")
+settings = load_settings()
+
+
+def configure_logging():
+    """Adds the daily application log file to the Loguru sinks."""
+    log_directory = settings.get("log_directory", "static/logs")
+    os.makedirs(log_directory, exist_ok=True)
+    log_file_path = os.path.join(
+        log_directory,
+        f"application_{datetime.datetime.today().strftime('%Y-%m-%d')}.log",
+    )
+
+    logger.add(
+        log_file_path,
+        rotation="10 MB",
+        level="DEBUG",
+        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
+        "<cyan>{module}</cyan>.<cyan>{function}</cyan>:<cyan>{line}</cyan> | "
+        "<level>{level}</level> | <level>{message}</level>",
+    )
+
+
+def create_app(start_background_tasks: bool = True, preload: bool = False) -> Flask:
+    """
+    Creates the Flask application.
+
+    Parameters:
+        start_background_tasks (bool): Start the session writer and retention
+            sweeps. A server that forks workers after creating the application
+            passes False and starts them in every worker instead.
+        preload (bool): Load the sentence encoder and keyword matcher now rather
+            than on the first analysis. This takes seconds, so it only pays off
+            before forking workers that then share them.
+
+    Returns:
+        Flask: The application.
+    """
+    configure_logging()
+    # Must happen before the blueprint imports numpy and torch.
+    limit_compute_threads(server_settings()["compute_threads"])
+
+    from src.blueprints import api, routemanager as routes
+
+    app = Flask(__name__)
+    app.register_blueprint(routes.routemanager, url_prefix="")
+    app.register_blueprint(api.api)
+    init_compression(app, settings.get("compression", {}))
+
+    if preload:
+        routes.preload_shared_state()
+    if start_background_tasks:
+        routes.start_background_tasks()
+    return app
 
 
 def main():
     logger.info("Starting application")
     port = settings.get("port", 8000)
     logger.info(f"Application running on port {port}")
-    app.run(debug=True, port=port)
+    create_app().run(debug=True, port=port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+"""
+Compares chart rendering throughput of the pyplot path with the figure-reuse renderer.
+
+Usage:
+    python -m benchmarks.chart_rendering [--charts 50] [--questions 20] [--threads 4]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from src.utils.chart_renderer import BarChartRenderer, ChartStyle
+
+BAR_COLORS = ["#1982c4", "#8ac926"]
+
+
+def make_data(questions: int, seed: int = 0) -> pd.DataFrame:
+    """Creates a synthetic two-survey comparison with `questions` bar groups."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "Survey 1": rng.uniform(1, 5, questions),
+            "Survey 2": rng.uniform(1, 5, questions),
+        },
+        index=[f"Q{i + 1}" for i in range(questions)],
+    )
+
+
+def render_pyplot(data: pd.DataFrame, filepath: str):
+    """The former ChartBuilder path: DataFrame.plot on the implicit pyplot figure."""
+    data.plot(kind="bar", color=BAR_COLORS, figsize=(12, 6))
+    plt.title("Benchmark", fontsize=16, color="#000000")
+    plt.xlabel("Questions", fontsize=12, color="#000000")
+    plt.ylabel("Average Response", fontsize=12, color="#000000")
+    plt.xticks(rotation=45, ha="right", color="#000000")
+    plt.gca().set_facecolor("#ffffff")
+    plt.gcf().set_facecolor("#ffffff")
+    plt.tight_layout()
+    plt.savefig(filepath, format="jpg")
+    plt.close()
+
+
+def time_charts(render, data: pd.DataFrame, charts: int, folder: str, threads: int):
+    """Renders `charts` charts and returns the achieved charts per second."""
+
+    def render_one(i: int):
+        render(data, os.path.join(folder, f"chart_{i}.jpg"))
+
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(render_one, range(charts)))
+    else:
+        for i in range(charts):
+            render_one(i)
+    return charts / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--charts", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    data = make_data(args.questions)
+    renderer = BarChartRenderer(ChartStyle(bar_colors=tuple(BAR_COLORS)))
+
+    def render_reuse(frame, filepath):
+        renderer.render(frame, "Benchmark", "Questions", "Average Response", filepath)
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Warm up font caches so neither path pays one-off startup costs.
+        render_pyplot(data, os.path.join(folder, "warmup_pyplot.jpg"))
+        render_reuse(data, os.path.join(folder, "warmup_reuse.jpg"))
+
+        results = [
+            ("pyplot", 1, time_charts(render_pyplot, data, args.charts, folder, 1)),
+            (
+                "figure reuse",
+                1,
+                time_charts(render_reuse, data, args.charts, folder, 1),
+            ),
+            (
+                "figure reuse",
+                args.threads,
+                time_charts(render_reuse, data, args.charts, folder, args.threads),
+            ),
+        ]
+
+    print(f"{args.charts} charts, {args.questions} questions per chart")
+    print(f"{'path':<14}{'threads':>8}{'charts/s':>12}")
+    for name, threads, rate in results:
+        print(f"{name:<14}{threads:>8}{rate:>12.1f}")
+    print(f"speed-up (single thread): {results[1][2] / results[0][2]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
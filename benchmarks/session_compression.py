@@ -0,0 +1,129 @@
+"""
+Compares save time, load time and size of sessions for every block compression.
+
+Usage:
+    python -m benchmarks.session_compression [--participants 100 1000 10000] [--questions 50]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.models.question import Question
+from src.models.result import Answer, Result
+from src.models.survey import Survey
+from src.utils.session_catalog import directory_size
+from src.utils.session_format import COMPRESSIONS, resolve_compression
+from src.utils.session_manager import load_session_state, save_session_state
+
+COMMENTS = ["Great course", "Too fast", "More examples please", "", "Okay"]
+
+
+def make_survey(survey_id: int, participants: int, questions: int, seed: int) -> Survey:
+    """Creates a synthetic survey with Likert, binary and free-text questions."""
+    rng = np.random.default_rng(seed)
+    columns = {"id": np.arange(1, participants + 1)}
+    question_list = []
+    for q in range(questions):
+        if q % 10 == 9:
+            values = rng.choice(COMMENTS, participants)
+            answer_type = "text"
+        elif q % 4 == 3:
+            values = rng.integers(0, 2, participants)
+            answer_type = "binary"
+        else:
+            values = rng.integers(1, 6, participants)
+            answer_type = "num"
+        columns[f"Question {q + 1}"] = values
+        question_list.append(Question(q + 1, f"question {q + 1}", answer_type))
+
+    df = pd.DataFrame(columns)
+    results = [
+        Result(
+            int(row[0]),
+            survey_id,
+            [
+                Answer(question_id=q + 1, answer=value)
+                for q, value in enumerate(row[1:])
+            ],
+        )
+        for row in df.itertuples(index=False)
+    ]
+    return Survey(survey_id, "A", "post", question_list, results, dataframe=df)
+
+
+def make_state(participants: int, questions: int) -> dict:
+    """Creates a session state with two synthetic surveys."""
+    summary = pd.DataFrame(
+        {
+            "Question": [f"question {q + 1}" for q in range(questions)],
+            "p-value": np.random.default_rng(2).uniform(0, 1, questions),
+            "Test Used": "t-test",
+        }
+    )
+    return {
+        "survey_1": make_survey(1, participants, questions, seed=0),
+        "survey_2": make_survey(2, participants, questions, seed=1),
+        "global_summary_table": summary,
+        "selected_theme_name": "default",
+        "alpha": 0.05,
+        "test_method": "automatic",
+        "isNormalized": "EMPTY",
+    }
+
+
+def measure(state: dict, compression: str, folder: str, repeats: int):
+    """Returns (save seconds, load seconds, bytes on disk) for one compression."""
+    path = os.path.join(folder, f"{compression}.session")
+    save_times, load_times = [], []
+    for _ in range(repeats):
+        shutil.rmtree(path, ignore_errors=True)
+        start = time.perf_counter()
+        save_session_state(state, path, compression)
+        save_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        loaded = load_session_state(path)
+        # Building the results is part of what a user waits for.
+        len(loaded["survey_1"].results) + len(loaded["survey_2"].results)
+        load_times.append(time.perf_counter() - start)
+    return min(save_times), min(load_times), directory_size(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--participants", type=int, nargs="+", default=[100, 1000, 10000]
+    )
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    logger.remove()
+    compressions = [c for c in COMPRESSIONS if resolve_compression(c) == c]
+
+    print(
+        f"{'participants':>12} {'compression':>11} {'save ms':>9} {'load ms':>9} "
+        f"{'size KB':>9} {'ratio':>6}"
+    )
+    with tempfile.TemporaryDirectory() as folder:
+        for participants in args.participants:
+            state = make_state(participants, args.questions)
+            baseline = None
+            for compression in compressions:
+                save, load, size = measure(state, compression, folder, args.repeats)
+                baseline = baseline or size
+                print(
+                    f"{participants:>12} {compression:>11} {save * 1000:>9.1f} "
+                    f"{load * 1000:>9.1f} {size / 1024:>9.1f} {size / baseline:>6.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
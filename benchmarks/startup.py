@@ -0,0 +1,105 @@
+"""
+Profiles application startup: import time per module and the time until `/` is served.
+
+Starts a fresh interpreter with `-X importtime`, creates the application and
+requests `/`, then reports the slowest imports and whether heavy libraries
+were imported at startup.
+
+Usage:
+    python -m benchmarks.startup [--top 20] [--max-seconds 1.0]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Libraries that should only be imported when a request needs them.
+HEAVY_MODULES = ("torch", "sentence_transformers", "scipy", "matplotlib")
+
+SERVED_MARKER = "served"
+
+CHILD_SCRIPT = f"""
+from app import create_app
+app = create_app(start_background_tasks=False)
+response = app.test_client().get("/")
+print("{SERVED_MARKER}", response.status_code, flush=True)
+"""
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_import_times(stderr: str):
+    """Returns (module, self µs, cumulative µs, nesting depth) per -X importtime line."""
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            imports.append((module, int(own), int(cumulative), len(indent) // 2))
+    return imports
+
+
+def print_table(title: str, rows, top: int):
+    print(f"\n{title}")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for module, own, cumulative, depth in rows[:top]:
+        print(f"{cumulative / 1000:>14.1f} {own / 1000:>9.1f}  {'  ' * depth}{module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="Exit with status 1 if serving / takes longer than this.",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        cwd=os.getcwd(),
+    )
+    served_after, status = None, None
+    for line in process.stdout:
+        if line.startswith(SERVED_MARKER):
+            served_after = time.perf_counter() - start
+            status = line.split()[1]
+    _, stderr = process.communicate()
+    if served_after is None:
+        print(stderr[-2000:], file=sys.stderr)
+        sys.exit("The application did not serve / ; see the output above.")
+
+    imports = parse_import_times(stderr)
+    print_table(
+        "Slowest top-level imports:",
+        sorted((i for i in imports if i[3] == 0), key=lambda i: -i[2]),
+        args.top,
+    )
+    print_table(
+        "Slowest modules by their own import time:",
+        sorted(imports, key=lambda i: -i[1]),
+        args.top,
+    )
+
+    imported = {module.split(".")[0] for module, *_ in imports}
+    heavy = [module for module in HEAVY_MODULES if module in imported]
+    print(f"\nHeavy libraries imported at startup: {', '.join(heavy) or 'none'}")
+    print(f"Imports took {sum(i[1] for i in imports) / 1e6:.2f} s in total.")
+    print(f"/ answered with {status} {served_after:.2f} s after the process started.")
+
+    if args.max_seconds is not None and served_after > args.max_seconds:
+        print(f"Slower than the target of {args.max_seconds:.2f} s.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
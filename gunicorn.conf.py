@@ -0,0 +1,66 @@
+# Gunicorn configuration, read from the "server" section of appsettings.json.
+# Run the application with: gunicorn -c gunicorn.conf.py
+import gc
+import subprocess
+import sys
+
+# Only numpy-free modules may be imported before the thread limits are set.
+from src.utils.chart_store import check_chart_store_workers
+from src.utils.server import limit_compute_threads, server_settings
+from src.utils.settings import get_setting
+
+_settings = server_settings()
+# Set before any worker imports numpy or torch; workers inherit the environment.
+limit_compute_threads(_settings["compute_threads"])
+check_chart_store_workers(get_setting("chart_store", {}), _settings["workers"])
+
+wsgi_app = (
+    f"app:create_app(start_background_tasks=False, preload={_settings['preload']})"
+)
+bind = _settings["bind"]
+workers = _settings["workers"]
+# Threads serve concurrent requests, including progress streams, within a worker.
+worker_class = "gthread"
+threads = _settings["threads"]
+timeout = _settings["timeout"]
+# Load the application, the sentence encoder and the caches once in the master
+# process; forked workers share these pages copy-on-write.
+preload_app = _settings["preload"]
+
+_embedding_service = None
+
+
+def on_starting(server):
+    global _embedding_service
+    from src.utils.embedding_service import service_settings
+
+    service = service_settings()
+    if service["enabled"] and service["managed"]:
+        # One encoder for the whole host, shared by the workers over a Unix socket.
+        _embedding_service = subprocess.Popen(
+            [sys.executable, "-m", "src.utils.embedding_service"]
+        )
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the garbage collector's reach, so its
+    # passes in the workers do not write to, and thereby copy, the shared pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from src.blueprints.routemanager import start_background_tasks
+
+    start_background_tasks()
+
+
+def worker_exit(server, worker):
+    from src.blueprints.routemanager import stop_background_tasks
+
+    stop_background_tasks()
+
+
+def on_exit(server):
+    if _embedding_service is not None:
+        _embedding_service.terminate()
+        _embedding_service.wait(10)
@@ -0,0 +1,301 @@
+import time
+from typing import Optional
+from flask import Blueprint, request, url_for
+from loguru import logger
+from werkzeug.exceptions import HTTPException
+
+import pandas as pd
+
+from src.blueprints import routemanager as routes
+from src.models.user_state import (
+    DEFAULT_ALPHA,
+    DEFAULT_TEST_METHOD,
+    TEST_METHODS,
+    UserState,
+)
+from src.utils.data_preparer import MATCH_THRESHOLD
+from src.utils.job_queue import FINISHED_STATUSES, Job, QueueFullError
+from src.utils.session_retention import charts_folder_of
+from src.utils.survey_query import json_value
+from src.utils.survey_readers import SURVEY_READERS, is_survey_file
+
+# Version 1 of the JSON API. Breaking changes go into a new blueprint under
+# /api/v2, so scripts written against this one keep working.
+api = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+API_STAGES = ["ingest", "match", "test", "chart"]
+# Longest time a client may ask the submitting request to wait for the result.
+MAX_WAIT_SECONDS = 300
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+class ApiError(Exception):
+    """An invalid API request; reported to the client with its status code."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def api_error(error: ApiError):
+    logger.warning(f"API request rejected: {error}")
+    return {"error": str(error)}, error.status
+
+
+@api.errorhandler(HTTPException)
+def http_error(error: HTTPException):
+    return {"error": error.description}, error.code
+
+
+def float_option(name: str, default: float, low: float, high: float) -> float:
+    """Returns a number from the form or query string, checked to lie in [low, high]."""
+    value = request.values.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        raise ApiError(f"{name} must be a number.")
+    if not low <= number <= high:
+        raise ApiError(f"{name} must be between {low} and {high}.")
+    return number
+
+
+def survey_upload(number: int) -> tuple:
+    """
+    Returns (content, survey id, group, type, file name) of uploaded survey 1 or 2.
+
+    Raises:
+        ApiError: If the file is missing or not in a supported format.
+    """
+    file = request.files.get(f"file{number}")
+    if file is None or file.filename == "":
+        raise ApiError(f"file{number} is missing.")
+    if not is_survey_file(file.filename):
+        raise ApiError(
+            f"Invalid file format for Survey {number}. "
+            f"Supported formats: {', '.join(sorted(SURVEY_READERS))}."
+        )
+    try:
+        survey_id = int(request.values.get(f"file{number}_id", number))
+    except ValueError:
+        raise ApiError(f"file{number}_id must be an integer.")
+    return (
+        file.stream.read(),
+        survey_id,
+        request.values.get(f"file{number}_group", "A" if number == 1 else "B"),
+        request.values.get(f"file{number}_type", "post"),
+        file.filename,
+    )
+
+
+def survey_summary(survey) -> dict:
+    return {
+        "survey_id": survey.survey_id,
+        "group": survey.group,
+        "type": survey.survey_type,
+        "participants": len(survey.results),
+        "questions": len(survey.questions),
+    }
+
+
+def summary_records(table: Optional[pd.DataFrame]) -> list:
+    """Returns the summary table as a list of JSON-safe row dicts."""
+    if table is None:
+        return []
+    return [
+        {column: json_value(value) for column, value in row.items()}
+        for row in table.to_dict(orient="records")
+    ]
+
+
+def run_api_analysis(job: Job, uploads: list, options: dict) -> dict:
+    """
+    Job that analyzes two uploaded surveys for an API client.
+
+    Nothing is stored in a browser state or saved as a session; the result is
+    kept in the job record and the charts in the job's charts folder.
+
+    Parameters:
+        job (Job): The running job.
+        uploads (list): (content, survey id, group, type, file name) of both files.
+        options (dict): alpha, test_method, threshold and charts (bool).
+    """
+    state = UserState(
+        alpha=options["alpha"],
+        test_method=options["test_method"],
+        current_session_name=routes.api_session_name(job.id),
+    )
+    with job.stage("ingest") as details:
+        state.survey_1 = routes.read_survey(uploads[0][0], 1, *uploads[0][1:], job=job)
+        state.survey_2 = routes.read_survey(uploads[1][0], 2, *uploads[1][1:], job=job)
+        details["questions"] = [
+            len(state.survey_1.questions),
+            len(state.survey_2.questions),
+        ]
+
+    matched_pairs = routes.analyze_surveys(state, job, options["threshold"])
+    charts = []
+    if options["charts"]:
+        routes.chart_analysis(state, job)
+        charts = routes.chart_renderer.chart_names(routes.current_charts_folder(state))
+
+    return {
+        "survey_1": survey_summary(state.survey_1),
+        "survey_2": survey_summary(state.survey_2),
+        "alpha": state.alpha,
+        "test_method": state.test_method,
+        "threshold": options["threshold"],
+        "normalized": json_value(state.isNormalized),
+        "matched_pairs": matched_pairs,
+        "summary": summary_records(state.global_summary_table),
+        "charts": charts,
+    }
+
+
+def analysis_json(record: dict) -> dict:
+    """Returns the record of an API analysis job with links to its resources."""
+    analysis_id = record["id"]
+    return {
+        "id": analysis_id,
+        "status": record["status"],
+        "message": record["message"],
+        "stages": record["stages"],
+        "created_at": record["created_at"],
+        "started_at": record["started_at"],
+        "finished_at": record["finished_at"],
+        "result": record["result"],
+        "links": {
+            "self": url_for("api_v1.get_analysis", analysis_id=analysis_id),
+            "charts": url_for("api_v1.list_charts", analysis_id=analysis_id),
+        },
+    }
+
+
+def analysis_record(analysis_id: str) -> dict:
+    """
+    Returns the job record of an API analysis.
+
+    Raises:
+        ApiError: If there is no such analysis.
+    """
+    record = routes.job_queue.get(analysis_id, owner=routes.API_JOB_OWNER)
+    if record is None:
+        raise ApiError("Analysis not found.", 404)
+    return record
+
+
+def wait_for_analysis(analysis_id: str, timeout: float) -> dict:
+    """Waits up to `timeout` seconds for an analysis to finish and returns its record."""
+    deadline = time.monotonic() + timeout
+    after = 0
+    while True:
+        record = analysis_record(analysis_id)
+        remaining = deadline - time.monotonic()
+        if record["status"] in FINISHED_STATUSES or remaining <= 0:
+            return record
+        events = routes.job_queue.wait_for_events(analysis_id, after, remaining)
+        if events:
+            after = events[-1]["seq"]
+
+
+def analysis_response(record: dict):
+    """Returns 200 with a finished analysis, or 202 while it is still running."""
+    body = analysis_json(record)
+    status = 200 if record["status"] in FINISHED_STATUSES else 202
+    return body, status, {"Location": body["links"]["self"]}
+
+
+# -----------------------------------------------------------------------------------------
+@api.route("/analyses", methods=["POST"])
+def create_analysis():
+    """
+    Starts an analysis of two survey files sent as multipart form data.
+
+    Form fields: file1, file2 (survey files in any format of SURVEY_READERS),
+    file<n>_id, file<n>_group, file<n>_type, alpha, test_method, threshold, charts
+    (render charts; default true) and wait (seconds to wait for the result before
+    answering 202 with the running job).
+    """
+    uploads = [survey_upload(1), survey_upload(2)]
+    test_method = request.values.get("test_method", DEFAULT_TEST_METHOD)
+    if test_method not in TEST_METHODS:
+        raise ApiError(f"test_method must be one of {', '.join(TEST_METHODS)}.")
+    options = {
+        "alpha": float_option("alpha", DEFAULT_ALPHA, 0.0, 1.0),
+        "test_method": test_method,
+        "threshold": float_option("threshold", MATCH_THRESHOLD, 0.0, 1.0),
+        "charts": request.values.get("charts", "true").lower() in TRUE_VALUES,
+    }
+    wait = float_option("wait", 0.0, 0.0, MAX_WAIT_SECONDS)
+
+    try:
+        analysis_id = routes.job_queue.submit(
+            routes.API_JOB_OWNER,
+            "api_analysis",
+            API_STAGES,
+            run_api_analysis,
+            uploads,
+            options,
+        )
+    except QueueFullError as e:
+        logger.warning(f"API analysis refused: {e}")
+        return {"error": str(e)}, 503, {"Retry-After": "10"}
+
+    logger.info(f"API analysis {analysis_id} started.")
+    return analysis_response(wait_for_analysis(analysis_id, wait))
+
+
+# -----------------------------------------------------------------------------------------
+@api.route("/analyses/<analysis_id>", methods=["GET"])
+def get_analysis(analysis_id: str):
+    """
+    Returns the status and, once finished, the result of an analysis.
+    The `wait` query parameter waits up to that many seconds for it to finish.
+    """
+    wait = float_option("wait", 0.0, 0.0, MAX_WAIT_SECONDS)
+    return analysis_response(wait_for_analysis(analysis_id, wait))
+
+
+# -----------------------------------------------------------------------------------------
+@api.route("/analyses/<analysis_id>", methods=["DELETE"])
+def cancel_analysis(analysis_id: str):
+    """Cancels a running analysis."""
+    analysis_record(analysis_id)
+    if not routes.job_queue.cancel(analysis_id, owner=routes.API_JOB_OWNER):
+        raise ApiError("The analysis has already finished.", 409)
+    return analysis_json(analysis_record(analysis_id)), 202
+
+
+# -----------------------------------------------------------------------------------------
+@api.route("/analyses/<analysis_id>/charts", methods=["GET"])
+def list_charts(analysis_id: str):
+    """Returns the ids and URLs of the charts of an analysis."""
+    record = analysis_record(analysis_id)
+    chart_ids = (record["result"] or {}).get("charts", [])
+    return {
+        "charts": [
+            {
+                "id": chart_id,
+                "url": url_for(
+                    "api_v1.get_chart", analysis_id=analysis_id, chart_id=chart_id
+                ),
+            }
+            for chart_id in chart_ids
+        ]
+    }
+
+
+# -----------------------------------------------------------------------------------------
+@api.route("/analyses/<analysis_id>/charts/<chart_id>", methods=["GET"])
+def get_chart(analysis_id: str, chart_id: str):
+    """Returns a chart image of an analysis, rendering it if necessary."""
+    record = analysis_record(analysis_id)
+    if chart_id not in (record["result"] or {}).get("charts", []):
+        raise ApiError("Chart not found.", 404)
+    charts_folder = charts_folder_of(routes.api_session_name(analysis_id))
+    try:
+        return routes.chart_response(charts_folder, chart_id)
+    except FileNotFoundError:
+        raise ApiError("Chart not found.", 404)
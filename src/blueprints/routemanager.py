@@ -1,65 +1,359 @@
+import dataclasses
+import functools
+import hashlib
+import json
 import os
-import zipfile
-import io
-from typing import List
+import secrets
+import shutil
+import time
+from typing import Callable, List, Optional
 from datetime import datetime
-from io import StringIO
 from loguru import logger
 
-from flask import Blueprint, request, render_template, send_file
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    g,
+    has_request_context,
+    request,
+    render_template,
+    send_file,
+    stream_with_context,
+    url_for,
+)
+from werkzeug.utils import secure_filename
 
 import pandas as pd
 
 from src.models.survey import Survey
 from src.models.color_scheme import ColorScheme
+from src.models.user_state import (
+    DEFAULT_ALPHA,
+    DEFAULT_TEST_METHOD,
+    DEFAULT_THEME,
+    UserState,
+)
 from src.models.keywords import KeywordManager
-from src.utils.chart_builder import ChartBuilder
-from src.utils.session_manager import save_session_state, load_session_state
+from src.utils.chart_builder import ChartBuilder, QUESTIONS_PER_PAGE
+from src.utils.chart_store import CHART_FORMATS, create_chart_store, mimetype_for
+from src.utils.compression import ETAG_SUFFIX
+from src.utils.job_queue import (
+    FINISHED_STATUSES,
+    Job,
+    JobInterrupted,
+    JobQueue,
+    QueueFullError,
+    job_stage,
+    job_step,
+)
+from src.utils.lazy_chart_renderer import LazyChartRenderer
+from src.utils.settings import get_setting
+from src.utils.zip_stream import stream_zip
+from src.utils.session_manager import (
+    LEGACY_SUFFIX,
+    convert_pickle_session,
+    list_session_names,
+    load_session_metadata,
+    load_session_state,
+    save_session_state,
+)
+from src.utils.session_catalog import SORT_COLUMNS, SessionCatalog, directory_size
+from src.utils.session_format import SESSION_SUFFIX
+from src.utils.session_retention import SessionRetention, charts_folder_of
+from src.utils.session_writer import SessionWriter
+from src.utils.state_store import create_state_store
+from src.utils.survey_readers import (
+    SURVEY_READERS,
+    is_survey_file,
+    read_survey_dataframe,
+)
+from src.utils.survey_query import (
+    PARTICIPANT_SORT_KEYS,
+    participant_answers,
+    query_participants,
+)
+from src.utils.table_export import (
+    PARTICIPANT_FORMATS,
+    SUMMARY_FORMATS,
+    export_summary,
+    stream_long_csv,
+    stream_long_parquet,
+)
 from src.utils.analysis import Analysis
-from src.utils.data_preparer import DataPreparer
+from src.utils.data_preparer import MATCH_THRESHOLD, DataPreparer, get_encoder
 
 routemanager = Blueprint("routemanager", __name__, template_folder="templates")
 
-DEFAULT_ALPHA = 0.5
-alpha = DEFAULT_ALPHA
-DEFAULT_TEST_METHOD = "automatic"
-test_method = DEFAULT_TEST_METHOD
+image_path = os.getcwd() + "/static/images/"
+sessions_path = os.getcwd() + "/static/sessions/"
+# Databases of the application; kept outside static/, which Flask serves publicly.
+data_path = os.path.join(os.getcwd(), get_setting("data_directory", "instance"), "")
+os.makedirs(data_path, exist_ok=True)
 
 
-survey_1_in_memory = Survey(
-    survey_id=0,
-    group="",
-    survey_type="post",
-    questions=[],
-    results=[],
-    dataframe=pd.DataFrame(),
+def data_file(name: str) -> str:
+    """
+    Returns the path of a database in the data folder, moving it there from the
+    sessions folder where earlier versions kept it.
+    """
+    path = data_path + name
+    legacy_path = sessions_path + name
+    if os.path.exists(legacy_path) and not os.path.exists(path):
+        logger.info(f"Moving {legacy_path} out of the static folder to {path}.")
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.replace(legacy_path + suffix, path + suffix)
+            except FileNotFoundError:
+                # No such journal file, or another worker moved it first.
+                pass
+    return path
+
+
+# Compression of stored session blocks: none, lz4, zstd, gzip or lzma. gzip is part
+# of the standard library, so any installation can open the sessions.
+SESSION_COMPRESSION = get_setting("session_compression", "gzip")
+# Number of sessions shown per page of the session list.
+SESSIONS_PER_PAGE = 25
+# Participants shown per page of the data page, and the most a client may request.
+PARTICIPANTS_PER_PAGE = 25
+MAX_PARTICIPANTS_PER_PAGE = 200
+# Download names of the exports unless the form names them.
+EXPORT_FILENAMES = {
+    "csv": "dataframe_export.csv",
+    "latex": "analysis_results.tex",
+    "xlsx": "analysis_results.xlsx",
+    "parquet": "analysis_results.parquet",
+    "participants_csv": "participants_long.csv",
+    "participants_parquet": "participants_long.parquet",
+}
+session_catalog = SessionCatalog(
+    get_setting("session_catalog", None) or data_file("catalog.db")
 )
-survey_2_in_memory = Survey(
-    survey_id=0,
-    group="",
-    survey_type="post",
-    questions=[],
-    results=[],
-    dataframe=pd.DataFrame(),
+# Sessions are written in the background; the catalog is updated once they are on disk.
+session_writer = SessionWriter(
+    on_written=lambda session_path: catalog_session(os.path.basename(session_path))
 )
 
-global_results = pd.DataFrame()
-global_summary_table = None
-isNormalized = "EMPTY"
-
-current_session_name = ""
-image_path = os.getcwd() + "/static/images/"
-sessions_path = os.getcwd() + "/static/sessions/"
+# Charts are drawn on first request; URLs carry the plan version, so browsers
+# may cache them for this long without revalidating.
+CHART_CACHE_MAX_AGE = 3600
+CHART_FORMAT = get_setting("chart_format", "jpg")
+CHART_DPI = get_setting("chart_dpi", 100)
+CHART_IMAGE_EXTENSIONS = tuple(f".{extension}" for extension in CHART_FORMATS)
+chart_store = create_chart_store(get_setting("chart_store", {}), image_path)
+# Another worker may re-plan a session's charts; this one then plans them again.
+chart_renderer = LazyChartRenderer(
+    chart_store, replan=lambda charts_folder: replan_charts(charts_folder)
+)
 
 available_themes = ColorScheme.load_schemes()
-selected_theme = next(
-    (theme for theme in available_themes if theme.name == "default"),
+default_theme = next(
+    (theme for theme in available_themes if theme.name == DEFAULT_THEME),
     available_themes[0] if available_themes else None,
 )
 
+# Surveys, results and settings are kept per browser, identified by this cookie.
+SESSION_COOKIE = "survey_sid"
+state_store = create_state_store(get_setting("state_store", {}), data_file("states.db"))
+
+
+def user_state() -> UserState:
+    """
+    Returns the working state of the browser making the current request.
+    Browsers without a known session id get a new id and an empty state. Both are
+    only stored, and the id only sent as a cookie, once the state first changes
+    or the browser submits a job, so requests that change nothing store nothing.
+    """
+    if "user_state" not in g:
+        sid = request.cookies.get(SESSION_COOKIE)
+        state = state_store.get(sid) if sid else None
+        if state is None:
+            # Never adopt an id the client made up; issue a fresh one instead.
+            sid = secrets.token_urlsafe(32)
+            state = UserState()
+            g.new_sid = True
+        g.sid = sid
+        g.user_state = state
+    return g.user_state
+
+
+def save_user_state(state: UserState, include_data: bool = True, sid: str = None):
+    """
+    Stores the working state of a browser.
+
+    Parameters:
+        state (UserState): State returned by `user_state`.
+        include_data (bool): Also store surveys and results; False if only
+            settings such as alpha or the theme changed.
+        sid (str): Browser session id; that of the current request by default.
+            Background jobs, which run outside a request, pass it explicitly.
+    """
+    state.modified_at = time.time()
+    state_store.put(sid or g.sid, state, include_data)
+    if has_request_context() and (sid or g.get("sid")) == g.get("sid"):
+        g.sid_stored = True
+
+
+def save_job_results(sid: str, state: UserState, fields: tuple):
+    """
+    Stores the fields a job produced on top of the browser's current state, so
+    changes the browser made while the job ran, e.g. a new theme, are kept.
+
+    Parameters:
+        sid (str): Browser session the job belongs to.
+        state (UserState): The job's copy of the state.
+        fields (tuple): Names of the fields the job produced.
+    """
+    current = state_store.get(sid) or UserState()
+    # The stored state may be shared with running requests, so it is replaced
+    # rather than changed in place.
+    produced = {name: getattr(state, name) for name in fields}
+    save_user_state(dataclasses.replace(current, **produced), sid=sid)
+
+
+@routemanager.after_app_request
+def set_session_cookie(response):
+    if g.get("new_sid") and g.get("sid_stored"):
+        response.set_cookie(SESSION_COOKIE, g.sid, httponly=True, samesite="Lax")
+    return response
+
+
+def theme_for(state: UserState) -> ColorScheme:
+    """Returns the color scheme selected in a state, or the default scheme."""
+    return next(
+        (theme for theme in available_themes if theme.name == state.theme_name),
+        default_theme,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def templates_version() -> str:
+    """Returns a hash of the page templates, so deploying new templates changes every page ETag."""
+    digest = hashlib.sha1()
+    folder = os.path.join(routemanager.root_path, routemanager.template_folder)
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+    return digest.hexdigest()[:16]
+
+
+def conditional_page(extra: Callable[[UserState], object] = None):
+    """
+    Answers GET requests with 304 Not Modified while the browser's working state is
+    unchanged, and marks the responses as revalidate-before-use.
+
+    The ETag is derived from the request URL, the templates and the state's
+    version; it changes whenever the state is stored. Responses are private to
+    the browser, since the page depends on its session cookie.
+
+    Parameters:
+        extra (Callable): Returns further data the page depends on beyond the
+            state, e.g. the chart list; it is hashed into the ETag.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+
+            state = user_state()
+            version = [
+                templates_version(),
+                request.full_path,
+                state.data_version,
+                state.modified_at,
+                state.settings(),
+            ]
+            if extra is not None:
+                version.append(extra(state))
+            etag = hashlib.sha1(
+                json.dumps(version, sort_keys=True, default=str).encode()
+            ).hexdigest()
+
+            # A compressed response carries the ETag with a suffix; accept both.
+            matched = next(
+                (
+                    tag
+                    for tag in (etag, etag + ETAG_SUFFIX)
+                    if tag in request.if_none_match
+                ),
+                None,
+            )
+            if matched is not None:
+                response = Response(status=304)
+                response.set_etag(matched)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+            if state.modified_at:
+                response.last_modified = state.modified_at
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add("Cookie")
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+# Analyses run as background jobs so requests return immediately.
+UPLOAD_STAGES = ["ingest", "match", "test", "chart", "persist"]
+ANALYSIS_STAGES = ["match", "test", "chart", "persist"]
+# Fields of the browser's state each job produces and stores when it is done.
+ANALYSIS_FIELDS = (
+    "global_summary_table",
+    "global_results",
+    "isNormalized",
+    "alpha",
+    "test_method",
+)
+UPLOAD_FIELDS = ANALYSIS_FIELDS + ("survey_1", "survey_2", "current_session_name")
+job_settings = get_setting("analysis_jobs", {})
+job_queue = JobQueue(
+    data_file("jobs.db"),
+    max_workers=job_settings.get("workers", 2),
+    max_pending=job_settings.get("max_pending", 8),
+    timeout=job_settings.get("timeout_seconds", 900),
+)
+
+
+# Analyses submitted through the JSON API belong to no browser session; their
+# charts live in a folder named after the job and are kept as long as the job.
+API_JOB_OWNER = "api"
+
+
+def api_session_name(job_id: str) -> str:
+    """Returns the session name whose charts folder holds the charts of an API analysis."""
+    return f"api-{job_id}"
+
+
+def submit_job(kind: str, stages: List[str], function, *args) -> str:
+    """
+    Queues `function(job, *args)` for the current browser and returns the job id.
+    The job runs inside the application context, so it can render templates.
+    """
+    app = current_app._get_current_object()
+    if g.get("new_sid") and not g.get("sid_stored"):
+        # Jobs belong to the browser's id, so it has to stay valid.
+        save_user_state(user_state())
+
+    def run(job: Job, *job_args):
+        with app.app_context():
+            return function(job, *job_args)
+
+    return job_queue.submit(g.sid, kind, stages, run, *args)
+
+
 # -----------------------------------------------------------------------------------------
 # General
 @routemanager.route("/")
+@conditional_page()
 def general():
     logger.info("Entered general function.")
     logger.info("Rendering general page.")
@@ -69,16 +363,23 @@ def general():
 # -----------------------------------------------------------------------------------------
 # Survey
 @routemanager.route("/survey")
+@conditional_page()
 def survey():
     logger.info("Entered survey function.")
     logger.info("Rendering survey page.")
-    file1_id = request.form.get("file1_id", "1")
-    file1_type = request.form.get("file1_type", "post")
-    file1_group = request.form.get("file1_group", "A")
+    file1_id = request.values.get("file1_id", "1")
+    file1_type = request.values.get("file1_type", "post")
+    file1_group = request.values.get("file1_group", "A")
 
-    file2_id = request.form.get("file2_id", "2")
-    file2_type = request.form.get("file2_type", "post")
-    file2_group = request.form.get("file2_group", "B")
+    file2_id = request.values.get("file2_id", "2")
+    file2_type = request.values.get("file2_type", "post")
+    file2_group = request.values.get("file2_group", "B")
+
+    # A finished upload job sends the browser here with its outcome.
+    message = request.args.get("message")
+    error_message = None
+    if request.args.get("status") == "error":
+        message, error_message = None, message
 
     logger.debug(
         f"Survey parameters - file1: {file1_id}, {file1_type}, {file1_group}; file2: {file2_id}, {file2_type}, {file2_group}"
@@ -91,6 +392,8 @@ def survey():
         file2_id=file2_id,
         file2_type=file2_type,
         file2_group=file2_group,
+        message=message,
+        error_message=error_message,
     )
 
 
@@ -98,231 +401,283 @@ def survey():
 @routemanager.route("/loadsurveyfromfile", methods=["POST"])
 def loadsurveyfromfile():
     logger.info("Entered loadsurveyfromfile function.")
+    file1_id = request.form.get("file1_id", "1")
+    file1_type = request.form.get("file1_type", "post")
+    file1_group = request.form.get("file1_group", "A")
+
+    file2_id = request.form.get("file2_id", "2")
+    file2_type = request.form.get("file2_type", "post")
+    file2_group = request.form.get("file2_group", "B")
+
+    form_values = dict(
+        file1_id=file1_id,
+        file1_type=file1_type,
+        file1_group=file1_group,
+        file2_id=file2_id,
+        file2_type=file2_type,
+        file2_group=file2_group,
+    )
     try:
         logger.info("Started loading surveys from files.")
-        global current_session_name, alpha, test_method, survey_1_in_memory, survey_2_in_memory
+        state = user_state()
 
         if "file1" not in request.files or "file2" not in request.files:
             logger.warning("Both survey files must be uploaded.")
             raise ValueError("Both survey files must be uploaded.")
 
-        file1_id = request.form.get("file1_id", "1")
-        file1_type = request.form.get("file1_type", "post")
-        file1_group = request.form.get("file1_group", "A")
         file1 = request.files["file1"]
-
-        file2_id = request.form.get("file2_id", "2")
-        file2_type = request.form.get("file2_type", "post")
-        file2_group = request.form.get("file2_group", "B")
         file2 = request.files["file2"]
-
         logger.debug(f"File details - file1: {file1.filename}, file2: {file2.filename}")
 
         if file1.filename == "" or file2.filename == "":
             logger.warning("Files must have valid names.")
             raise ValueError("Files must have valid names.")
 
-        # Load Survey 1
-        if file1 and file1.filename.endswith(".csv"):
-            logger.info("Processing Survey 1 file.")
-            file_content = StringIO(file1.stream.read().decode("utf-8"))
-            df1 = pd.read_csv(file_content)
-            if df1.empty:
-                logger.warning("Survey 1 file is empty.")
-                raise ValueError("Survey 1 file is empty.")
-            survey_1_in_memory = Survey(
-                survey_id=int(file1_id),
-                group=file1_group,
-                survey_type=file1_type,
-                dataframe=df1,
-                questions=[],
-                results=[],
-            )
-            survey_1_in_memory.populate_data()
-        else:
-            logger.warning("Invalid file format for Survey 1.")
-            raise ValueError(
-                "Invalid file format for Survey 1. Only .csv files are supported."
-            )
+        for number, file in ((1, file1), (2, file2)):
+            if not is_survey_file(file.filename):
+                logger.warning(f"Invalid file format for Survey {number}.")
+                raise ValueError(
+                    f"Invalid file format for Survey {number}. Supported formats: "
+                    f"{', '.join(sorted(SURVEY_READERS))}."
+                )
 
-        # Load Survey 2
-        if file2 and file2.filename.endswith(".csv"):
-            logger.info("Processing Survey 2 file.")
-            file_content = StringIO(file2.stream.read().decode("utf-8"))
-            df2 = pd.read_csv(file_content)
-            if df2.empty:
-                logger.warning("Survey 2 file is empty.")
-                raise ValueError("Survey 2 file is empty.")
-            survey_2_in_memory = Survey(
-                survey_id=int(file2_id),
-                group=file2_group,
-                survey_type=file2_type,
-                dataframe=df2,
-                questions=[],
-                results=[],
-            )
-            survey_2_in_memory.populate_data()
-        else:
-            logger.warning("Invalid file format for Survey 2.")
-            raise ValueError(
-                "Invalid file format for Survey 2. Only .csv files are supported."
+        # The upload has to be read while the request is open; parsing and the
+        # analysis run as a background job.
+        uploads = [
+            (file.stream.read(), int(survey_id), group, survey_type, file.filename)
+            for file, survey_id, group, survey_type in (
+                (file1, file1_id, file1_group, file1_type),
+                (file2, file2_id, file2_group, file2_type),
             )
+        ]
+        job_id = submit_job(
+            "upload",
+            UPLOAD_STAGES,
+            run_survey_upload,
+            g.sid,
+            dataclasses.replace(state),
+            uploads,
+        )
 
-        if survey_1_in_memory.dataframe.empty or survey_2_in_memory.dataframe.empty:
-            logger.error("Both surveys must contain valid data.")
-            raise ValueError("Both surveys must contain valid data.")
-
-        new_session_flag = True
-        if current_session_name:
-            try:
-                _, session_ids = current_session_name.split("_")
-                session_file1_id, session_file2_id = session_ids.split("-")
-                session_file2_id = session_file2_id.split(".")[0]
-
-                if session_file1_id == file1_id and session_file2_id == file2_id:
-                    error_message, status = perform_analysis()
-                    update_session()
-                    if status == "error":
-                        logger.warning("Error occurred during analysis.")
-                        return render_template(
-                            "survey.html",
-                            error_message=error_message,
-                            file1_id=file1_id,
-                            file1_type=file1_type,
-                            file1_group=file1_group,
-                            file2_id=file2_id,
-                            file2_type=file2_type,
-                            file2_group=file2_group,
-                        )
-                    else:
-                        new_session_flag = False
-            except ValueError:
-                current_session_name = None
-
-        if new_session_flag:
-            alpha = DEFAULT_ALPHA
-            test_method = DEFAULT_TEST_METHOD
-            current_date = datetime.now().strftime("%d-%m-%Y")
-            current_session_name = f"{current_date}_{file1_id}-{file2_id}.pkl"
-
-            error_message, status = perform_analysis()
-            save_session()
-            if status == "error":
-                logger.warning("Error during new session analysis.")
-                return render_template(
-                    "survey.html",
-                    error_message=error_message,
-                    file1_id=file1_id,
-                    file1_type=file1_type,
-                    file1_group=file1_group,
-                    file2_id=file2_id,
-                    file2_type=file2_type,
-                    file2_group=file2_group,
-                )
-
-        logger.info("Surveys loaded and session updated successfully.")
+        logger.info(f"Surveys queued for loading as job {job_id}.")
         return render_template(
             "survey.html",
-            message="Surveys loaded successfully.",
-            file1_id=file1_id,
-            file1_type=file1_type,
-            file1_group=file1_group,
-            file2_id=file2_id,
-            file2_type=file2_type,
-            file2_group=file2_group,
+            message="Surveys are being loaded and analyzed.",
+            job_id=job_id,
+            done_url=url_for("routemanager.survey", **form_values),
+            **form_values,
         )
 
     except ValueError as e:
         logger.warning(f"Input Error: {e}")
         return render_template(
-            "survey.html",
-            error_message=f"Input Error: {str(e)}",
-            file1_id=request.form.get("file1_id", "1"),
-            file1_type=request.form.get("file1_type", "post"),
-            file1_group=request.form.get("file1_group", "A"),
-            file2_id=request.form.get("file2_id", "2"),
-            file2_type=request.form.get("file2_type", "post"),
-            file2_group=request.form.get("file2_group", "B"),
-        )
-    except pd.errors.ParserError:
-        logger.error("Failed to parse CSV files.", exc_info=True)
-        return render_template(
-            "survey.html",
-            error_message="Failed to parse CSV files. Check file format.",
-            file1_id=request.form.get("file1_id", "1"),
-            file1_type=request.form.get("file1_type", "post"),
-            file1_group=request.form.get("file1_group", "A"),
-            file2_id=request.form.get("file2_id", "2"),
-            file2_type=request.form.get("file2_type", "post"),
-            file2_group=request.form.get("file2_group", "B"),
+            "survey.html", error_message=f"Input Error: {str(e)}", **form_values
         )
+    except QueueFullError as e:
+        logger.warning(f"Analysis queue is full: {e}")
+        return render_template("survey.html", error_message=str(e), **form_values)
     except Exception as e:
         logger.critical(f"Unexpected error: {e}", exc_info=True)
         return render_template(
             "survey.html",
             error_message=f"An unexpected error occurred: {str(e)}",
-            file1_id=request.form.get("file1_id", "1"),
-            file1_type=request.form.get("file1_type", "post"),
-            file1_group=request.form.get("file1_group", "A"),
-            file2_id=request.form.get("file2_id", "2"),
-            file2_type=request.form.get("file2_type", "post"),
-            file2_group=request.form.get("file2_group", "B"),
+            **form_values,
         )
 
 
 # -----------------------------------------------------------------------------------------
-def perform_analysis():
-    logger.info("Entered perform_analysis function.")
-    try:
-        global global_results, global_summary_table, isNormalized
+def read_survey(
+    content: bytes,
+    number: int,
+    survey_id: int,
+    group: str,
+    survey_type: str,
+    filename: str = "survey.csv",
+    job: Job = None,
+) -> Survey:
+    """
+    Parses an uploaded survey file into a Survey.
 
-        if survey_1_in_memory.dataframe.empty or survey_2_in_memory.dataframe.empty:
-            logger.error("No survey data available for analysis.")
-            raise ValueError("No survey data available.")
+    Parameters:
+        filename (str): Name of the uploaded file, which selects its format.
+        job (Job): Job to report the "parse" and "answers" steps to, if any.
 
-        # Step 1: Prepare data
-        logger.info("Preparing data for analysis.")
-        data_preparer = DataPreparer()
-        matched_pairs = data_preparer.prepare_surveys(
-            survey_1_in_memory, survey_2_in_memory
+    Raises:
+        ValueError: If the file cannot be parsed or is empty.
+    """
+    logger.info(f"Processing Survey {number} file.")
+    with job_step(job, "parse", survey=number) as details:
+        df = read_survey_dataframe(content, filename)
+        details.update(rows=len(df), columns=len(df.columns))
+    if df.empty:
+        logger.warning(f"Survey {number} file is empty.")
+        raise ValueError(f"Survey {number} file is empty.")
+
+    survey = Survey(
+        survey_id=survey_id,
+        group=group,
+        survey_type=survey_type,
+        dataframe=df,
+        questions=[],
+        results=[],
+    )
+    with job_step(job, "answers", survey=number) as details:
+        survey.populate_data()
+        details.update(rows=len(survey.results), questions=len(survey.questions))
+    return survey
+
+
+def run_survey_upload(job: Job, sid: str, state: UserState, uploads: list) -> dict:
+    """
+    Job that loads two uploaded surveys, analyzes them and saves the session.
+
+    Uploading surveys with the IDs of the current session updates that session;
+    any other IDs start a new session.
+
+    Parameters:
+        job (Job): The running job.
+        sid (str): Browser session the surveys were uploaded from.
+        state (UserState): Copy of the browser's state that the job fills.
+        uploads (list): (content, survey id, group, type, file name) of both files.
+    """
+    with job.stage("ingest") as details:
+        state.survey_1 = read_survey(uploads[0][0], 1, *uploads[0][1:], job=job)
+        state.survey_2 = read_survey(uploads[1][0], 2, *uploads[1][1:], job=job)
+        if state.survey_1.dataframe.empty or state.survey_2.dataframe.empty:
+            logger.error("Both surveys must contain valid data.")
+            raise ValueError("Both surveys must contain valid data.")
+        details.update(
+            rows=[len(state.survey_1.dataframe), len(state.survey_2.dataframe)],
+            questions=[len(state.survey_1.questions), len(state.survey_2.questions)],
         )
 
-        # Step 2: Perform hypothesis testing
-        logger.info("Performing hypothesis testing.")
-        analyser = Analysis(alpha=alpha)
-        hypothesis_results, isNormalized = analyser.perform_hypothesis_testing(
-            survey_1_in_memory, survey_2_in_memory, matched_pairs, test_method
+    file1_id, file2_id = str(uploads[0][1]), str(uploads[1][1])
+    new_session_flag = True
+    if state.current_session_name:
+        try:
+            _, session_ids = state.current_session_name.split("_")
+            session_file1_id, session_file2_id = session_ids.split("-")
+            session_file2_id = session_file2_id.split(".")[0]
+            new_session_flag = not (
+                session_file1_id == file1_id and session_file2_id == file2_id
+            )
+        except ValueError:
+            state.current_session_name = ""
+
+    if new_session_flag:
+        state.alpha = DEFAULT_ALPHA
+        state.test_method = DEFAULT_TEST_METHOD
+        current_date = datetime.now().strftime("%d-%m-%Y")
+        state.current_session_name = (
+            f"{current_date}_{file1_id}-{file2_id}{SESSION_SUFFIX}"
         )
 
-        # Free up memory by clearing statistics after completing analysis.
-        logger.info("Clearing statistics to free up memory.")
-        survey_1_in_memory.clear_statistics()
-        survey_2_in_memory.clear_statistics()
+    error_message, status = perform_analysis(state, job)
+
+    with job.stage("persist"):
+        if new_session_flag:
+            save_session(state)
+        else:
+            update_session(include_surveys=True, include_summary=True, state=state)
+        save_job_results(sid, state, UPLOAD_FIELDS)
+
+    if status == "error":
+        logger.warning("Error occurred during analysis.")
+        raise ValueError(error_message)
 
-        # Store results globally
-        logger.info("Storing analysis results globally.")
-        global_summary_table = hypothesis_results
-        global_results = hypothesis_results.set_index("Question").T.to_dict()
+    logger.info("Surveys loaded and session updated successfully.")
+    return {"message": "Surveys loaded successfully.", "status": "success"}
 
-        # Step 4: Generate charts
-        logger.info("Generating charts.")
-        charts_folder = image_path + os.path.splitext(current_session_name)[0] + "/"
-        chart_builder = ChartBuilder(
-            survey_1_in_memory,
-            survey_2_in_memory,
-            charts_folder,
-            color_scheme=selected_theme,
+
+# -----------------------------------------------------------------------------------------
+def analyze_surveys(
+    state: UserState, job: Job = None, threshold: float = MATCH_THRESHOLD
+) -> List[dict]:
+    """
+    Matches the questions of both surveys of a state and tests them, storing the
+    summary table and results in the state.
+
+    Parameters:
+        state (UserState): State holding the surveys; receives the results.
+        job (Job): Job to report the match and test stages to, if any.
+        threshold (float): Minimum similarity of two questions to be matched.
+
+    Returns:
+        list: The matched question pairs.
+
+    Raises:
+        ValueError: If a survey holds no data.
+    """
+    if state.survey_1.dataframe.empty or state.survey_2.dataframe.empty:
+        logger.error("No survey data available for analysis.")
+        raise ValueError("No survey data available.")
+
+    # Step 1: Prepare data
+    logger.info("Preparing data for analysis.")
+    with job_stage(job, "match") as details:
+        data_preparer = DataPreparer()
+        matched_pairs = data_preparer.prepare_surveys(
+            state.survey_1, state.survey_2, threshold=threshold
+        )
+        details["matched_questions"] = len(matched_pairs)
+
+    # Step 2: Perform hypothesis testing
+    logger.info("Performing hypothesis testing.")
+    with job_stage(job, "test") as details:
+        analyser = Analysis(alpha=state.alpha)
+        hypothesis_results, state.isNormalized = analyser.perform_hypothesis_testing(
+            state.survey_1, state.survey_2, matched_pairs, state.test_method
         )
+        details["tested_questions"] = len(hypothesis_results)
 
-        # Load user-defined keywords
-        user_keywords = KeywordManager.load_keywords()
-        logger.debug(f"Using keywords for chart generation: {user_keywords}")
+    # Free up memory by clearing statistics after completing analysis.
+    logger.info("Clearing statistics to free up memory.")
+    state.survey_1.clear_statistics()
+    state.survey_2.clear_statistics()
 
-        chart_builder.generate_charts(hypothesis_results, keywords=user_keywords)
+    # Store results in the user's state
+    logger.info("Storing analysis results.")
+    state.global_summary_table = hypothesis_results
+    state.global_results = hypothesis_results.set_index("Question").T.to_dict()
+    return matched_pairs
+
+
+def chart_analysis(state: UserState, job: Job = None):
+    """
+    Plans the charts of an analyzed state. A job renders them right away;
+    otherwise they are rendered when first requested.
+    """
+    logger.info("Planning charts.")
+    with job_stage(job, "chart") as details:
+        details["charts"] = generate_charts_based_on_analysis(state)
+        if job is not None and job_settings.get("prerender_charts", True):
+            details["rendered"] = render_planned_charts(
+                job, current_charts_folder(state)
+            )
+
+
+def perform_analysis(state: UserState, job: Job = None):
+    """
+    Matches the questions of both surveys, tests them and plans the charts.
+
+    Parameters:
+        state (UserState): State holding the surveys; receives the results.
+        job (Job): Job to report the match, test and chart stages to, if any.
+            Charts are rendered as part of a job, one step per chart.
+
+    Returns:
+        tuple: (message, "success" or "error").
+    """
+    logger.info("Entered perform_analysis function.")
+    try:
+        analyze_surveys(state, job)
+        chart_analysis(state, job)
 
         logger.info("Analysis completed successfully.")
         return "Analysis completed successfully.", "success"
 
+    except JobInterrupted:
+        raise
     except ValueError as e:
         logger.warning(f"Value Error occurred during analysis: {e}")
         return f"Value Error occurred during analysis: {str(e)}", "error"
@@ -333,89 +688,156 @@ def perform_analysis():
         return f"An unexpected error occurred during analysis: {str(e)}", "error"
 
 
+def render_planned_charts(job: Job, charts_folder: str) -> int:
+    """
+    Renders the planned charts of a folder as steps of a job.
+
+    A chart that fails to render is left to be rendered on request, where its
+    error is shown.
+
+    Returns:
+        int: Number of charts rendered or already stored.
+    """
+    rendered = 0
+    for filename in chart_renderer.chart_names(charts_folder):
+        try:
+            with job.step("render", chart=filename) as details:
+                chart_key = chart_renderer.ensure_chart(charts_folder, filename)
+                details["bytes"] = chart_store.size(chart_key)
+            rendered += 1
+        except JobInterrupted:
+            raise
+        except Exception as e:
+            logger.warning(f"Rendering chart {filename} in job {job.id} failed: {e}")
+    return rendered
+
+
 # -----------------------------------------------------------------------------------------
 # Analysis
 @routemanager.route("/analysis", methods=["GET", "POST"])
+@conditional_page()
 def analysis():
     logger.info("Entered analysis function.")
+    state = user_state()
     if request.method == "POST":
         logger.info("Received POST request for analysis.")
-        global alpha, test_method
-        alpha = float(request.form["alpha"])
-        test_method = request.form.get("test-method", "automatic")
-
-        logger.debug(f"Alpha: {alpha}, Test Method: {test_method}")
-        message, status = perform_analysis()
+        job_state = dataclasses.replace(state)
+        job_state.alpha = float(request.form["alpha"])
+        job_state.test_method = request.form.get("test-method", "automatic")
+
+        logger.debug(f"Alpha: {job_state.alpha}, Test Method: {job_state.test_method}")
+        job_id = None
+        try:
+            job_id = submit_job(
+                "analysis", ANALYSIS_STAGES, run_analysis, g.sid, job_state
+            )
+            message, status = "Analysis started.", "running"
+        except QueueFullError as e:
+            logger.warning(f"Analysis queue is full: {e}")
+            message, status = str(e), "error"
 
-        logger.info("Rendering analysis page with results.")
+        logger.info("Rendering analysis page while the analysis runs.")
         return render_template(
             "analysis.html",
-            results=global_results,
-            survey1=survey_1_in_memory,
-            survey2=survey_2_in_memory,
-            alpha=alpha,
-            test_method=test_method,
+            results=state.global_results,
+            survey1=state.survey_1,
+            survey2=state.survey_2,
+            alpha=job_state.alpha,
+            test_method=job_state.test_method,
             message=message,
             status=status,
-            isNormalized=isNormalized
+            isNormalized=state.isNormalized,
+            job_id=job_id,
+            done_url=url_for("routemanager.analysis"),
         )
 
     logger.info("Rendering analysis page without recalculation.")
     return render_template(
         "analysis.html",
-        results=global_results,
-        survey1=survey_1_in_memory,
-        survey2=survey_2_in_memory,
-        alpha=alpha,
-        test_method=test_method,
-        isNormalized=isNormalized
+        results=state.global_results,
+        survey1=state.survey_1,
+        survey2=state.survey_2,
+        alpha=state.alpha,
+        test_method=state.test_method,
+        message=request.args.get("message"),
+        status=request.args.get("status"),
+        isNormalized=state.isNormalized,
     )
 
 
+# -----------------------------------------------------------------------------------------
+def run_analysis(job: Job, sid: str, state: UserState) -> dict:
+    """
+    Job that re-runs the analysis with new settings and records it in the session.
+
+    Parameters:
+        job (Job): The running job.
+        sid (str): Browser session that requested the analysis.
+        state (UserState): Copy of the browser's state with the new settings.
+    """
+    message, status = perform_analysis(state, job)
+    with job.stage("persist"):
+        if status != "error" and state.current_session_name:
+            update_session(include_summary=True, state=state)
+        save_job_results(sid, state, ANALYSIS_FIELDS)
+
+    if status == "error":
+        raise ValueError(message)
+    return {"message": message, "status": status}
+
+
 # -----------------------------------------------------------------------------------------
 @routemanager.route("/export_data", methods=["POST"])
 def export_data():
+    """
+    Sends the summary table, or the answers of all participants in long format, as
+    a download. Exports are generated in memory straight into the response;
+    participant exports are streamed in chunks of rows.
+    """
     logger.info("Entered export_data function.")
     try:
-        latex_filename = request.form.get("latex_filename", "analysis_results.tex")
-        csv_filename = request.form.get("csv_filename", "dataframe_export.csv")
         export_type = request.form.get("export_type")
-
-        logger.debug(
-            f"Export parameters - Latex Filename: {latex_filename}, CSV Filename: {csv_filename}, Export Type: {export_type}"
-        )
-
-        latex_filepath = "/tmp/" + latex_filename
-        csv_filepath = "/tmp/" + csv_filename
-
-        if export_type == "latex":
-            logger.info("Exporting data as LaTeX.")
-            latex_table = global_summary_table.to_latex(
-                index=False, header=True, caption="Survey Analysis Results"
+        state = user_state()
+        logger.debug(f"Export type: {export_type}")
+
+        if export_type in SUMMARY_FORMATS:
+            if state.global_summary_table is None:
+                raise ValueError("There are no analysis results to export yet.")
+            mimetype, extension = SUMMARY_FORMATS[export_type]
+            logger.info(f"Exporting summary table as {export_type}.")
+            body = export_summary(state.global_summary_table, export_type)
+        elif export_type in PARTICIPANT_FORMATS:
+            surveys = [s for s in (state.survey_1, state.survey_2) if s.results]
+            if not surveys:
+                raise ValueError("There are no survey data to export yet.")
+            mimetype, extension = PARTICIPANT_FORMATS[export_type]
+            logger.info(f"Streaming participant answers as {export_type}.")
+            stream = (
+                stream_long_csv
+                if export_type == "participants_csv"
+                else stream_long_parquet
             )
+            body = stream_with_context(stream(surveys))
+        else:
+            logger.warning("Invalid file type specified for export.")
+            raise ValueError("Invalid filetype for export")
 
-            with open(latex_filepath, "w", encoding="utf-8") as f:
-                f.write(latex_table)
-            logger.info("LaTeX file created successfully.")
-            return send_file(latex_filepath, as_attachment=True)
-
-        elif export_type == "csv":
-            logger.info("Exporting data as CSV.")
-            global_summary_table.to_csv(csv_filepath, index=False)
-            logger.info("CSV file created successfully.")
-            return send_file(csv_filepath, as_attachment=True)
-
-        logger.warning("Invalid file type specified for export.")
-        raise ValueError("Invalid filetype for export")
+        filename = secure_filename(
+            request.form.get(f"{export_type}_filename") or EXPORT_FILENAMES[export_type]
+        )
+        if not filename.endswith(extension):
+            filename += extension
+        return Response(
+            body,
+            mimetype=mimetype,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
 
     except ValueError as e:
         logger.warning(f"Value Error during data export: {e}")
         return render_template(
             "error.html", error_message=f"Failed to export data: {str(e)}"
         )
-    except FileNotFoundError:
-        logger.error("File not found during export.")
-        return render_template("error.html", error_message="File not found.")
     except Exception as e:
         logger.error(
             f"An unexpected error occurred during data export: {e}", exc_info=True
@@ -428,20 +850,19 @@ def export_data():
 # -----------------------------------------------------------------------------------------
 # Data
 @routemanager.route("/data")
+@conditional_page()
 def data():
     logger.info("Entered data function.")
     try:
-        logger.info("Fetching survey question maps.")
-        survey1_questions_map = survey_1_in_memory.get_question_text_by_id()
-        survey2_questions_map = survey_2_in_memory.get_question_text_by_id()
-
+        state = user_state()
+        # Participants and their answers are loaded page by page from the
+        # participant routes below, so the page size does not grow with the data.
         logger.info("Rendering data page.")
         return render_template(
             "data.html",
-            survey1=survey_1_in_memory,
-            survey2=survey_2_in_memory,
-            survey1_questions_map=survey1_questions_map,
-            survey2_questions_map=survey2_questions_map,
+            survey1=state.survey_1,
+            survey2=state.survey_2,
+            per_page=PARTICIPANTS_PER_PAGE,
         )
     except Exception as e:
         logger.error(
@@ -452,25 +873,75 @@ def data():
         )
 
 
+def survey_by_number(state: UserState, number: int) -> Optional[Survey]:
+    """Returns survey 1 or 2 of a state, or None for any other number."""
+    return {1: state.survey_1, 2: state.survey_2}.get(number)
+
+
+# -----------------------------------------------------------------------------------------
+@routemanager.route("/data/<int:number>/participants", methods=["GET"])
+@conditional_page()
+def list_participants(number: int):
+    """
+    Returns one page of the participants of survey 1 or 2 as JSON.
+    Search text, sort key, order, page and page size are taken from the query string.
+    """
+    survey = survey_by_number(user_state(), number)
+    if survey is None:
+        return {"error": "Survey not found."}, 404
+
+    search = request.args.get("q", "").strip()
+    sort = request.args.get("sort", "participant")
+    if sort not in PARTICIPANT_SORT_KEYS:
+        sort = "participant"
+    order = "desc" if request.args.get("order") == "desc" else "asc"
+    page = request.args.get("page", 1, type=int) or 1
+    per_page = request.args.get("per_page", PARTICIPANTS_PER_PAGE, type=int)
+    per_page = min(max(per_page or PARTICIPANTS_PER_PAGE, 1), MAX_PARTICIPANTS_PER_PAGE)
+
+    participants, total = query_participants(
+        survey,
+        search=search,
+        sort=sort,
+        descending=order == "desc",
+        page=page,
+        per_page=per_page,
+    )
+    return {
+        "survey_id": survey.survey_id,
+        "participants": participants,
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "page_count": max((total + per_page - 1) // per_page, 1),
+        "search": search,
+        "sort": sort,
+        "order": order,
+    }
+
+
+# -----------------------------------------------------------------------------------------
+@routemanager.route("/data/<int:number>/participants/<key>", methods=["GET"])
+@conditional_page()
+def participant_detail(number: int, key: str):
+    """Returns the ID and answers of one participant of survey 1 or 2 as JSON."""
+    survey = survey_by_number(user_state(), number)
+    participant = participant_answers(survey, key) if survey else None
+    if participant is None:
+        return {"error": "Participant not found."}, 404
+    return participant
+
+
 # -----------------------------------------------------------------------------------------
 # Graphs
 @routemanager.route("/graphs")
+@conditional_page(extra=lambda state: list_chart_files(state))
 def graphs():
     logger.info("Entered graphs function.")
     try:
         logger.info("Fetching chart files.")
-        charts_folder = image_path + os.path.splitext(current_session_name)[0] + "/"
-
-        if os.path.exists(charts_folder):
-            chart_files = [
-                f"images/{os.path.splitext(current_session_name)[0]}/{f}"
-                for f in os.listdir(charts_folder)
-                if f.endswith(".jpg") or f.endswith(".png")
-            ]
-            logger.debug(f"Found chart files: {chart_files}")
-        else:
-            logger.warning("Charts folder does not exist.")
-            chart_files = []
+        chart_files = list_chart_files(user_state())
+        logger.debug(f"Found chart files: {chart_files}")
 
         logger.info("Rendering graphs page.")
         return render_template("graphs.html", chart_files=chart_files)
@@ -484,34 +955,127 @@ def graphs():
         )
 
 
+# -----------------------------------------------------------------------------------------
+def current_charts_folder(state: UserState):
+    """Returns the chart store prefix of the current session, e.g. "<date>_<ids>/"."""
+    return charts_folder_of(state.current_session_name or "")
+
+
+# -----------------------------------------------------------------------------------------
+def list_chart_files(state: UserState):
+    """
+    Returns the charts of the current session as dicts with the file name and its URL.
+    Planned charts are listed even if they have not been rendered yet.
+    """
+    charts_folder = current_charts_folder(state)
+
+    if chart_renderer.has_plan(charts_folder):
+        filenames = chart_renderer.chart_names(charts_folder)
+    elif charts_folder != "/":
+        filenames = [
+            f
+            for f in chart_store.list(charts_folder)
+            if f.endswith(CHART_IMAGE_EXTENSIONS)
+        ]
+    else:
+        logger.warning("Charts folder does not exist.")
+        filenames = []
+
+    # Unchanged charts keep their URL across re-plans, so browsers keep their copy.
+    version = chart_renderer.version(charts_folder)
+    return [
+        {
+            "filename": filename,
+            "url": url_for(
+                "routemanager.chart_image",
+                session_stem=charts_folder.rstrip("/"),
+                filename=filename,
+                v=chart_renderer.fingerprint(charts_folder, filename)[:16] or version,
+            ),
+        }
+        for filename in filenames
+    ]
+
+
+# -----------------------------------------------------------------------------------------
+def open_chart(charts_folder: str, filename: str):
+    """
+    Renders a chart if necessary and returns its store key and an open stream.
+    The in-memory store may evict a chart between rendering and reading it, in
+    which case it is rendered once more.
+    """
+    for attempt in range(2):
+        chart_key = chart_renderer.ensure_chart(charts_folder, filename)
+        try:
+            return chart_key, chart_store.open(chart_key)
+        except FileNotFoundError:
+            if attempt:
+                raise
+            logger.debug(f"Chart {chart_key} was evicted, rendering again.")
+
+
+# -----------------------------------------------------------------------------------------
+@routemanager.route("/charts/<session_stem>/<filename>")
+def chart_image(session_stem: str, filename: str):
+    """
+    Serves a chart image from the chart store, rendering it on first request.
+    Responses carry an ETag and Cache-Control header; the `v` query parameter
+    changes whenever a chart's fingerprint changes, so cached copies never go stale.
+    """
+    logger.info(f"Entered chart_image function for {session_stem}/{filename}")
+    if ".." in session_stem or ".." in filename:
+        logger.warning(f"Rejected chart path: {session_stem}/{filename}")
+        return "Chart not found.", 404
+
+    try:
+        return chart_response(session_stem + "/", filename)
+    except FileNotFoundError as e:
+        logger.warning(f"FileNotFoundError: {e}")
+        return "Chart not found.", 404
+    except Exception as e:
+        logger.error(f"Failed to render chart {filename}: {e}", exc_info=True)
+        return f"Failed to render chart: {str(e)}", 500
+
+
+def chart_response(charts_folder: str, filename: str) -> Response:
+    """
+    Returns a cacheable response with a chart image, rendering it if necessary.
+
+    Raises:
+        FileNotFoundError: If the folder has no such chart.
+    """
+    chart_key, chart_stream = open_chart(charts_folder, filename)
+    response = send_file(
+        chart_stream,
+        mimetype=mimetype_for(chart_key),
+        conditional=True,
+        etag=chart_store.etag(chart_key),
+        last_modified=chart_store.last_modified(chart_key),
+        max_age=CHART_CACHE_MAX_AGE,
+    )
+    response.cache_control.public = True
+    return response
+
+
 # -----------------------------------------------------------------------------------------
 @routemanager.route("/export/<filename>")
 def export_graph(filename: str):
     logger.info(f"Entered export_graph function for filename: {filename}")
     try:
-        charts_folder = image_path + os.path.splitext(current_session_name)[0] + "/"
-        image_file_path = charts_folder + filename
-        label_file_path = charts_folder + filename.split(".")[0] + "_labels.csv"
-
-        if not os.path.exists(image_file_path):
+        charts_folder = current_charts_folder(user_state())
+        if not (
+            chart_store.exists(charts_folder + filename)
+            or filename in chart_renderer.chart_names(charts_folder)
+        ):
             logger.error(f"File {filename} not found in the current session.")
             raise FileNotFoundError(
                 f"File {filename} not found in the current session."
             )
 
         logger.info(f"Preparing files for export: {filename}")
-        file_paths = [(image_file_path, filename)]
-
-        if os.path.exists(label_file_path):
-            file_paths.append((label_file_path, f"{filename.split('.')[0]}_labels.csv"))
-
-        zip_buffer = create_zip(file_paths)
-        logger.info("ZIP file created successfully.")
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=f"{filename.split('.')[0]}.zip",
-            mimetype="application/zip",
+        return create_zip(
+            chart_entries(charts_folder, [filename]),
+            f"{filename.split('.')[0]}.zip",
         )
 
     except FileNotFoundError as e:
@@ -534,27 +1098,12 @@ def export_graph(filename: str):
 def export_all_graphs():
     logger.info("Entered export_all_graphs function.")
     try:
-        charts_folder = image_path + os.path.splitext(current_session_name)[0] + "/"
-
-        file_paths = []
-        for filename in os.listdir(charts_folder):
-            if filename.endswith(".jpg"):
-                img_path = charts_folder + filename
-                file_paths.append((img_path, filename))
-
-                label_filename = f"{filename.split('.')[0]}_labels.csv"
-                label_path = charts_folder + label_filename
-                if os.path.exists(label_path):
-                    file_paths.append((label_path, label_filename))
-
-        zip_buffer = create_zip(file_paths)
-        logger.info("All graphs exported successfully.")
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name="all_charts.zip",
-            mimetype="application/zip",
-        )
+        state = user_state()
+        charts_folder = current_charts_folder(state)
+        filenames = [chart["filename"] for chart in list_chart_files(state)]
+
+        logger.info(f"Streaming {len(filenames)} graphs for export.")
+        return create_zip(chart_entries(charts_folder, filenames), "all_charts.zip")
     except Exception as e:
         logger.error(f"Failed to export all graphs: {e}", exc_info=True)
         return render_template(
@@ -563,53 +1112,116 @@ def export_all_graphs():
 
 
 # -----------------------------------------------------------------------------------------
-def create_zip(file_paths: List):
+def chart_entries(charts_folder: str, filenames: List[str]):
+    """
+    Yields (archive name, stream) for every chart and its labels CSV.
+
+    Each chart is rendered (if needed) and opened right before it is yielded, so only
+    one chart is in flight at a time, even with the in-memory chart store.
+    """
+    for filename in filenames:
+        _, chart_stream = open_chart(charts_folder, filename)
+        yield filename, chart_stream
+
+        label_filename = f"{filename.split('.')[0]}_labels.csv"
+        try:
+            yield label_filename, chart_store.open(charts_folder + label_filename)
+        except FileNotFoundError:
+            logger.debug(f"No labels for {filename}.")
+
+
+# -----------------------------------------------------------------------------------------
+def create_zip(entries, download_name: str):
+    """
+    Returns a response that streams a ZIP archive of (archive name, stream) entries
+    while they are read, instead of building the whole archive in memory first.
+    """
     logger.info("Creating ZIP file.")
-    zip_buffer = io.BytesIO()
-    try:
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            for file_path, arcname in file_paths:
-                if os.path.exists(file_path):
-                    logger.debug(f"Adding {arcname} to ZIP.")
-                    zip_file.write(file_path, arcname=arcname)
-    except Exception as e:
-        logger.error(f"Error while creating ZIP: {e}", exc_info=True)
-        raise
-    zip_buffer.seek(0)
-    logger.info("ZIP file created successfully.")
-    return zip_buffer
+
+    def generate():
+        try:
+            yield from stream_zip(entries)
+            logger.info("ZIP file created successfully.")
+        except Exception as e:
+            # Headers are already sent, so the client just sees a truncated download.
+            logger.error(f"Error while creating ZIP: {e}", exc_info=True)
+            raise
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{download_name}"'},
+    )
 
 
 # -----------------------------------------------------------------------------------------
-def generate_charts_based_on_analysis():
+def generate_charts_based_on_analysis(state: UserState, reuse_charts: bool = False):
+    """
+    Registers a new chart plan for the current session.
+    The charts themselves are rendered lazily when they are first requested.
+
+    Parameters:
+        state (UserState): State whose surveys and results are charted.
+        reuse_charts (bool): Keep stored charts whose fingerprint matches the new
+            plan and render only missing or stale charts in the background, instead
+            of clearing the charts folder.
+
+    Returns:
+        int: Number of planned charts.
+    """
     logger.info("Generating charts based on analysis.")
-    charts_folder = image_path + os.path.splitext(current_session_name)[0] + "/"
+    charts_folder = current_charts_folder(state)
 
-    if os.path.exists(charts_folder):
+    if not reuse_charts:
         logger.info("Clearing existing images in the charts folder.")
-        for file_name in os.listdir(charts_folder):
-            file_path = charts_folder + file_name
-            if (
-                file_name.endswith(".jpg")
-                or file_name.endswith(".png")
-                or file_name.endswith(".csv")
-            ):
-                os.remove(file_path)
-
-    theme_colors = selected_theme or next(
-        (theme for theme in available_themes if theme.name == "default"), None
-    )
+        chart_store.delete_prefix(
+            charts_folder, extensions=CHART_IMAGE_EXTENSIONS + (".csv",)
+        )
 
     chart_builder = ChartBuilder(
-        survey_1_in_memory, survey_2_in_memory, charts_folder, color_scheme=theme_colors
+        state.survey_1,
+        state.survey_2,
+        charts_folder,
+        color_scheme=theme_for(state),
+        questions_per_page=get_setting("chart_questions_per_page", QUESTIONS_PER_PAGE),
+        chart_store=chart_store,
+        chart_format=CHART_FORMAT,
+        dpi=CHART_DPI,
     )
 
-    # Load user-defined keywords
-    user_keywords = KeywordManager.load_keywords()
-    logger.debug(f"Using keywords for chart generation: {user_keywords}")
+    # Load user-defined keywords, compiled into a matcher once per keyword change
+    keyword_matcher = KeywordManager.load_matcher()
+    logger.debug(f"Using keywords for chart generation: {keyword_matcher.keywords}")
 
-    chart_builder.generate_charts(global_summary_table, keywords=user_keywords)
-    logger.info("Charts generated successfully.")
+    specs = chart_builder.plan_charts(
+        state.global_summary_table, keywords=keyword_matcher
+    )
+    chart_renderer.register(chart_builder, specs, reuse=reuse_charts)
+    logger.info("Charts planned successfully.")
+    return len(specs)
+
+
+# -----------------------------------------------------------------------------------------
+def replan_charts(charts_folder: str) -> bool:
+    """
+    Plans the charts of the requesting browser's session again, e.g. after another
+    worker process re-planned them or this one has not planned them yet.
+
+    Returns:
+        bool: True if the charts folder belongs to the session and was planned.
+    """
+    if not has_request_context():
+        return False
+    state = user_state()
+    if (
+        current_charts_folder(state) != charts_folder
+        or state.survey_1 is None
+        or state.global_summary_table is None
+    ):
+        return False
+    logger.info(f"Planning charts of {charts_folder} in this worker.")
+    generate_charts_based_on_analysis(state, reuse_charts=True)
+    return True
 
 
 # -----------------------------------------------------------------------------------------
@@ -621,17 +1233,11 @@ def regenerate_graphs():
     """
     logger.info("Entered regenerate_graphs function.")
     try:
-        generate_charts_based_on_analysis()
-        charts_folder = image_path + os.path.splitext(current_session_name)[0] + "/"
+        state = user_state()
+        generate_charts_based_on_analysis(state)
 
         # Fetch updated list of chart files
-        chart_files = []
-        if os.path.exists(charts_folder):
-            chart_files = [
-                f"images/{os.path.splitext(current_session_name)[0]}/{f}"
-                for f in os.listdir(charts_folder)
-                if f.endswith(".jpg") or f.endswith(".png")
-            ]
+        chart_files = list_chart_files(state)
 
         logger.info("Graphs regenerated successfully.")
         return render_template(
@@ -652,22 +1258,174 @@ def regenerate_graphs():
 @routemanager.route("/list_sessions", methods=["GET"])
 def list_sessions():
     logger.info("Entered list_sessions function.")
+    return render_session_list(message=request.args.get("message"))
+
+
+# -----------------------------------------------------------------------------------------
+def render_session_list(message: str = None, error_message: str = None):
+    """
+    Renders one page of the session list from the session catalog.
+    Search text, sort column, order and page are taken from the query string.
+    """
+    search = request.args.get("q", "").strip()
+    sort = request.args.get("sort", "updated")
+    if sort not in SORT_COLUMNS:
+        sort = "updated"
+    order = "asc" if request.args.get("order") == "asc" else "desc"
+    page = request.args.get("page", 1, type=int) or 1
+
     try:
-        sessions = [f for f in os.listdir(sessions_path) if f.endswith(".pkl")]
-        logger.debug(f"Found sessions: {sessions}")
-        return render_template(
-            "list_sessions.html",
-            sessions=sessions,
-            current_session_name=current_session_name,
+        sessions, total = session_catalog.query(
+            search=search,
+            sort=sort,
+            descending=order == "desc",
+            page=page,
+            per_page=SESSIONS_PER_PAGE,
         )
+        logger.debug(f"Listing {len(sessions)} of {total} sessions (page {page}).")
     except Exception as e:
         logger.error(f"Failed to list sessions: {e}", exc_info=True)
-        return render_template(
-            "list_sessions.html",
-            sessions=[],
-            error_message=f"Failed to list sessions: {str(e)}",
-            current_session_name=current_session_name,
+        sessions, total = [], 0
+        error_message = error_message or f"Failed to list sessions: {str(e)}"
+
+    return render_template(
+        "list_sessions.html",
+        sessions=sessions,
+        total_sessions=total,
+        page=page,
+        page_count=max((total + SESSIONS_PER_PAGE - 1) // SESSIONS_PER_PAGE, 1),
+        search=search,
+        sort=sort,
+        order=order,
+        message=message,
+        error_message=error_message,
+        current_session_name=user_state().current_session_name,
+    )
+
+
+def session_path_of(session_name: str) -> str:
+    """
+    Returns the path of a stored session.
+
+    Raises:
+        ValueError: If the name is not that of a session in the sessions folder,
+            e.g. ".." or a path.
+    """
+    if (
+        not session_name
+        or session_name != os.path.basename(session_name)
+        or not session_name.endswith((SESSION_SUFFIX, LEGACY_SUFFIX))
+    ):
+        raise ValueError(f"Invalid session name '{session_name}'.")
+    session_path = sessions_path + session_name
+    if os.path.dirname(os.path.realpath(session_path)) != os.path.realpath(
+        sessions_path
+    ):
+        raise ValueError(f"Invalid session name '{session_name}'.")
+    return session_path
+
+
+def catalog_session(session_name: str):
+    """Updates the catalog entry of a session from its manifest."""
+    session_path = session_path_of(session_name)
+    try:
+        manifest = (
+            None
+            if session_name.endswith(LEGACY_SUFFIX)
+            else load_session_metadata(session_path)
+        )
+        session_catalog.upsert(session_name, manifest, directory_size(session_path))
+    except Exception as e:
+        logger.error(f"Failed to catalog session {session_name}: {e}", exc_info=True)
+
+
+def sync_session_catalog():
+    """Adds sessions missing from the catalog and removes deleted ones."""
+    try:
+        session_catalog.sync(
+            list_session_names(sessions_path),
+            lambda path: (
+                None if path.endswith(LEGACY_SUFFIX) else load_session_metadata(path)
+            ),
+            sessions_path,
         )
+    except Exception as e:
+        logger.error(f"Failed to sync session catalog: {e}", exc_info=True)
+
+
+# Pick up sessions that were added or removed while the application was not running.
+sync_session_catalog()
+
+
+def remove_session_files(session_name: str) -> int:
+    """
+    Removes a session together with its charts, chart plan, pending writes and
+    catalog entry.
+
+    Returns:
+        int: Number of bytes freed on disk and in the chart store.
+
+    Raises:
+        ValueError: If the session name is invalid.
+    """
+    session_path = session_path_of(session_name)
+    session_writer.discard(session_path)
+    reclaimed = 0
+    if os.path.exists(session_path):
+        logger.debug(f"Deleting session at path: {session_path}")
+        reclaimed += directory_size(session_path)
+        if os.path.isdir(session_path):
+            shutil.rmtree(session_path)
+        else:
+            os.remove(session_path)
+    charts_folder = charts_folder_of(session_name)
+    chart_renderer.discard(charts_folder)
+    reclaimed += chart_store.delete_prefix(charts_folder)
+    session_catalog.delete(session_name)
+    return reclaimed
+
+
+retention_settings = get_setting("session_retention", {})
+session_retention = SessionRetention(
+    session_catalog,
+    chart_store,
+    remove_session=remove_session_files,
+    protected_sessions=lambda: state_store.session_names()
+    + [api_session_name(job_id) for job_id in job_queue.job_ids(API_JOB_OWNER)],
+    on_charts_removed=chart_renderer.discard,
+    max_age_days=retention_settings.get("max_age_days", 0),
+    max_bytes=retention_settings.get("max_bytes", 0),
+    interval=retention_settings.get("sweep_interval_seconds", 3600),
+)
+
+
+def start_background_tasks():
+    """
+    Starts the session writer and the retention sweeps of this process.
+
+    Threads do not survive a fork, so a server that loads the application before
+    forking its workers calls this in every worker.
+    """
+    session_writer.start()
+    session_retention.start()
+
+
+def stop_background_tasks():
+    """Stops the retention sweeps and writes all queued sessions."""
+    session_retention.stop()
+    session_writer.close()
+
+
+def preload_shared_state():
+    """
+    Loads the sentence encoder, or the client of the embedding service if it is
+    enabled, and the keyword matcher of this process.
+
+    Color schemes and settings are loaded when this module is imported. Worker
+    processes forked afterwards share all of it instead of loading their own copy.
+    """
+    get_encoder()
+    KeywordManager.load_matcher()
 
 
 # -----------------------------------------------------------------------------------------
@@ -675,83 +1433,80 @@ def list_sessions():
 def load_session_by_name(session_name: str):
     logger.info(f"Entered load_session_by_name function for session: {session_name}")
     try:
-        global survey_1_in_memory, survey_2_in_memory, global_summary_table, global_results, selected_theme, current_session_name, alpha, test_method, isNormalized
-        
-        session_path = sessions_path + session_name
+        session_path = session_path_of(session_name)
+    except ValueError as e:
+        logger.warning(f"Rejected session name: {e}")
+        return render_session_list(error_message=str(e)), 400
+    try:
+        session_writer.flush(session_path)
+        if session_name.endswith(LEGACY_SUFFIX) and os.path.exists(session_path):
+            logger.info(f"Converting pickle session {session_name}.")
+            session_path = convert_pickle_session(
+                session_path, remove_original=True, compression=SESSION_COMPRESSION
+            )
+            session_catalog.delete(session_name)
+            session_name = os.path.basename(session_path)
+            catalog_session(session_name)
         logger.info(f"Loading session from: {session_path}")
-        state = load_session_state(session_path)
-
-        survey_1_in_memory = state["survey_1"]
-        survey_2_in_memory = state["survey_2"]
-        global_summary_table = state["global_summary_table"]
-        global_results = state.get("global_results", {})
-        current_session_name = session_name
-        isNormalized = state["isNormalized"]
-
-        theme_name = state.get("selected_theme_name")
-        selected_theme = next(
-            (theme for theme in available_themes if theme.name == theme_name),
-            selected_theme,
-        )
-        alpha = state.get("alpha", DEFAULT_ALPHA)
-        test_method = state.get("test_method", DEFAULT_TEST_METHOD)
-
-        logger.info("Regenerating charts for the loaded session.")
-        generate_charts_based_on_analysis()
+        loaded = load_session_state(session_path)
+        session_catalog.touch(session_name)
+
+        state = user_state()
+        state.survey_1 = loaded["survey_1"]
+        state.survey_2 = loaded["survey_2"]
+        state.global_summary_table = loaded["global_summary_table"]
+        state.global_results = loaded.get("global_results", {})
+        state.current_session_name = session_name
+        state.isNormalized = loaded["isNormalized"]
+
+        theme_name = loaded.get("selected_theme_name")
+        if any(theme.name == theme_name for theme in available_themes):
+            state.theme_name = theme_name
+        state.alpha = loaded.get("alpha", DEFAULT_ALPHA)
+        state.test_method = loaded.get("test_method", DEFAULT_TEST_METHOD)
+
+        logger.info("Planning charts for the loaded session, reusing stored charts.")
+        generate_charts_based_on_analysis(state, reuse_charts=True)
+        save_user_state(state)
 
         logger.info(f"Session {session_name} loaded successfully.")
-        return render_template(
-            "list_sessions.html",
-            sessions=os.listdir(sessions_path),
-            message=f"Session {session_name} loaded successfully!",
-            current_session_name=current_session_name,
+        return render_session_list(
+            message=f"Session {session_name} loaded successfully!"
         )
     except FileNotFoundError as e:
         logger.warning(f"FileNotFoundError: {e}")
-        return render_template(
-            "list_sessions.html",
-            sessions=os.listdir(sessions_path),
-            error_message=f"Error: {str(e)}",
-            current_session_name=current_session_name,
-        )
+        return render_session_list(error_message=f"Error: {str(e)}")
     except Exception as e:
         logger.error(f"Failed to load session: {e}", exc_info=True)
-        return render_template(
-            "list_sessions.html",
-            sessions=os.listdir(sessions_path),
-            error_message=f"Failed to load session: {str(e)}",
-            current_session_name=current_session_name,
-        )
+        return render_session_list(error_message=f"Failed to load session: {str(e)}")
 
 
 # -----------------------------------------------------------------------------------------
-def save_session():
+def save_session(state: UserState):
     logger.info("Entered save_session function.")
     try:
-        state = {
-            "survey_1": survey_1_in_memory,
-            "survey_2": survey_2_in_memory,
+        session_state = {
+            "survey_1": state.survey_1,
+            "survey_2": state.survey_2,
             "global_summary_table": (
-                global_summary_table
-                if global_summary_table is not None
+                state.global_summary_table
+                if state.global_summary_table is not None
                 else pd.DataFrame()
             ),
-            "global_results": global_results if global_results else {},
-            "selected_theme_name": (
-                selected_theme.name if selected_theme is not None else "default"
-            ),
-            "alpha": alpha if alpha is not None else DEFAULT_ALPHA,
-            "test_method": test_method
-            if test_method is not None
+            "global_results": state.global_results if state.global_results else {},
+            "selected_theme_name": state.theme_name or DEFAULT_THEME,
+            "alpha": state.alpha if state.alpha is not None else DEFAULT_ALPHA,
+            "test_method": state.test_method
+            if state.test_method is not None
             else DEFAULT_TEST_METHOD,
-            "isNormalized": isNormalized
+            "isNormalized": state.isNormalized,
         }
 
-        save_path = sessions_path + current_session_name
+        save_path = session_path_of(state.current_session_name)
 
-        logger.debug(f"Saving session to path: {save_path}")
-        save_session_state(state, save_path)
-        logger.info("Session saved successfully.")
+        logger.debug(f"Queueing session save to path: {save_path}")
+        session_writer.save(save_path, session_state, SESSION_COMPRESSION)
+        logger.info("Session queued for saving.")
     except Exception as e:
         logger.error(f"Failed to save session: {e}", exc_info=True)
         return render_template(
@@ -761,36 +1516,50 @@ def save_session():
 
 # -----------------------------------------------------------------------------------------
 @routemanager.route("/update_session", methods=["POST"])
-def update_session():
+def update_session(
+    include_surveys: bool = False,
+    include_summary: bool = False,
+    state: UserState = None,
+):
+    """
+    Records the current settings in the active session as a small delta record.
+
+    Parameters:
+        include_surveys (bool): Also store the surveys, e.g. after a re-upload.
+        include_summary (bool): Also store the summary table, e.g. after a re-analysis.
+        state (UserState): State to record; the requesting browser's by default.
+    """
     logger.info("Entered update_session function.")
     try:
-        session_path = sessions_path + current_session_name
-
-        if os.path.exists(session_path):
-            logger.debug(f"Loading existing session from path: {session_path}")
-            state = load_session_state(session_path)
-        else:
+        state = state or user_state()
+        try:
+            session_path = session_path_of(state.current_session_name)
+        except ValueError:
+            session_path = None
+
+        if session_path is None or not (
+            os.path.exists(session_path) or session_writer.is_pending(session_path)
+        ):
             logger.error("No active session found. Please start a new session.")
             raise ValueError("No active session found. Please start a new session.")
 
-        if survey_1_in_memory is not None:
-            state["survey_1"] = survey_1_in_memory
-        if survey_2_in_memory is not None:
-            state["survey_2"] = survey_2_in_memory
-        if global_summary_table is not None:
-            state["global_summary_table"] = global_summary_table
-        if selected_theme is not None:
-            state["selected_theme_name"] = selected_theme.name
-        if alpha is not None:
-            state["alpha"] = alpha
-        if test_method is not None:
-            state["test_method"] = test_method
-            
-        state["isNormalized"] = isNormalized
-
-        logger.debug("Updating session state.")
-        save_session_state(state, session_path)
-        logger.info("Session updated successfully.")
+        changes = {"isNormalized": state.isNormalized}
+        if include_surveys and state.survey_1 is not None:
+            changes["survey_1"] = state.survey_1
+        if include_surveys and state.survey_2 is not None:
+            changes["survey_2"] = state.survey_2
+        if include_summary and state.global_summary_table is not None:
+            changes["global_summary_table"] = state.global_summary_table
+        if state.theme_name:
+            changes["selected_theme_name"] = state.theme_name
+        if state.alpha is not None:
+            changes["alpha"] = state.alpha
+        if state.test_method is not None:
+            changes["test_method"] = state.test_method
+
+        logger.debug("Queueing session update.")
+        session_writer.update(session_path, changes, SESSION_COMPRESSION)
+        logger.info("Session update queued.")
     except Exception as e:
         logger.error(f"Failed to update session: {e}", exc_info=True)
         return render_template(
@@ -798,23 +1567,137 @@ def update_session():
         )
 
 
+# -----------------------------------------------------------------------------------------
+@routemanager.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id: str):
+    """Reports the status and stages of a job submitted by this browser."""
+    record = job_queue.get(job_id, owner=request.cookies.get(SESSION_COOKIE, ""))
+    if record is None:
+        return {"error": "Job not found."}, 404
+    return record
+
+
+# An event stream ends after this many seconds; browsers reconnect and resume after
+# the last event they received, so a stream never holds a server thread for good.
+EVENT_STREAM_SECONDS = 300
+
+
+# -----------------------------------------------------------------------------------------
+@routemanager.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id: str):
+    """
+    Streams the events of a job submitted by this browser as server-sent events.
+
+    Every stage and step sends a started and a finished event with its duration
+    and counts; the stream ends with a "job_finished" event carrying the job
+    record. Reconnecting clients resume after the `Last-Event-ID` they received;
+    streams are closed after EVENT_STREAM_SECONDS and are then resumed that way.
+    """
+    if job_queue.get(job_id, owner=request.cookies.get(SESSION_COOKIE, "")) is None:
+        return {"error": "Job not found."}, 404
+    try:
+        last_seq = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_seq = 0
+
+    def generate(last_seq: int):
+        # Tells clients how long to wait before reconnecting, in milliseconds.
+        yield "retry: 2000\n\n"
+        stream_deadline = time.monotonic() + EVENT_STREAM_SECONDS
+        while True:
+            events = job_queue.wait_for_events(job_id, last_seq, timeout=15)
+            if not events:
+                # Fails the job if the worker running it is gone.
+                job_queue.fail_orphaned_jobs(job_id)
+                record = job_queue.get(job_id)
+                if record is None:
+                    return
+                if record["status"] in FINISHED_STATUSES:
+                    # The job ended without reporting it, e.g. its worker stopped.
+                    events = [
+                        {"seq": last_seq + 1, "type": "job_finished", "record": record}
+                    ]
+                elif time.monotonic() > stream_deadline:
+                    return
+                else:
+                    # Keeps proxies from closing an idle connection.
+                    yield ": keep-alive\n\n"
+                    continue
+            for event in events:
+                last_seq = event["seq"]
+                yield (
+                    f"id: {event['seq']}\nevent: {event['type']}\n"
+                    f"data: {json.dumps(event, default=str)}\n\n"
+                )
+                if event["type"] == "job_finished":
+                    return
+
+    return Response(
+        stream_with_context(generate(last_seq)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# -----------------------------------------------------------------------------------------
+@routemanager.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id: str):
+    """Requests cancellation of a job submitted by this browser."""
+    logger.info(f"Entered cancel_job function for job: {job_id}")
+    owner = request.cookies.get(SESSION_COOKIE, "")
+    if not job_queue.cancel(job_id, owner=owner):
+        return {"success": False, "error": "No running job to cancel."}, 404
+    return {"success": True, "message": "The job will stop after its current step."}
+
+
+# -----------------------------------------------------------------------------------------
+@routemanager.route("/pending_writes", methods=["GET"])
+def pending_writes():
+    """Reports how many session writes are queued or running."""
+    return {
+        "pending": session_writer.pending_count(),
+        "written": session_writer.written,
+        "coalesced": session_writer.coalesced,
+        "failed": session_writer.failed,
+    }
+
+
+# -----------------------------------------------------------------------------------------
+@routemanager.route("/sweep_sessions", methods=["POST"])
+def sweep_sessions():
+    """Runs a retention sweep now and reports what it removed and reclaimed."""
+    logger.info("Entered sweep_sessions function.")
+    try:
+        return {"success": True, **session_retention.sweep()}
+    except Exception as e:
+        logger.error(f"Retention sweep failed: {e}", exc_info=True)
+        return {"success": False, "error": f"Retention sweep failed: {str(e)}"}
+
+
 # -----------------------------------------------------------------------------------------
 @routemanager.route("/delete_session/<session_name>", methods=["DELETE"])
 def delete_session(session_name: str):
     logger.info(f"Entered delete_session function for session: {session_name}")
     try:
-        session_path = sessions_path + session_name
-        if os.path.exists(session_path):
-            logger.debug(f"Deleting session at path: {session_path}")
-            os.remove(session_path)
-            logger.info(f"Session {session_name} deleted successfully.")
+        session_path = session_path_of(session_name)
+    except ValueError as e:
+        logger.warning(f"Rejected session name: {e}")
+        return {"success": False, "error": str(e)}, 400
+    try:
+        if os.path.exists(session_path) or session_writer.is_pending(session_path):
+            reclaimed = remove_session_files(session_name)
+            logger.info(
+                f"Session {session_name} deleted successfully, {reclaimed} bytes reclaimed."
+            )
             return {
                 "success": True,
                 "message": f"Session {session_name} deleted successfully!",
+                "reclaimed_bytes": reclaimed,
             }
         else:
             logger.warning(f"Session {session_name} not found.")
-            return {"success": False, "error": "Session not found."}
+            remove_session_files(session_name)
+            return {"success": False, "error": "Session not found."}, 404
     except Exception as e:
         logger.error(f"Failed to delete session: {e}", exc_info=True)
         return {"success": False, "error": f"Failed to delete session: {str(e)}"}
@@ -837,6 +1720,7 @@ def settings():
         logger.debug("Serialized available themes.")
 
         # Serialize the selected theme
+        selected_theme = theme_for(user_state())
         selected_theme_serializable = None
         if selected_theme:
             selected_theme_serializable = {
@@ -868,8 +1752,8 @@ def settings():
 @routemanager.route("/save_theme", methods=["POST"])
 def save_theme():
     logger.info("Entered save_theme function.")
-    global selected_theme
     try:
+        state = user_state()
         theme_name = request.form.get("theme")
         logger.debug(f"Requested theme to save: {theme_name}")
 
@@ -880,14 +1764,16 @@ def save_theme():
         if selected_theme:
             message = "Theme changed."
             logger.info(f"Theme changed to: {selected_theme.name}")
+            state.theme_name = selected_theme.name
+            save_user_state(state, include_data=False)
 
-            if global_summary_table is not None:
+            if state.global_summary_table is not None:
                 logger.info("Regenerating charts based on the new theme.")
-                generate_charts_based_on_analysis()
+                generate_charts_based_on_analysis(state)
 
-            if current_session_name:
+            if state.current_session_name:
                 logger.info("Saving theme to the current session.")
-                update_session()
+                update_session(state=state)
                 message = "Theme saved successfully."
         else:
             logger.warning("Failed to find the requested theme.")
@@ -1,40 +1,97 @@
 import json
 import os
+import threading
 from typing import List
 
+from src.utils.keyword_matcher import KeywordMatcher
+
 
 class KeywordManager:
     """
     Handles saving, loading, and modifying keywords for chart generation.
+
+    Keywords are kept in memory together with their compiled KeywordMatcher and are
+    only re-read when the modification time or size of the keyword file changes.
     """
 
     keyword_file = os.getcwd() + "/static/keywords.json"
 
+    _lock = threading.RLock()
+    _cache_key = None
+    _keywords: List[str] = []
+    _matcher: KeywordMatcher = None
+
+    @staticmethod
+    def _file_signature():
+        """Returns (mtime, size) of the keyword file, or None if it does not exist."""
+        try:
+            stat = os.stat(KeywordManager.keyword_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _refresh():
+        """Re-reads the keyword file if it changed since it was last cached."""
+        signature = KeywordManager._file_signature()
+        cache_key = (KeywordManager.keyword_file, signature)
+        if cache_key == KeywordManager._cache_key:
+            return
+
+        keywords = []
+        if signature is not None:
+            with open(KeywordManager.keyword_file, "r", encoding="utf-8") as f:
+                keywords = json.load(f)
+        KeywordManager._keywords = keywords
+        KeywordManager._matcher = None
+        KeywordManager._cache_key = cache_key
+
     @staticmethod
     def load_keywords():
         """Load keywords from a JSON file."""
-        if os.path.exists(KeywordManager.keyword_file):
-            with open(KeywordManager.keyword_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return []
+        with KeywordManager._lock:
+            KeywordManager._refresh()
+            return list(KeywordManager._keywords)
+
+    @staticmethod
+    def load_matcher() -> KeywordMatcher:
+        """Returns the compiled matcher for the stored keywords."""
+        with KeywordManager._lock:
+            KeywordManager._refresh()
+            if KeywordManager._matcher is None:
+                KeywordManager._matcher = KeywordMatcher(KeywordManager._keywords)
+            return KeywordManager._matcher
 
     @staticmethod
     def save_keywords(keywords: List[str]):
         """Save keywords to a JSON file."""
-        with open(KeywordManager.keyword_file, "w", encoding="utf-8") as f:
-            json.dump(keywords, f, indent=4)
+        with KeywordManager._lock:
+            # Write a temporary file and swap it in, so readers never see half a file.
+            temp_file = f"{KeywordManager.keyword_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(keywords, f, indent=4)
+            os.replace(temp_file, KeywordManager.keyword_file)
+
+            KeywordManager._keywords = list(keywords)
+            KeywordManager._matcher = None
+            KeywordManager._cache_key = (
+                KeywordManager.keyword_file,
+                KeywordManager._file_signature(),
+            )
 
     @staticmethod
     def add_keyword(keyword: List[str]):
         """Add a new keyword to the list."""
-        keywords = KeywordManager.load_keywords()
-        if keyword not in keywords:
-            keywords.append(keyword)
-            KeywordManager.save_keywords(keywords)
+        with KeywordManager._lock:
+            keywords = KeywordManager.load_keywords()
+            if keyword not in keywords:
+                keywords.append(keyword)
+                KeywordManager.save_keywords(keywords)
 
     @staticmethod
     def delete_keyword(keyword: List[str]):
         """Remove a keyword from the list."""
-        keywords = KeywordManager.load_keywords()
-        keywords = [k for k in keywords if k != keyword]
-        KeywordManager.save_keywords(keywords)
+        with KeywordManager._lock:
+            keywords = KeywordManager.load_keywords()
+            keywords = [k for k in keywords if k != keyword]
+            KeywordManager.save_keywords(keywords)
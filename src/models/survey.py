@@ -121,13 +121,11 @@ class Survey:
             pd.Series: The numeric data for the question, or an empty Series if no valid data is found.
         """
         logger.debug(f"Getting data for question_id: {question_id}")
-        answers = [
-            float(answer.answer)
-            for result in self.results
-            for answer in result.answers
-            if answer.question_id == question_id
-            and isinstance(answer.answer, (int, float))
-        ]
+        answers = []
+        for result in self.results:
+            answer = self._find_answer(result, question_id)
+            if answer is not None and isinstance(answer.answer, (int, float)):
+                answers.append(float(answer.answer))
 
         if answers:
             return pd.Series(answers, dtype=float)
@@ -135,6 +133,21 @@ class Survey:
             logger.warning(f"No data found for question_id={question_id}")
             return pd.Series(dtype=float)
 
+    @staticmethod
+    def _find_answer(result: Result, question_id: int):
+        """
+        Returns the answer of a result for a question, or None.
+
+        `populate_data` stores answers in question order, so the answer for question
+        N usually sits at position N - 1; other layouts fall back to a scan.
+        """
+        position = question_id - 1 if isinstance(question_id, int) else -1
+        if 0 <= position < len(result.answers):
+            answer = result.answers[position]
+            if answer.question_id == question_id:
+                return answer
+        return next((a for a in result.answers if a.question_id == question_id), None)
+
     def add_statistics(self, question_id, avg, sd):
         """Stores average and standard deviation for a specific question."""
         logger.debug(
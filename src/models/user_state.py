@@ -0,0 +1,86 @@
+import dataclasses
+from typing import Optional
+import pandas as pd
+from src.models.survey import Survey
+
+DEFAULT_ALPHA = 0.5
+DEFAULT_TEST_METHOD = "automatic"
+TEST_METHODS = ("automatic", "t-test", "wilcoxon")
+DEFAULT_THEME = "default"
+
+# Fields that are small enough to be stored on every change; the remaining
+# fields are only stored when the survey data or analysis results change.
+SETTINGS_FIELDS = (
+    "alpha",
+    "test_method",
+    "theme_name",
+    "isNormalized",
+    "current_session_name",
+    "modified_at",
+)
+
+
+def empty_survey() -> Survey:
+    """Returns the placeholder survey shown before any file was uploaded."""
+    return Survey(
+        survey_id=0,
+        group="",
+        survey_type="post",
+        questions=[],
+        results=[],
+        dataframe=pd.DataFrame(),
+    )
+
+
+@dataclasses.dataclass
+class UserState:
+    """
+    Working state of one browser session: the uploaded surveys, the analysis
+    results and the analysis settings.
+
+    Attributes:
+        survey_1 (Survey): First uploaded survey.
+        survey_2 (Survey): Second uploaded survey.
+        global_summary_table (pd.DataFrame): Summary of the hypothesis tests.
+        global_results (dict): Test results keyed by question.
+        isNormalized (str): Normalization applied by the last analysis.
+        alpha (float): Significance level.
+        test_method (str): Selected test method.
+        theme_name (str): Name of the selected color scheme.
+        current_session_name (str): Name of the saved session being worked on.
+        data_version (str): Changes whenever surveys or results change, so shared
+            stores know when their cached copy is stale.
+        modified_at (float): UNIX time the state was last stored; pages rendered
+            from the state are revalidated against it.
+    """
+
+    survey_1: Survey = dataclasses.field(default_factory=empty_survey)
+    survey_2: Survey = dataclasses.field(default_factory=empty_survey)
+    global_summary_table: Optional[pd.DataFrame] = None
+    global_results: dict = dataclasses.field(default_factory=dict)
+    isNormalized: str = "EMPTY"
+    alpha: float = DEFAULT_ALPHA
+    test_method: str = DEFAULT_TEST_METHOD
+    theme_name: str = DEFAULT_THEME
+    current_session_name: str = ""
+    data_version: str = ""
+    modified_at: float = 0.0
+
+    def settings(self) -> dict:
+        """Returns the small settings fields as a JSON-serializable dict."""
+        return {name: getattr(self, name) for name in SETTINGS_FIELDS}
+
+    def apply_settings(self, settings: dict):
+        """Overwrites the settings fields with stored values."""
+        for name in SETTINGS_FIELDS:
+            if name in settings:
+                setattr(self, name, settings[name])
+
+    def data(self) -> dict:
+        """Returns the survey data and analysis results."""
+        return {
+            "survey_1": self.survey_1,
+            "survey_2": self.survey_2,
+            "global_summary_table": self.global_summary_table,
+            "global_results": self.global_results,
+        }
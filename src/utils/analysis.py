@@ -1,8 +1,12 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import shapiro, ttest_ind, wilcoxon
 from loguru import logger
 
+from src.utils.lazy_import import LazyModule
+
+# scipy.stats takes about a second to import, so it is imported on the first test.
+stats = LazyModule("scipy.stats")
+
 AVG = "avg"
 SD = "sd"
 
@@ -67,15 +71,15 @@ class Analysis:
                     continue
 
                 # normalized?
-                p1, p2 = shapiro(data1)[1], shapiro(data2)[1]
+                p1, p2 = stats.shapiro(data1)[1], stats.shapiro(data2)[1]
                 if p1 > self.alpha and p2 > self.alpha:
                     isNormalized = True
-                    
+
                 # [1] -> to only get p-value from results
                 if test_method == "t-test":
                     test_type, p_value = (
                         "t-test",
-                        ttest_ind(data1, data2, equal_var=True)[1],
+                        stats.ttest_ind(data1, data2, equal_var=True)[1],
                     )
                 elif test_method == "wilcoxon":
                     min_len = min(
@@ -83,19 +87,21 @@ class Analysis:
                     )  # wilcoxon requires same length input
                     test_type, p_value = (
                         "Wilcoxon",
-                        wilcoxon(data1.iloc[:min_len], data2.iloc[:min_len])[1],
+                        stats.wilcoxon(data1.iloc[:min_len], data2.iloc[:min_len])[1],
                     )
                 else:
                     if isNormalized:
                         test_type, p_value = (
                             "t-test",
-                            ttest_ind(data1, data2, equal_var=True)[1],
+                            stats.ttest_ind(data1, data2, equal_var=True)[1],
                         )
                     else:
                         min_len = min(len(data1), len(data2))
                         test_type, p_value = (
                             "Wilcoxon",
-                            wilcoxon(data1.iloc[:min_len], data2.iloc[:min_len])[1],
+                            stats.wilcoxon(data1.iloc[:min_len], data2.iloc[:min_len])[
+                                1
+                            ],
                         )
 
                 results.append(
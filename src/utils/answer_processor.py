@@ -24,6 +24,8 @@ class AnswerProcessor:
     def process_answer(answer: str):
         """
         Standardizes an individual answer by:
+        - Returning NaN for missing answers (None, NaN, pd.NA, NaT), as an empty
+          cell of a CSV file is read.
         - Converting binary responses to numeric (1 or 0) using BINARY_MAPPING.
         - Extracting and converting the number from "number - text" formats.
         - Attempting conversion to a float; returns the original text if not possible.
@@ -35,6 +37,11 @@ class AnswerProcessor:
             int, float, or str: Processed answer in numeric form or original format if unchanged.
         """
         logger.debug(f"Processing answer: {answer}")
+        # Typed files hold None or pd.NA for missing answers, which must not
+        # become the text "None" or "<NA>"
+        if pd.api.types.is_scalar(answer) and pd.isna(answer):
+            return float("nan")
+
         # Standardize the answer to a string
         answer = str(answer).strip()
 
@@ -75,6 +82,11 @@ class AnswerProcessor:
         Processes all answers in a DataFrame, applying `process_answer` to each
         column except the participant ID.
 
+        Columns that already have a plain numeric or boolean type, as read from
+        Parquet, Arrow or Excel files, are converted as a whole; the result is the
+        same as processing them answer by answer. Nullable types (Int64, boolean,
+        ...) are processed answer by answer, as they may hold pd.NA.
+
         Parameters:
             df (pd.DataFrame): DataFrame containing survey responses.
 
@@ -85,6 +97,13 @@ class AnswerProcessor:
         processed_df = df.copy()
         for col in processed_df.columns[1:]:  # Skip participant ID
             logger.debug(f"Processing column: {col}")
-            processed_df[col] = processed_df[col].apply(AnswerProcessor.process_answer)
+            column = processed_df[col]
+            typed = not pd.api.types.is_extension_array_dtype(column)
+            if typed and pd.api.types.is_bool_dtype(column):
+                processed_df[col] = column.map({True: 1, False: 0})
+            elif typed and pd.api.types.is_numeric_dtype(column):
+                processed_df[col] = column.astype(float)
+            else:
+                processed_df[col] = column.apply(AnswerProcessor.process_answer)
         logger.info("DataFrame processing completed.")
         return processed_df
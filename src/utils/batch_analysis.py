@@ -0,0 +1,437 @@
+"""
+Analyzes many survey pairs from the command line on a pool of worker processes.
+
+Pairs come from a manifest CSV (columns name, survey1, survey2 and optionally
+survey1_id, survey2_id, group1, group2, type1, type2; paths relative to the
+manifest) or from a directory whose subdirectories each hold two survey files.
+Surveys can be CSV (plain, gzip or ZIP), Parquet, Arrow IPC or Excel files;
+Parquet and Arrow files are memory-mapped.
+Every pair gets a folder in the output directory with the summary table as CSV
+and LaTeX, the matched questions and the charts; `report.csv` lists the timings
+of all pairs.
+
+The sentence encoder is loaded once, by an embedding service in this process,
+and the workers encode through it, so all pairs share the encoder and its cache.
+
+Usage:
+    python -m src.utils.batch_analysis --manifest pairs.csv --output results/
+    python -m src.utils.batch_analysis --directory cohorts/ --workers 8
+"""
+
+import argparse
+import dataclasses
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from typing import List, Optional
+
+import pandas as pd
+from loguru import logger
+
+from src.models.user_state import DEFAULT_ALPHA, DEFAULT_TEST_METHOD, TEST_METHODS
+from src.utils.chart_store import CHART_FORMATS
+from src.utils.data_preparer import DEFAULT_MODEL, MATCH_THRESHOLD
+from src.utils.survey_readers import is_survey_file, read_survey_dataframe
+
+# Columns of the throughput report, one row per pair.
+REPORT_COLUMNS = [
+    "name",
+    "status",
+    "error",
+    "participants",
+    "questions",
+    "matched_questions",
+    "charts",
+    "load_seconds",
+    "match_seconds",
+    "test_seconds",
+    "chart_seconds",
+    "total_seconds",
+]
+
+
+@dataclasses.dataclass
+class SurveyPair:
+    """
+    Two survey files analyzed together.
+
+    Attributes:
+        name (str): Name of the pair; also the name of its output folder.
+        survey1 (str): Path of the first survey CSV.
+        survey2 (str): Path of the second survey CSV.
+        survey1_id (int): Survey ID of the first survey.
+        survey2_id (int): Survey ID of the second survey.
+        group1 (str): Group of the first survey.
+        group2 (str): Group of the second survey.
+        type1 (str): Type ("pre" or "post") of the first survey.
+        type2 (str): Type of the second survey.
+    """
+
+    name: str
+    survey1: str
+    survey2: str
+    survey1_id: int = 1
+    survey2_id: int = 2
+    group1: str = "A"
+    group2: str = "B"
+    type1: str = "post"
+    type2: str = "post"
+
+
+@dataclasses.dataclass
+class BatchOptions:
+    """
+    Settings applied to every pair of a batch.
+
+    Attributes:
+        output (str): Directory receiving one folder per pair.
+        alpha (float): Significance level.
+        test_method (str): One of TEST_METHODS.
+        threshold (float): Minimum similarity of matched questions.
+        charts (bool): Render the charts of every pair.
+        chart_format (str): Image format of the charts.
+        dpi (int): Resolution of raster charts.
+        theme (str): Name of the color scheme of the charts.
+    """
+
+    output: str
+    alpha: float = DEFAULT_ALPHA
+    test_method: str = DEFAULT_TEST_METHOD
+    threshold: float = MATCH_THRESHOLD
+    charts: bool = True
+    chart_format: str = "png"
+    dpi: int = 100
+    theme: str = "default"
+
+
+def pairs_from_manifest(path: str) -> List[SurveyPair]:
+    """Reads the survey pairs listed in a manifest CSV."""
+    manifest = pd.read_csv(path, dtype=str).fillna("")
+    missing = {"name", "survey1", "survey2"} - set(manifest.columns)
+    if missing:
+        raise ValueError(
+            f"The manifest lacks the columns {', '.join(sorted(missing))}."
+        )
+
+    base = os.path.dirname(os.path.abspath(path))
+    fields = {field.name: field for field in dataclasses.fields(SurveyPair)}
+    pairs = []
+    for row in manifest.to_dict(orient="records"):
+        values = {
+            key: value for key, value in row.items() if key in fields and value != ""
+        }
+        for key in ("survey1", "survey2"):
+            values[key] = os.path.join(base, values[key])
+        for key in ("survey1_id", "survey2_id"):
+            if key in values:
+                values[key] = int(values[key])
+        pairs.append(SurveyPair(**values))
+    return pairs
+
+
+def pairs_from_directory(path: str) -> List[SurveyPair]:
+    """
+    Returns a pair for every subdirectory holding exactly two survey files; the
+    first file in name order is survey 1.
+    """
+    pairs = []
+    for name in sorted(os.listdir(path)):
+        folder = os.path.join(path, name)
+        if not os.path.isdir(folder):
+            continue
+        files = sorted(f for f in os.listdir(folder) if is_survey_file(f))
+        if len(files) != 2:
+            logger.warning(
+                f"Skipping {folder}: expected 2 survey files, found {len(files)}."
+            )
+            continue
+        pairs.append(
+            SurveyPair(
+                name, os.path.join(folder, files[0]), os.path.join(folder, files[1])
+            )
+        )
+    return pairs
+
+
+def read_survey_file(path: str, survey_id: int, group: str, survey_type: str):
+    """Reads a survey file and processes its answers."""
+    from src.models.survey import Survey
+
+    df = read_survey_dataframe(path)
+    if df.empty:
+        raise ValueError(f"{path} is empty.")
+    survey = Survey(
+        survey_id=survey_id,
+        group=group,
+        survey_type=survey_type,
+        dataframe=df,
+        questions=[],
+        results=[],
+    )
+    survey.populate_data()
+    return survey
+
+
+def init_worker(socket_path: Optional[str], model_name: str, timeout: float):
+    """Makes a worker process encode through the batch's embedding service."""
+    if socket_path:
+        from src.utils.data_preparer import use_embedding_service
+
+        use_embedding_service(socket_path, model_name, timeout=timeout)
+
+
+def analyze_pair(pair: SurveyPair, options: BatchOptions) -> dict:
+    """
+    Analyzes one survey pair and writes its results to `<output>/<name>/`.
+
+    Returns:
+        dict: A row of the throughput report.
+    """
+    from src.models.color_scheme import ColorScheme
+    from src.models.keywords import KeywordManager
+    from src.utils.analysis import Analysis
+    from src.utils.chart_builder import ChartBuilder
+    from src.utils.chart_store import FileSystemChartStore
+    from src.utils.data_preparer import DataPreparer
+
+    report = {"name": pair.name, "status": "succeeded", "error": ""}
+    folder = os.path.join(options.output, pair.name)
+    start = time.perf_counter()
+    try:
+        os.makedirs(folder, exist_ok=True)
+        survey_1 = read_survey_file(
+            pair.survey1, pair.survey1_id, pair.group1, pair.type1
+        )
+        survey_2 = read_survey_file(
+            pair.survey2, pair.survey2_id, pair.group2, pair.type2
+        )
+        report["participants"] = len(survey_1.results) + len(survey_2.results)
+        report["questions"] = len(survey_1.questions) + len(survey_2.questions)
+        mark = time.perf_counter()
+        report["load_seconds"] = mark - start
+
+        matched_pairs = DataPreparer.prepare_surveys(
+            survey_1, survey_2, threshold=options.threshold
+        )
+        report["matched_questions"] = len(matched_pairs)
+        report["match_seconds"] = time.perf_counter() - mark
+        mark = time.perf_counter()
+
+        summary_table, _ = Analysis(alpha=options.alpha).perform_hypothesis_testing(
+            survey_1, survey_2, matched_pairs, options.test_method
+        )
+        survey_1.clear_statistics()
+        survey_2.clear_statistics()
+        summary_table.to_csv(os.path.join(folder, "summary.csv"), index=False)
+        with open(os.path.join(folder, "summary.tex"), "w", encoding="utf-8") as f:
+            f.write(
+                summary_table.to_latex(
+                    index=False, header=True, caption="Survey Analysis Results"
+                )
+            )
+        pd.DataFrame(
+            matched_pairs,
+            columns=["survey1_question", "survey2_question", "unified_label"],
+        ).to_csv(os.path.join(folder, "matched_questions.csv"), index=False)
+        report["test_seconds"] = time.perf_counter() - mark
+        mark = time.perf_counter()
+
+        report["charts"] = 0
+        if options.charts:
+            theme = next(
+                (t for t in ColorScheme.load_schemes() if t.name == options.theme),
+                None,
+            )
+            chart_builder = ChartBuilder(
+                survey_1,
+                survey_2,
+                "charts/",
+                color_scheme=theme,
+                chart_store=FileSystemChartStore(folder),
+                chart_format=options.chart_format,
+                dpi=options.dpi,
+            )
+            specs = chart_builder.plan_charts(
+                summary_table, keywords=KeywordManager.load_matcher()
+            )
+            chart_builder.clear_existing_charts()
+            for spec in specs.values():
+                chart_builder.render_chart(spec)
+            report["charts"] = len(specs)
+        report["chart_seconds"] = time.perf_counter() - mark
+
+    except Exception as e:
+        logger.error(f"Analyzing {pair.name} failed: {e}", exc_info=True)
+        report.update(status="failed", error=str(e))
+    report["total_seconds"] = time.perf_counter() - start
+    return report
+
+
+def start_embedding_service(model_name: str):
+    """
+    Starts an embedding service in a thread of this process on a private socket.
+
+    Returns:
+        tuple: (service, socket directory to remove when done).
+    """
+    from src.utils.embedding_service import EmbeddingService
+
+    socket_dir = tempfile.mkdtemp(prefix="survey-batch-")
+    service = EmbeddingService(os.path.join(socket_dir, "embedding.sock"), model_name)
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not os.path.exists(service.socket_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return service, socket_dir
+
+
+def run_batch(
+    pairs: List[SurveyPair],
+    options: BatchOptions,
+    workers: int,
+    shared_encoder: bool = True,
+) -> pd.DataFrame:
+    """
+    Analyzes survey pairs on a pool of worker processes.
+
+    Parameters:
+        pairs (list): The survey pairs.
+        options (BatchOptions): Settings applied to every pair.
+        workers (int): Worker processes.
+        shared_encoder (bool): Encode through one embedding service shared by
+            all workers. Without it, every worker loads its own encoder. If the
+            embedding service is enabled in appsettings.json, that service is
+            used instead of starting one.
+
+    Returns:
+        pd.DataFrame: The throughput report, one row per pair.
+    """
+    from src.utils.embedding_service import service_settings
+    from src.utils.server import limit_compute_threads
+
+    # Inherited by the workers, which import numpy and torch after this.
+    limit_compute_threads(max((os.cpu_count() or 1) // workers, 1))
+
+    service, socket_dir, socket_path = None, None, None
+    settings = service_settings()
+    if shared_encoder and settings["enabled"]:
+        socket_path = settings["socket"]
+    elif shared_encoder:
+        service, socket_dir = start_embedding_service(DEFAULT_MODEL)
+        socket_path = service.socket_path
+
+    reports = []
+    try:
+        # Spawned workers start without the threads and the model of this process.
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=init_worker,
+            initargs=(socket_path, DEFAULT_MODEL, settings["timeout_seconds"]),
+        ) as executor:
+            futures = [executor.submit(analyze_pair, pair, options) for pair in pairs]
+            for future in as_completed(futures):
+                report = future.result()
+                logger.info(
+                    f"{report['name']}: {report['status']} in "
+                    f"{report['total_seconds']:.2f} s"
+                )
+                reports.append(report)
+        if service is not None:
+            logger.info(f"Embedding service: {service.stats()}")
+    finally:
+        if service is not None:
+            service.shutdown()
+            shutil.rmtree(socket_dir, ignore_errors=True)
+
+    order = {pair.name: index for index, pair in enumerate(pairs)}
+    reports.sort(key=lambda report: order[report["name"]])
+    return pd.DataFrame(reports, columns=REPORT_COLUMNS)
+
+
+def print_throughput(report: pd.DataFrame, seconds: float, workers: int):
+    """Prints the totals of a batch run."""
+    succeeded = report[report["status"] == "succeeded"]
+    print(f"\nPairs: {len(succeeded)} succeeded, {len(report) - len(succeeded)} failed")
+    print(f"Workers: {workers}, wall time: {seconds:.2f} s")
+    if len(report) and seconds > 0:
+        print(
+            f"Throughput: {len(report) / seconds:.2f} pairs/s, "
+            f"{report['participants'].fillna(0).sum() / seconds:.0f} participants/s"
+        )
+    for stage in ("load", "match", "test", "chart"):
+        column = succeeded[f"{stage}_seconds"]
+        if len(column):
+            print(
+                f"{stage:>6}: {column.sum():8.2f} s in total, "
+                f"{column.mean():6.2f} s per pair"
+            )
+    for _, row in report[report["status"] != "succeeded"].iterrows():
+        print(f"Failed {row['name']}: {row['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="CSV listing the survey pairs.")
+    source.add_argument(
+        "--directory", help="Directory with one subdirectory of two CSVs per pair."
+    )
+    parser.add_argument("--output", default="batch_results")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    parser.add_argument(
+        "--test-method", choices=TEST_METHODS, default=DEFAULT_TEST_METHOD
+    )
+    parser.add_argument("--threshold", type=float, default=MATCH_THRESHOLD)
+    parser.add_argument("--no-charts", action="store_true")
+    parser.add_argument("--chart-format", choices=CHART_FORMATS, default="png")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--theme", default="default")
+    parser.add_argument(
+        "--no-shared-encoder",
+        action="store_true",
+        help="Load the encoder in every worker instead of sharing one.",
+    )
+    args = parser.parse_args()
+
+    pairs = (
+        pairs_from_manifest(args.manifest)
+        if args.manifest
+        else pairs_from_directory(args.directory)
+    )
+    if not pairs:
+        sys.exit("No survey pairs found.")
+    names = [pair.name for pair in pairs]
+    if len(set(names)) != len(names):
+        sys.exit("Pair names must be unique; they name the output folders.")
+
+    options = BatchOptions(
+        output=args.output,
+        alpha=args.alpha,
+        test_method=args.test_method,
+        threshold=args.threshold,
+        charts=not args.no_charts,
+        chart_format=args.chart_format,
+        dpi=args.dpi,
+        theme=args.theme,
+    )
+    workers = max(min(args.workers, len(pairs)), 1)
+    os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    report = run_batch(pairs, options, workers, not args.no_shared_encoder)
+    seconds = time.perf_counter() - start
+    report.to_csv(os.path.join(args.output, "report.csv"), index=False)
+    print_throughput(report, seconds, workers)
+    if (report["status"] != "succeeded").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
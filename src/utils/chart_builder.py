@@ -1,11 +1,43 @@
-import os
+import io
+import dataclasses
+import hashlib
+import json
 import pandas as pd
-import matplotlib.pyplot as plt
 from loguru import logger
-from typing import List
+from typing import Callable, Dict, List, Tuple, Union
 
 from src.models.survey import Survey
 from src.models.question import Question
+from src.utils.chart_renderer import ChartStyle, get_renderer
+from src.utils.chart_store import CHART_FORMATS, ChartStore, FileSystemChartStore
+from src.utils.keyword_matcher import KeywordMatcher
+
+# Aggregate charts are split into pages of this many questions by default.
+QUESTIONS_PER_PAGE = 25
+
+
+@dataclasses.dataclass
+class ChartSpec:
+    """
+    Describes a single chart without rendering it.
+
+    Attributes:
+        filename (str): File name of the chart without extension.
+        title (str): Chart title.
+        xlabel (str): Label for the x-axis.
+        ylabel (str): Label for the y-axis.
+        build_data (Callable): Returns the DataFrame that is plotted.
+        labels (dict): Shortened labels known when the chart was planned.
+        question_ids (tuple): IDs of the questions the chart shows.
+    """
+
+    filename: str
+    title: str
+    xlabel: str
+    ylabel: str
+    build_data: Callable[[], pd.DataFrame]
+    labels: dict = dataclasses.field(default_factory=dict)
+    question_ids: Tuple[int, ...] = ()
 
 
 class ChartBuilder:
@@ -15,23 +47,44 @@ class ChartBuilder:
     Attributes:
         survey1 (Survey): Data for the first survey.
         survey2 (Survey): Data for the second survey.
-        charts_folder (str): Directory to save generated charts.
+        charts_folder (str): Folder of the charts inside the chart store. With the
+            default store this is a directory path.
+        chart_store (ChartStore): Where rendered charts and label CSVs are written.
+        chart_format (str): Image format of the charts (png, svg, webp or jpg).
         label_history (dict): Maps shortened labels to full question text.
         bar_colors (list): Colors for bar charts.
         text_color (str): Color for chart text.
         background_color (str): Color for chart background.
+        renderer (BarChartRenderer): Shared renderer drawing the charts.
+        questions_per_page (int): Maximum number of questions per aggregate chart.
+        data_token (str): Hash of the summary table the charts were planned from.
     """
 
     def __init__(
-        self, survey1: Survey, survey2: Survey, charts_folder: str, color_scheme=None
+        self,
+        survey1: Survey,
+        survey2: Survey,
+        charts_folder: str,
+        color_scheme=None,
+        questions_per_page: int = QUESTIONS_PER_PAGE,
+        chart_store: ChartStore = None,
+        chart_format: str = "jpg",
+        dpi: int = 100,
     ):
         logger.info("Initializing ChartBuilder.")
+        if chart_format not in CHART_FORMATS:
+            raise ValueError(
+                f"Unsupported chart format '{chart_format}'. "
+                f"Use one of: {', '.join(CHART_FORMATS)}."
+            )
         self.survey1 = survey1
         self.survey2 = survey2
         self.charts_folder = charts_folder
+        self.chart_store = chart_store or FileSystemChartStore("")
+        self.chart_format = chart_format
         self.label_history = {}
-
-        os.makedirs(self.charts_folder, exist_ok=True)
+        self.questions_per_page = max(int(questions_per_page), 1)
+        self.data_token = ""
         logger.debug(f"Charts folder set to: {self.charts_folder}")
 
         # Set color scheme with defaults if none provided
@@ -48,24 +101,36 @@ class ChartBuilder:
         self.background_color = "#ffffff"
         logger.debug(f"Bar colors: {self.bar_colors}")
 
-    def _set_chart_properties(self, title: str, xlabel: str, ylabel: str):
-        """Applies consistent title, label, and tick styling for charts."""
-        logger.debug(f"Setting chart properties: title={title}")
-        plt.title(title, fontsize=16, color=self.text_color)
-        plt.xlabel(xlabel, fontsize=12, color=self.text_color)
-        plt.ylabel(ylabel, fontsize=12, color=self.text_color)
-        plt.xticks(rotation=45, ha="right", color=self.text_color)
-        plt.gca().set_facecolor(self.background_color)
-        plt.gcf().set_facecolor(self.background_color)
+        self.renderer = get_renderer(
+            ChartStyle(
+                bar_colors=tuple(self.bar_colors),
+                text_color=self.text_color,
+                background_color=self.background_color,
+                dpi=int(dpi),
+            )
+        )
 
     def _plot_bar_chart(
-        self, data: pd.DataFrame, title: str, xlabel: str, ylabel: str, filename: str
+        self,
+        data: pd.DataFrame,
+        title: str,
+        xlabel: str,
+        ylabel: str,
+        filename: str,
+        labels: dict = None,
     ):
-        """Plots a bar chart and saves it to file."""
+        """Plots a bar chart and saves it to the chart store."""
         logger.debug(f"Plotting bar chart: {filename}")
-        data.plot(kind="bar", color=self.bar_colors, figsize=(12, 6))
-        self._set_chart_properties(title, xlabel, ylabel)
-        self._save_chart(filename)
+        chart_key = self.charts_folder + f"{filename}.{self.chart_format}"
+        buffer = io.BytesIO()
+        self.renderer.render(
+            data, title, xlabel, ylabel, buffer, file_format=self.chart_format
+        )
+        self.chart_store.put(chart_key, buffer.getvalue())
+        logger.info(f"Chart saved: {chart_key}")
+        self._save_labels_to_csv(
+            filename, self.label_history if labels is None else labels
+        )
 
     def _shorten_label(self, label: str, max_length=10):
         """Shortens a label if it exceeds max_length and records it in label_history."""
@@ -76,23 +141,15 @@ class ChartBuilder:
             return short_label
         return label
 
-    def _save_chart(self, filename: str):
-        """Saves the current chart and its labels."""
-        filepath = self.charts_folder + f"/{filename}.jpg"
-        plt.tight_layout()  # Adjust layout to prevent clipping
-        plt.savefig(filepath, format="jpg")
-        plt.close()
-        logger.info(f"Chart saved: {filepath}")
-        self._save_labels_to_csv(filename)
-
-    def _save_labels_to_csv(self, filename: str):
+    def _save_labels_to_csv(self, filename: str, labels: dict):
         """Saves label history to a CSV file."""
-        if self.label_history:
-            csv_filepath = self.charts_folder + f"{filename}_labels.csv"
-            pd.DataFrame(
-                self.label_history.items(), columns=["Short Label", "Full Label"]
-            ).to_csv(csv_filepath, index=False)
-            logger.info(f"Labels saved to CSV: {csv_filepath}")
+        if labels:
+            csv_key = self.charts_folder + f"{filename}_labels.csv"
+            csv_data = pd.DataFrame(
+                labels.items(), columns=["Short Label", "Full Label"]
+            ).to_csv(index=False)
+            self.chart_store.put(csv_key, csv_data.encode("utf-8"))
+            logger.info(f"Labels saved to CSV: {csv_key}")
 
     def generate_charts(self, summary_table: pd.DataFrame, keywords: List[str] = None):
         """
@@ -105,57 +162,184 @@ class ChartBuilder:
         logger.info("Generating charts.")
         self.clear_existing_charts()
 
+        for spec in self.plan_charts(summary_table, keywords).values():
+            self.render_chart(spec)
+
+    def plan_charts(
+        self,
+        summary_table: pd.DataFrame,
+        keywords: Union[List[str], KeywordMatcher] = None,
+    ) -> Dict[str, ChartSpec]:
+        """
+        Decides which charts exist for the surveys without drawing any of them.
+
+        Shortened labels are assigned here, in the same order as the eager
+        rendering, so every chart keeps the same labels and label CSV no matter
+        in which order the charts are rendered later.
+
+        Parameters:
+            summary_table (pd.DataFrame): Summary statistics for matched questions.
+            keywords (list of str or KeywordMatcher): Keywords for selecting related
+                questions.
+
+        Returns:
+            dict: Maps chart file names (e.g. "chart.jpg") to their ChartSpec.
+        """
+        logger.info("Planning charts.")
+        self.label_history = {}
+        self.data_token = self._hash_summary_table(summary_table)
+
         numerical_questions = self._select_numerical_questions()
         binary_questions = self._select_binary_questions()
         significant_questions = self._select_significant_questions(summary_table)
-        related_questions = self._select_related_questions(keywords)
+        related_questions = self._select_related_questions(keywords or [])
 
+        specs = []
         if numerical_questions:
-            self._plot_aggregate_comparison(numerical_questions, measure="average")
+            specs.extend(
+                self._plan_aggregate_comparison(numerical_questions, measure="average")
+            )
 
         if binary_questions:
-            self._plot_aggregate_comparison(binary_questions, measure="proportion")
+            specs.extend(
+                self._plan_aggregate_comparison(binary_questions, measure="proportion")
+            )
 
         for question in significant_questions:
-            self._plot_significant_question_comparison(question)
+            specs.append(self._plan_significant_question_comparison(question))
 
         if related_questions:
-            self._plot_combined_related_questions(related_questions)
+            specs.append(self._plan_combined_related_questions(related_questions))
+
+        logger.debug(f"Planned {len(specs)} charts.")
+        return {f"{spec.filename}.{self.chart_format}": spec for spec in specs}
+
+    @staticmethod
+    def _hash_summary_table(summary_table: pd.DataFrame) -> str:
+        """Returns a hash of the summary table, which changes with every new analysis."""
+        if summary_table is None:
+            return ""
+        try:
+            hashed = pd.util.hash_pandas_object(summary_table, index=True).values
+            data = hashed.tobytes() + repr(list(summary_table.columns)).encode("utf-8")
+        except TypeError:
+            data = summary_table.to_csv().encode("utf-8")
+        return hashlib.sha256(data).hexdigest()
+
+    def fingerprint(self, spec: ChartSpec) -> str:
+        """
+        Returns a fingerprint of everything that determines how a chart looks.
+
+        Two charts with the same fingerprint are identical, so a stored chart whose
+        fingerprint still matches its spec can be reused instead of drawn again.
+
+        Parameters:
+            spec (ChartSpec): The planned chart.
+
+        Returns:
+            str: Hex digest of the chart inputs.
+        """
+        payload = json.dumps(
+            [
+                spec.filename,
+                spec.title,
+                spec.xlabel,
+                spec.ylabel,
+                sorted(spec.labels.items()),
+                list(spec.question_ids),
+                self.chart_format,
+                repr(self.renderer.style),
+                self.survey1.survey_id,
+                self.survey2.survey_id,
+                self.data_token,
+            ],
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def render_chart(self, spec: ChartSpec) -> str:
+        """
+        Renders a planned chart and its labels CSV into the chart store.
+
+        Parameters:
+            spec (ChartSpec): The chart to render.
+
+        Returns:
+            str: Store key of the rendered image.
+        """
+        self._plot_bar_chart(
+            spec.build_data(),
+            spec.title,
+            spec.xlabel,
+            spec.ylabel,
+            spec.filename,
+            labels=spec.labels,
+        )
+        return self.charts_folder + f"{spec.filename}.{self.chart_format}"
 
-    def _plot_aggregate_comparison(
+    def _plan_aggregate_comparison(
         self, questions: List[Question], measure: str = "average"
-    ):
-        """Plots aggregate comparison for numerical or binary questions."""
-        logger.debug(f"Plotting aggregate comparison: measure={measure}")
-        values_survey1 = [
-            (
-                self.survey1.get_data_by_question_id(q.question_id).mean()
-                if measure == "average"
-                else self.survey1.get_data_by_question_id(q.question_id)
-                .value_counts(normalize=True)
-                .get(1, 0)
-            )
-            for q in questions
+    ) -> List[ChartSpec]:
+        """
+        Plans aggregate comparison for numerical or binary questions.
+
+        The questions are split into pages of `questions_per_page`. Every page is its
+        own chart with its own labels CSV and only reads the data of its questions,
+        so the cost of one page does not grow with the size of the survey.
+        """
+        logger.debug(f"Planning aggregate comparison: measure={measure}")
+        pages = [
+            questions[start : start + self.questions_per_page]
+            for start in range(0, len(questions), self.questions_per_page)
         ]
-        values_survey2 = [
-            (
-                self.survey2.get_data_by_question_id(q.question_id).mean()
-                if measure == "average"
-                else self.survey2.get_data_by_question_id(q.question_id)
-                .value_counts(normalize=True)
-                .get(1, 0)
-            )
-            for q in questions
+        return [
+            self._plan_aggregate_page(page, measure, page_number, len(pages))
+            for page_number, page in enumerate(pages, start=1)
         ]
 
+    def _plan_aggregate_page(
+        self,
+        questions: List[Question],
+        measure: str,
+        page_number: int,
+        page_count: int,
+    ) -> ChartSpec:
+        """Plans one page of an aggregate comparison."""
         shortened_labels = [self._shorten_label(q.question_text) for q in questions]
-        combined_df = pd.DataFrame(
-            {
-                f"Survey {self.survey1.survey_id}": values_survey1,
-                f"Survey {self.survey2.survey_id}": values_survey2,
-            },
-            index=shortened_labels,
-        )
+        page_labels = {
+            label: self.label_history[label]
+            for label in shortened_labels
+            if label in self.label_history
+        }
+
+        def build_data():
+            values_survey1 = [
+                (
+                    self.survey1.get_data_by_question_id(q.question_id).mean()
+                    if measure == "average"
+                    else self.survey1.get_data_by_question_id(q.question_id)
+                    .value_counts(normalize=True)
+                    .get(1, 0)
+                )
+                for q in questions
+            ]
+            values_survey2 = [
+                (
+                    self.survey2.get_data_by_question_id(q.question_id).mean()
+                    if measure == "average"
+                    else self.survey2.get_data_by_question_id(q.question_id)
+                    .value_counts(normalize=True)
+                    .get(1, 0)
+                )
+                for q in questions
+            ]
+            return pd.DataFrame(
+                {
+                    f"Survey {self.survey1.survey_id}": values_survey1,
+                    f"Survey {self.survey2.survey_id}": values_survey2,
+                },
+                index=shortened_labels,
+            )
 
         title = (
             "Average Responses for Numerical Questions"
@@ -172,70 +356,89 @@ class ChartBuilder:
             if measure == "average"
             else "aggregate_binary_comparison"
         )
+        if page_count > 1:
+            title = f"{title} (Page {page_number} of {page_count})"
+            filename = f"{filename}_page{page_number}"
+
+        return ChartSpec(
+            filename=filename,
+            title=title,
+            xlabel="Questions",
+            ylabel=ylabel,
+            build_data=build_data,
+            labels=page_labels,
+            question_ids=tuple(q.question_id for q in questions),
+        )
 
-        self._plot_bar_chart(combined_df, title, "Questions", ylabel, filename)
-
-    def _plot_significant_question_comparison(self, question: Question):
-        """Plots a chart for questions with significant differences."""
+    def _plan_significant_question_comparison(self, question: Question) -> ChartSpec:
+        """Plans a chart for questions with significant differences."""
         logger.debug(
-            f"Plotting significant question comparison for: {question.question_text}"
+            f"Planning significant question comparison for: {question.question_text}"
         )
-        data1 = self.survey1.get_data_by_question_id(question.question_id)
-        data2 = self.survey2.get_data_by_question_id(question.question_id)
-
-        combined_df = pd.DataFrame(
-            {
-                f"Survey {self.survey1.survey_id}": data1.value_counts(normalize=True),
-                f"Survey {self.survey2.survey_id}": data2.value_counts(normalize=True),
-            }
-        ).fillna(0)
-
         short_label = self._shorten_label(question.question_text)
-        self._plot_bar_chart(
-            combined_df,
-            f'Significant Difference for "{short_label}"',
-            "Responses",
-            "Proportion of Participants",
-            f"significant_question_{short_label}",
+
+        def build_data():
+            data1 = self.survey1.get_data_by_question_id(question.question_id)
+            data2 = self.survey2.get_data_by_question_id(question.question_id)
+            return pd.DataFrame(
+                {
+                    f"Survey {self.survey1.survey_id}": data1.value_counts(
+                        normalize=True
+                    ),
+                    f"Survey {self.survey2.survey_id}": data2.value_counts(
+                        normalize=True
+                    ),
+                }
+            ).fillna(0)
+
+        return ChartSpec(
+            filename=f"significant_question_{short_label}",
+            title=f'Significant Difference for "{short_label}"',
+            xlabel="Responses",
+            ylabel="Proportion of Participants",
+            build_data=build_data,
+            labels=dict(self.label_history),
+            question_ids=(question.question_id,),
         )
 
-    def _plot_combined_related_questions(self, questions):
-        """Plots a combined chart for related questions."""
-        logger.debug("Plotting combined related questions.")
-        avg_survey1 = [
-            self.survey1.get_data_by_question_id(q.question_id).mean()
-            for q in questions
-        ]
-        avg_survey2 = [
-            self.survey2.get_data_by_question_id(q.question_id).mean()
-            for q in questions
-        ]
+    def _plan_combined_related_questions(self, questions) -> ChartSpec:
+        """Plans a combined chart for related questions."""
+        logger.debug("Planning combined related questions.")
         shortened_labels = [self._shorten_label(q.question_text) for q in questions]
 
-        combined_df = pd.DataFrame(
-            {
-                f"Survey {self.survey1.survey_id}": avg_survey1,
-                f"Survey {self.survey2.survey_id}": avg_survey2,
-            },
-            index=shortened_labels,
-        )
+        def build_data():
+            avg_survey1 = [
+                self.survey1.get_data_by_question_id(q.question_id).mean()
+                for q in questions
+            ]
+            avg_survey2 = [
+                self.survey2.get_data_by_question_id(q.question_id).mean()
+                for q in questions
+            ]
+            return pd.DataFrame(
+                {
+                    f"Survey {self.survey1.survey_id}": avg_survey1,
+                    f"Survey {self.survey2.survey_id}": avg_survey2,
+                },
+                index=shortened_labels,
+            )
 
-        self._plot_bar_chart(
-            combined_df,
-            "Combined Responses for Questions with Keywords",
-            "Questions",
-            "Average Response",
-            "combined_related_questions",
+        return ChartSpec(
+            filename="combined_related_questions",
+            title="Combined Responses for Questions with Keywords",
+            xlabel="Questions",
+            ylabel="Average Response",
+            build_data=build_data,
+            labels=dict(self.label_history),
+            question_ids=tuple(q.question_id for q in questions),
         )
 
     def clear_existing_charts(self):
-        """Deletes all existing charts in the folder."""
+        """Deletes all existing charts and label CSVs in the folder."""
         logger.info("Clearing existing charts.")
-        if os.path.exists(self.charts_folder):
-            for file in os.listdir(self.charts_folder):
-                if file.endswith(".jpg") or file.endswith(".csv"):
-                    os.remove(self.charts_folder + file)
-            logger.info("Existing charts cleared.")
+        extensions = tuple(f".{extension}" for extension in CHART_FORMATS) + (".csv",)
+        self.chart_store.delete_prefix(self.charts_folder, extensions=extensions)
+        logger.info("Existing charts cleared.")
 
     def _select_numerical_questions(self):
         """Selects numerical questions for plotting."""
@@ -256,28 +459,49 @@ class ChartBuilder:
     def _select_significant_questions(
         self, summary_table: pd.DataFrame, alpha: float = 0.05
     ):
-        """Selects significant questions based on p-values."""
+        """
+        Selects significant questions based on p-values.
+
+        Questions without a p-value, e.g. because they have no answers, and
+        questions without answers in either survey are skipped.
+        """
         logger.debug("Selecting significant questions.")
+        if summary_table is None or "p-value" not in summary_table.columns:
+            return []
         if "Question" in summary_table.columns:
             summary_table = summary_table.set_index("Question")
+        p_values = pd.to_numeric(summary_table["p-value"], errors="coerce")
+        p_values = p_values[~p_values.index.duplicated()].dropna()
 
         significant_questions = [
             q
             for q in self.survey1.questions
-            if q.question_text in summary_table.index
-            and summary_table.loc[q.question_text]["p-value"] < alpha
+            if q.question_text in p_values.index
+            and p_values[q.question_text] < alpha
+            and not self.survey1.get_data_by_question_id(q.question_id).empty
+            and not self.survey2.get_data_by_question_id(q.question_id).empty
         ]
         logger.debug(f"Significant questions selected: {len(significant_questions)}")
         return significant_questions
 
-    def _select_related_questions(self, keywords: List[str]):
-        """Selects questions related to specific keywords."""
-        logger.debug(f"Selecting related questions using keywords: {keywords}")
-        keywords = [k.lower() for k in keywords]
+    def _select_related_questions(
+        self, keywords: Union[List[str], KeywordMatcher]
+    ) -> List[Question]:
+        """
+        Selects questions related to specific keywords.
+
+        Parameters:
+            keywords (list of str or KeywordMatcher): Keywords, or a matcher already
+                compiled from them (e.g. `KeywordManager.load_matcher()`).
+        """
+        matcher = (
+            keywords
+            if isinstance(keywords, KeywordMatcher)
+            else KeywordMatcher(keywords)
+        )
+        logger.debug(f"Selecting related questions using keywords: {matcher.keywords}")
         related_questions = [
-            q
-            for q in self.survey1.questions
-            if any(keyword in q.question_text.lower() for keyword in keywords)
+            q for q in self.survey1.questions if matcher.matches(q.question_text)
         ]
         logger.debug(f"Related questions selected: {len(related_questions)}")
         return related_questions
@@ -0,0 +1,157 @@
+import dataclasses
+import threading
+from typing import List
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.utils.lazy_import import LazyModule
+
+# matplotlib is imported when the first chart is drawn.
+backend_agg = LazyModule("matplotlib.backends.backend_agg")
+figure_module = LazyModule("matplotlib.figure")
+
+
+@dataclasses.dataclass(frozen=True)
+class ChartStyle:
+    """
+    Styling shared by every chart drawn from one figure template.
+
+    Attributes:
+        bar_colors (tuple): Colors cycled through the plotted columns.
+        text_color (str): Color for titles, labels and ticks.
+        background_color (str): Color for the figure and axes background.
+        figsize (tuple): Figure size in inches.
+        dpi (int): Resolution used when saving.
+        title_size (int): Font size of the title.
+        label_size (int): Font size of the axis labels.
+        bar_width (float): Total width of one group of bars.
+    """
+
+    bar_colors: tuple = ("#1982c4", "#8ac926")
+    text_color: str = "#000000"
+    background_color: str = "#ffffff"
+    figsize: tuple = (12, 6)
+    dpi: int = 100
+    title_size: int = 16
+    label_size: int = 12
+    bar_width: float = 0.5
+
+
+class BarChartRenderer:
+    """
+    Draws grouped bar charts with the object-oriented Matplotlib API.
+
+    Each thread keeps its own prepared Figure with an Agg canvas and reuses it for
+    every chart, so no pyplot global state is touched and concurrent Flask request
+    threads never share a figure.
+
+    Attributes:
+        style (ChartStyle): Styling applied to every chart.
+    """
+
+    def __init__(self, style: ChartStyle = None):
+        self.style = style or ChartStyle()
+        self._local = threading.local()
+
+    def _figure(self):
+        """Returns the figure template of the current thread, creating it once."""
+        figure = getattr(self._local, "figure", None)
+        if figure is None:
+            logger.debug("Preparing figure template for thread.")
+            figure = figure_module.Figure(
+                figsize=self.style.figsize, dpi=self.style.dpi
+            )
+            backend_agg.FigureCanvasAgg(figure)
+            figure.set_facecolor(self.style.background_color)
+            figure.add_subplot(1, 1, 1)
+            self._local.figure = figure
+        return figure
+
+    def _style_axes(self, axes, title: str, xlabel: str, ylabel: str):
+        """Applies consistent title, label, and tick styling for charts."""
+        axes.set_facecolor(self.style.background_color)
+        axes.set_title(
+            title, fontsize=self.style.title_size, color=self.style.text_color
+        )
+        axes.set_xlabel(
+            xlabel, fontsize=self.style.label_size, color=self.style.text_color
+        )
+        axes.set_ylabel(
+            ylabel, fontsize=self.style.label_size, color=self.style.text_color
+        )
+        axes.tick_params(axis="both", colors=self.style.text_color)
+        for label in axes.get_xticklabels():
+            label.set_rotation(45)
+            label.set_horizontalalignment("right")
+
+    def _draw_bars(self, axes, data: pd.DataFrame):
+        """Draws one bar per column for every row of `data`, like DataFrame.plot(kind="bar")."""
+        positions = np.arange(len(data.index))
+        column_count = max(len(data.columns), 1)
+        width = self.style.bar_width / column_count
+
+        for i, column in enumerate(data.columns):
+            offset = (i - (column_count - 1) / 2) * width
+            axes.bar(
+                positions + offset,
+                data[column].to_numpy(dtype=float, na_value=np.nan),
+                width=width,
+                color=self.style.bar_colors[i % len(self.style.bar_colors)],
+                label=str(column),
+            )
+
+        axes.set_xticks(positions)
+        axes.set_xticklabels([str(label) for label in data.index])
+        axes.set_xlim(-0.5, len(data.index) - 0.5)
+        if len(data.columns):
+            axes.legend()
+
+    def render(
+        self,
+        data: pd.DataFrame,
+        title: str,
+        xlabel: str,
+        ylabel: str,
+        filepath: str,
+        file_format: str = "jpg",
+    ):
+        """
+        Draws a grouped bar chart and saves it.
+
+        Parameters:
+            data (pd.DataFrame): Rows become bar groups, columns become bars.
+            title (str): Chart title.
+            xlabel (str): Label for the x-axis.
+            ylabel (str): Label for the y-axis.
+            filepath (str): Target path or writable binary file object.
+            file_format (str): Image format passed to Matplotlib.
+        """
+        figure = self._figure()
+        axes = figure.axes[0]
+        axes.clear()
+        try:
+            self._draw_bars(axes, data)
+            self._style_axes(axes, title, xlabel, ylabel)
+            figure.tight_layout()  # Adjust layout to prevent clipping
+            figure.savefig(filepath, format=file_format, dpi=self.style.dpi)
+        finally:
+            axes.clear()
+
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(style: ChartStyle) -> BarChartRenderer:
+    """
+    Returns the shared renderer for a style, so figure templates are reused across
+    ChartBuilder instances instead of being rebuilt for every analysis.
+    """
+    with _renderers_lock:
+        renderer = _renderers.get(style)
+        if renderer is None:
+            renderer = BarChartRenderer(style)
+            _renderers[style] = renderer
+        return renderer
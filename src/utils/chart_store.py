@@ -0,0 +1,337 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import BinaryIO, List, Optional
+from loguru import logger
+
+# Supported chart output formats and their MIME types.
+CHART_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+}
+
+
+def mimetype_for(key: str) -> str:
+    """Returns the MIME type of a stored chart or label file based on its extension."""
+    extension = os.path.splitext(key)[1].lstrip(".").lower()
+    if extension == "csv":
+        return "text/csv"
+    return CHART_FORMATS.get(extension, "application/octet-stream")
+
+
+class ChartStore(ABC):
+    """
+    Stores rendered charts and their label CSVs.
+
+    Keys are relative paths such as "<session>/<file>"; a key ending in "/" is a
+    prefix that groups the charts of one session.
+
+    Attributes:
+        evicts (bool): True if the store drops charts on its own, so they may have
+            to be rendered again.
+    """
+
+    evicts = False
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        """Stores `data` under `key`, replacing any previous value."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the stored bytes, or None if the key does not exist."""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Returns a readable binary stream for `key`."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Returns True if `key` is stored."""
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        """Returns the size of the stored value in bytes."""
+
+    @abstractmethod
+    def etag(self, key: str) -> str:
+        """Returns a validator that changes whenever the stored value changes."""
+
+    @abstractmethod
+    def last_modified(self, key: str) -> float:
+        """Returns the time the value was stored as a UNIX timestamp."""
+
+    @abstractmethod
+    def list(self, prefix: str) -> List[str]:
+        """Returns the names (without prefix) of all keys below `prefix`."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Deletes `key` if it is stored."""
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str, extensions: tuple = None) -> int:
+        """
+        Deletes all keys below `prefix`, optionally only those with `extensions`.
+
+        Returns:
+            int: Number of bytes freed.
+        """
+
+    @abstractmethod
+    def prefixes(self) -> List[str]:
+        """Returns the top-level prefixes (e.g. one per session) that hold keys."""
+
+
+class FileSystemChartStore(ChartStore):
+    """
+    Keeps charts as files below a root directory, e.g. `static/images/`.
+
+    Attributes:
+        root (str): Directory the keys are resolved against.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key) if self.root else key
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write to a temporary file first so readers never see a partial chart.
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self._path(key))
+
+    def etag(self, key: str) -> str:
+        stat = os.stat(self._path(key))
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def last_modified(self, key: str) -> float:
+        return os.path.getmtime(self._path(key))
+
+    def list(self, prefix: str) -> List[str]:
+        folder = self._path(prefix)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(
+            f
+            for f in os.listdir(folder)
+            if not f.endswith(".tmp") and os.path.isfile(os.path.join(folder, f))
+        )
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix: str, extensions: tuple = None) -> int:
+        folder = self._path(prefix)
+        if not os.path.isdir(folder):
+            return 0
+        freed = 0
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path) and (
+                extensions is None or name.endswith(extensions)
+            ):
+                freed += os.path.getsize(path)
+                os.remove(path)
+        if extensions is None:
+            # Remove the emptied folder itself; it may still hold subfolders.
+            try:
+                os.rmdir(folder)
+            except OSError:
+                pass
+        return freed
+
+    def prefixes(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            f"{name}/"
+            for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name))
+        )
+
+
+class MemoryChartStore(ChartStore):
+    """
+    Keeps charts in memory and evicts the least recently used ones once the
+    total size of the charts exceeds a byte budget. Evicted charts are simply
+    rendered again on their next request.
+
+    The charts live in one process, so this store only works when the
+    application runs in a single worker process; with more workers, a chart
+    rendered by one worker is missing in the others.
+
+    Attributes:
+        max_bytes (int): Byte budget for all stored values.
+    """
+
+    evicts = True
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        """Returns the number of bytes currently stored."""
+        return self._total_bytes
+
+    def put(self, key: str, data: bytes):
+        entry = (data, hashlib.md5(data).hexdigest(), time.time())
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= len(previous[0])
+            self._entries[key] = entry
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        # Plan and fingerprint files are small and describe the charts, so only
+        # the charts themselves are evicted.
+        evictable = (key for key in list(self._entries) if not key.endswith(".json"))
+        for key in evictable:
+            if self._total_bytes <= self.max_bytes or len(self._entries) <= 1:
+                break
+            data = self._entries.pop(key)[0]
+            self._total_bytes -= len(data)
+            logger.debug(f"Evicted {key} ({len(data)} bytes) from chart store.")
+
+    def _entry(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entry(key)
+        return entry[0] if entry else None
+
+    def open(self, key: str) -> BinaryIO:
+        entry = self._entry(key)
+        if entry is None:
+            raise FileNotFoundError(f"Chart {key} not found.")
+        return io.BytesIO(entry[0])
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def size(self, key: str) -> int:
+        entry = self._entry(key)
+        if entry is None:
+            raise FileNotFoundError(f"Chart {key} not found.")
+        return len(entry[0])
+
+    def etag(self, key: str) -> str:
+        entry = self._entry(key)
+        if entry is None:
+            raise FileNotFoundError(f"Chart {key} not found.")
+        return entry[1]
+
+    def last_modified(self, key: str) -> float:
+        entry = self._entry(key)
+        if entry is None:
+            raise FileNotFoundError(f"Chart {key} not found.")
+        return entry[2]
+
+    def list(self, prefix: str) -> List[str]:
+        with self._lock:
+            return sorted(
+                key[len(prefix) :] for key in self._entries if key.startswith(prefix)
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total_bytes -= len(entry[0])
+
+    def delete_prefix(self, prefix: str, extensions: tuple = None) -> int:
+        freed = 0
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                if extensions is None or key.endswith(extensions):
+                    freed += len(self._entries.pop(key)[0])
+            self._total_bytes -= freed
+        return freed
+
+    def prefixes(self) -> List[str]:
+        with self._lock:
+            return sorted(
+                {key.split("/", 1)[0] + "/" for key in self._entries if "/" in key}
+            )
+
+
+# Backends that keep charts inside one process.
+SINGLE_PROCESS_BACKENDS = ("memory",)
+
+
+def check_chart_store_workers(store_settings: dict, workers: int):
+    """
+    Raises:
+        ValueError: If the configured store cannot be shared by `workers` processes.
+    """
+    backend = (store_settings or {}).get("backend", "filesystem")
+    if backend in SINGLE_PROCESS_BACKENDS and workers > 1:
+        raise ValueError(
+            f"The '{backend}' chart store only works with a single worker process, "
+            f"but {workers} are configured. Use the 'filesystem' chart store or "
+            "set server.workers to 1."
+        )
+
+
+def create_chart_store(store_settings: dict, image_root: str) -> ChartStore:
+    """
+    Creates the chart store configured in appsettings.json.
+
+    Parameters:
+        store_settings (dict): The "chart_store" settings, e.g.
+            {"backend": "memory", "max_bytes": 67108864}.
+        image_root (str): Root directory of the filesystem backend.
+
+    Returns:
+        ChartStore: The configured store.
+    """
+    backend = (store_settings or {}).get("backend", "filesystem")
+    if backend in SINGLE_PROCESS_BACKENDS:
+        max_bytes = int(store_settings.get("max_bytes", 64 * 1024 * 1024))
+        logger.info(f"Using in-memory chart store with {max_bytes} byte budget.")
+        return MemoryChartStore(max_bytes=max_bytes)
+    if backend != "filesystem":
+        logger.warning(f"Unknown chart store backend '{backend}', using filesystem.")
+    logger.info(f"Using filesystem chart store at {image_root}.")
+    return FileSystemChartStore(image_root)
@@ -0,0 +1,162 @@
+import gzip
+import mimetypes
+import os
+from typing import Iterable
+from flask import Flask, Response, request, send_file, send_from_directory
+from loguru import logger
+
+# Responses of these types are compressed; images other than SVG are compressed
+# already.
+COMPRESSIBLE_MIMETYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "image/svg+xml",
+)
+STATIC_EXTENSIONS = (".css", ".js")
+# Only these subfolders of the static folder are precompressed; the others hold
+# saved sessions and charts, which must not gain .gz copies.
+STATIC_SUBFOLDERS = ("css", "js")
+# Appended to the ETag of a compressed response, so caches never mix it up with
+# the uncompressed representation.
+ETAG_SUFFIX = "-gzip"
+
+
+def accepts_gzip() -> bool:
+    """Returns True if the client of the current request accepts gzip."""
+    return "gzip" in request.accept_encodings
+
+
+def compress_response(response: Response, min_bytes: int = 1024, level: int = 6):
+    """
+    Compresses a response with gzip if the client accepts it and compressing pays off.
+
+    Streamed responses (progress streams, ZIP exports) and files are left as they
+    are; static files are served precompressed instead.
+
+    Returns:
+        Response: The response, compressed where applicable.
+    """
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if not accepts_gzip():
+        return response
+
+    data = response.get_data()
+    if len(data) < min_bytes:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=level))
+    response.headers["Content-Encoding"] = "gzip"
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + ETAG_SUFFIX, weak)
+    return response
+
+
+def _static_files(folder: str, subfolders: Iterable[str]):
+    for subfolder in subfolders:
+        for root, _, files in os.walk(os.path.join(folder, subfolder)):
+            for name in files:
+                yield root, name
+
+
+def precompress_static(
+    folder: str,
+    extensions: Iterable[str] = STATIC_EXTENSIONS,
+    level: int = 9,
+    subfolders: Iterable[str] = STATIC_SUBFOLDERS,
+) -> int:
+    """
+    Writes a .gz copy next to every static file in `subfolders` that has none or
+    an outdated one.
+
+    Returns:
+        int: Number of files compressed.
+    """
+    compressed = 0
+    for root, name in _static_files(folder, subfolders):
+        if not name.endswith(tuple(extensions)):
+            continue
+        path = os.path.join(root, name)
+        gz_path = path + ".gz"
+        if os.path.exists(gz_path) and os.path.getmtime(gz_path) >= os.path.getmtime(
+            path
+        ):
+            continue
+        with open(path, "rb") as source:
+            data = gzip.compress(source.read(), compresslevel=level, mtime=0)
+        # Other workers may do the same; swap the file in whole.
+        temp_path = f"{gz_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as target:
+            target.write(data)
+        os.replace(temp_path, gz_path)
+        compressed += 1
+    return compressed
+
+
+def send_static(folder: str, filename: str) -> Response:
+    """
+    Serves a static file, using its precompressed .gz copy when the client accepts
+    gzip and the copy is current.
+    """
+    path = os.path.join(folder, filename)
+    gz_path = path + ".gz"
+    if (
+        accepts_gzip()
+        and filename.endswith(STATIC_EXTENSIONS)
+        and os.path.isfile(path)
+        and os.path.isfile(gz_path)
+        and os.path.getmtime(gz_path) >= os.path.getmtime(path)
+    ):
+        response = send_file(
+            gz_path,
+            mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+            conditional=True,
+        )
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = send_from_directory(folder, filename)
+    if filename.endswith(STATIC_EXTENSIONS):
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_compression(app: Flask, settings: dict):
+    """
+    Compresses large text responses of an application and serves the CSS/JS files
+    in its static css and js folders precompressed.
+
+    Parameters:
+        app (Flask): The application.
+        settings (dict): The "compression" settings, e.g.
+            {"enabled": true, "min_bytes": 1024, "level": 6}.
+    """
+    settings = settings or {}
+    if not settings.get("enabled", True):
+        return
+    min_bytes = int(settings.get("min_bytes", 1024))
+    level = int(settings.get("level", 6))
+
+    if app.static_folder and os.path.isdir(app.static_folder):
+        try:
+            count = precompress_static(app.static_folder)
+            logger.info(f"Precompressed {count} static files.")
+        except OSError as e:
+            logger.warning(f"Could not precompress static files: {e}")
+        static_folder = app.static_folder
+        app.view_functions["static"] = lambda filename: send_static(
+            static_folder, filename
+        )
+
+    app.after_request(lambda response: compress_response(response, min_bytes, level))
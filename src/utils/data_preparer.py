@@ -1,20 +1,116 @@
 from loguru import logger
 import re
+import threading
 from typing import List
-from sentence_transformers import SentenceTransformer, util
+
+import numpy as np
+
+from src.utils.embedding_service import EmbeddingClient, service_settings
+from src.utils.lazy_import import LazyModule
+
+# sentence_transformers imports torch and transformers, which takes seconds, so
+# it is imported when the first encoder is loaded.
+sentence_transformers = LazyModule("sentence_transformers")
+
+DEFAULT_MODEL = "paraphrase-MiniLM-L6-v2"
+# Minimum cosine similarity of two questions to be treated as the same question.
+MATCH_THRESHOLD = 0.75
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_local_encoder(model_name: str = DEFAULT_MODEL):
+    """
+    Returns the shared in-process sentence encoder for a model, loading it on first use.
+
+    Loading the model takes seconds and hundreds of megabytes, so it is loaded
+    once per process. When it is loaded before worker processes are forked, they
+    share its memory.
+    """
+    with _encoders_lock:
+        encoder = _encoders.get(model_name)
+        if encoder is None:
+            logger.info(f"Loading sentence encoder {model_name}")
+            encoder = sentence_transformers.SentenceTransformer(model_name)
+            _encoders[model_name] = encoder
+        return encoder
+
+
+def get_encoder(model_name: str = DEFAULT_MODEL):
+    """
+    Returns the encoder QuestionMatcher uses for a model.
+
+    With the embedding service enabled in appsettings.json this is a client of the
+    service, which falls back to the in-process encoder when the service is not
+    available. Otherwise it is the in-process encoder.
+    """
+    key = ("service", model_name)
+    with _encoders_lock:
+        client = _encoders.get(key)
+    if client is not None:
+        return client
+    service = service_settings()
+    if not service["enabled"]:
+        return get_local_encoder(model_name)
+    return use_embedding_service(
+        service["socket"], model_name, timeout=service["timeout_seconds"]
+    )
+
+
+def use_embedding_service(
+    socket_path: str, model_name: str = DEFAULT_MODEL, timeout: float = 30
+) -> EmbeddingClient:
+    """
+    Makes `get_encoder` of this process encode through the embedding service
+    listening on `socket_path`, whatever appsettings.json says.
+
+    Returns:
+        EmbeddingClient: The client now used for the model.
+    """
+    key = ("service", model_name)
+    with _encoders_lock:
+        client = _encoders.get(key)
+        if client is None or client.socket_path != socket_path:
+            client = EmbeddingClient(
+                socket_path,
+                model_name,
+                fallback=lambda: get_local_encoder(model_name),
+                timeout=timeout,
+            )
+            _encoders[key] = client
+        return client
+
+
+def cosine_similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Returns the cosine similarity of every row of `a` with every row of `b`.
+
+    Computed with numpy, so matching questions through the embedding service
+    never imports torch.
+    """
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return a @ b.T
 
 
 class DataPreparer:
     @staticmethod
-    def prepare_surveys(survey_1, survey_2):
+    def prepare_surveys(survey_1, survey_2, threshold: float = MATCH_THRESHOLD):
         """
         Matches questions and prepares data for analysis, including statistics computation.
+
+        Parameters:
+            threshold (float): Minimum similarity of two questions to be matched.
         """
         logger.info("Preparing surveys for analysis.")
         question_matcher = QuestionMatcher()
         matched_pairs = question_matcher.match_questions(
             [q.question_text for q in survey_1.questions],
             [q.question_text for q in survey_2.questions],
+            threshold=threshold,
         )
 
         logger.debug(f"Matched pairs: {matched_pairs}")
@@ -57,9 +153,9 @@ class DataPreparer:
 
 
 class QuestionMatcher:
-    def __init__(self, model_name="paraphrase-MiniLM-L6-v2"):
+    def __init__(self, model_name=DEFAULT_MODEL):
         logger.info(f"Initializing QuestionMatcher with model {model_name}")
-        self.model = SentenceTransformer(model_name)
+        self.model = get_encoder(model_name)
 
     def clean_text(self, text):
         """
@@ -93,7 +189,7 @@ class QuestionMatcher:
         self,
         survey1_questions: List[str],
         survey2_questions: List[str],
-        threshold: float = 0.75,
+        threshold: float = MATCH_THRESHOLD,
     ):
         """
         Matches questions from two surveys based on semantic similarity.
@@ -105,7 +201,7 @@ class QuestionMatcher:
         Parameters:
             survey1_questions (list of str): Questions from Survey 1.
             survey2_questions (list of str): Questions from Survey 2.
-            threshold (float): Minimum similarity score to consider a match (default is 0.75).
+            threshold (float): Minimum similarity score to consider a match (default is MATCH_THRESHOLD).
 
         Returns:
             list of dict: Matched question pairs with:
@@ -114,10 +210,12 @@ class QuestionMatcher:
                 - "unified_label" (str): Combined label for similar questions.
         """
         logger.info("Matching questions between surveys.")
-        embeddings1 = self.model.encode(survey1_questions, convert_to_tensor=True)
-        embeddings2 = self.model.encode(survey2_questions, convert_to_tensor=True)
+        if not survey1_questions or not survey2_questions:
+            return []
+        embeddings1 = self.model.encode(survey1_questions)
+        embeddings2 = self.model.encode(survey2_questions)
 
-        cosine_scores = util.pytorch_cos_sim(embeddings1, embeddings2)
+        cosine_scores = cosine_similarity(embeddings1, embeddings2)
         matched_pairs = []
 
         used_indices = set()  # Track indices in survey2 already matched
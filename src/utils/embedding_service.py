@@ -0,0 +1,466 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+import numpy as np
+from loguru import logger
+
+from src.utils.settings import get_setting
+
+# Frames are two big-endian lengths (JSON header, binary payload) followed by
+# the header and the payload.
+_FRAME_PREFIX = struct.Struct("!II")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+# Connections the service's socket queues before clients are refused; every
+# upload of every worker process connects, often at the same moment.
+LISTEN_BACKLOG = 128
+# Longest time a client keeps retrying a connection while the backlog is full.
+CONNECT_RETRY_SECONDS = 2.0
+
+
+def _read_exactly(connection: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed in the middle of a frame.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_frame(connection: socket.socket, header: dict, payload: bytes = b""):
+    """Sends a JSON header and an optional binary payload as one frame."""
+    data = json.dumps(header).encode("utf-8")
+    connection.sendall(_FRAME_PREFIX.pack(len(data), len(payload)) + data + payload)
+
+
+def receive_frame(connection: socket.socket) -> Optional[tuple]:
+    """
+    Receives one frame.
+
+    Returns:
+        tuple: (header, payload), or None if the peer closed the connection
+            between frames.
+
+    Raises:
+        ValueError: If the frame is larger than MAX_FRAME_BYTES.
+    """
+    prefix = connection.recv(_FRAME_PREFIX.size, socket.MSG_WAITALL)
+    if not prefix:
+        return None
+    if len(prefix) < _FRAME_PREFIX.size:
+        prefix += _read_exactly(connection, _FRAME_PREFIX.size - len(prefix))
+    header_size, payload_size = _FRAME_PREFIX.unpack(prefix)
+    if header_size + payload_size > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame of {header_size + payload_size} bytes is too large.")
+    header = json.loads(_read_exactly(connection, header_size))
+    return header, _read_exactly(connection, payload_size)
+
+
+class _EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    request_queue_size = LISTEN_BACKLOG
+    daemon_threads = True
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of sentence embeddings.
+
+    Attributes:
+        max_entries (int): Embeddings kept before the least recently used are dropped.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that had to be encoded.
+    """
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Returns the cached embedding of each text, or None where it is missing."""
+        found = []
+        with self._lock:
+            for text in texts:
+                vector = self._entries.get(text)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(text)
+                    self.hits += 1
+                found.append(vector)
+        return found
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """Stores the embeddings of texts."""
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                self._entries[text] = vector
+                self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class EncodeBatcher:
+    """
+    Collects encode requests for a short window and encodes them as one batch.
+
+    Requests from concurrent uploads arriving within `window` seconds share one
+    model call, and a text requested several times is encoded once.
+
+    Attributes:
+        encode (Callable): Encodes a list of texts into a 2-D float32 array.
+        window (float): Seconds to wait for more requests after the first one.
+        max_batch (int): Texts that start a batch without waiting for the window.
+        batches (int): Model calls made.
+        encoded (int): Texts encoded.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray],
+        window: float = 0.01,
+        max_batch: int = 256,
+    ):
+        self.encode = encode
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.encoded = 0
+        self._queue = []
+        self._queued_texts = 0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        """Queues texts and returns a Future of their embeddings in the same order."""
+        future = Future()
+        with self._condition:
+            self._queue.append((texts, future))
+            self._queued_texts += len(texts)
+            self._condition.notify_all()
+        return future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue)
+                deadline = time.monotonic() + self.window
+                while self._queued_texts < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch, self._queue = self._queue, []
+                self._queued_texts = 0
+
+            unique = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+            try:
+                vectors = self.encode(unique)
+            except Exception as e:
+                logger.error(f"Encoding a batch of {len(unique)} texts failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.encoded += len(unique)
+            rows = {text: row for row, text in enumerate(unique)}
+            for texts, future in batch:
+                future.set_result(vectors[[rows[text] for text in texts]])
+            logger.debug(
+                f"Encoded {len(unique)} texts for {len(batch)} requests in one batch."
+            )
+
+
+class EmbeddingService:
+    """
+    Serves sentence embeddings to all worker processes of a host over a Unix socket.
+
+    The model is loaded once. Embeddings are answered from an LRU cache, and
+    missing ones are encoded by an EncodeBatcher.
+
+    Attributes:
+        socket_path (str): Path of the Unix socket.
+        model_name (str): Sentence transformer model served.
+        cache (EmbeddingCache): Cache of computed embeddings.
+        batcher (EncodeBatcher): Batches the texts missing from the cache.
+        requests (int): Encode requests answered.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        model_name: str,
+        batch_window: float = 0.01,
+        max_batch: int = 256,
+        cache_entries: int = 50000,
+    ):
+        from sentence_transformers import SentenceTransformer
+
+        self.socket_path = socket_path
+        self.model_name = model_name
+        logger.info(f"Loading sentence encoder {model_name} for the embedding service")
+        model = SentenceTransformer(model_name)
+        self.cache = EmbeddingCache(cache_entries)
+        self.batcher = EncodeBatcher(
+            lambda texts: np.asarray(
+                model.encode(texts, convert_to_numpy=True), dtype=np.float32
+            ),
+            window=batch_window,
+            max_batch=max_batch,
+        )
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Returns the embeddings of texts, encoding only those not cached."""
+        with self._lock:
+            self.requests += 1
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            encoded = self.batcher.submit(missing).result()
+            self.cache.put_many(missing, encoded)
+            found = dict(zip(missing, encoded))
+            vectors = [found[t] if v is None else v for t, v in zip(texts, vectors)]
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(vectors)
+
+    def stats(self) -> dict:
+        """Returns request, cache and batching counters."""
+        return {
+            "model": self.model_name,
+            "requests": self.requests,
+            "cached": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "batches": self.batcher.batches,
+            "encoded": self.batcher.encoded,
+        }
+
+    def handle(self, header: dict) -> tuple:
+        """Answers one request frame and returns the response (header, payload)."""
+        operation = header.get("op")
+        if operation == "stats":
+            return self.stats(), b""
+        if operation != "encode":
+            return {"error": f"Unknown operation {operation!r}."}, b""
+        if header.get("model") != self.model_name:
+            return {"error": f"This service encodes with {self.model_name}."}, b""
+        vectors = np.ascontiguousarray(self.encode(header["texts"]), dtype=np.float32)
+        return {"shape": list(vectors.shape), "dtype": "float32"}, vectors.tobytes()
+
+    def serve_forever(self):
+        """Listens on the socket until the process is stopped."""
+        service = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        frame = receive_frame(self.request)
+                        if frame is None:
+                            return
+                        response = service.handle(frame[0])
+                    except (ConnectionError, OSError):
+                        return
+                    except Exception as e:
+                        logger.error(f"Embedding request failed: {e}", exc_info=True)
+                        response = {"error": str(e)}, b""
+                    send_frame(self.request, *response)
+
+        if os.path.exists(self.socket_path):
+            # Left behind by a service that did not shut down cleanly.
+            os.remove(self.socket_path)
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+        self._server = _EmbeddingServer(self.socket_path, Handler)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"Embedding service listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        """Stops `serve_forever` from another thread."""
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class EmbeddingClient:
+    """
+    Encodes sentences through the embedding service, with the same `encode`
+    interface as a SentenceTransformer.
+
+    When the service cannot be reached or answers with an error, the client falls
+    back to an encoder in this process and does not try the service again for
+    `retry_after` seconds.
+
+    Attributes:
+        socket_path (str): Path of the service's Unix socket.
+        model_name (str): Model the embeddings must come from.
+        fallback (Callable): Returns the in-process encoder.
+        timeout (float): Seconds to wait for the service.
+        retry_after (float): Seconds to use the fallback after the service failed.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        model_name: str,
+        fallback: Callable,
+        timeout: float = 30,
+        retry_after: float = 30,
+    ):
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.fallback = fallback
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._unavailable_until = 0.0
+
+    def _connect(self, connection: socket.socket):
+        """
+        Connects to the service, retrying with a short backoff while its listen
+        backlog is full (EAGAIN) instead of falling back at once.
+        """
+        deadline = time.monotonic() + min(self.timeout, CONNECT_RETRY_SECONDS)
+        delay = 0.005
+        while True:
+            try:
+                connection.connect(self.socket_path)
+                return
+            except BlockingIOError:
+                if time.monotonic() + delay > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+
+    def _request(self, header: dict) -> tuple:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(self.timeout)
+            self._connect(connection)
+            send_frame(connection, header)
+            frame = receive_frame(connection)
+        if frame is None:
+            raise ConnectionError("The embedding service closed the connection.")
+        response, payload = frame
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response, payload
+
+    def encode_remote(self, texts: List[str]) -> np.ndarray:
+        """
+        Encodes texts through the service.
+
+        Raises:
+            OSError: If the service cannot be reached.
+            ValueError: If the service answers with an error.
+        """
+        response, payload = self._request(
+            {"op": "encode", "model": self.model_name, "texts": texts}
+        )
+        return np.frombuffer(payload, dtype=response["dtype"]).reshape(
+            response["shape"]
+        )
+
+    def stats(self) -> dict:
+        """Returns the counters of the service."""
+        return self._request({"op": "stats"})[0]
+
+    def encode(self, sentences, convert_to_tensor: bool = False, **kwargs):
+        """
+        Encodes a sentence or a list of sentences like SentenceTransformer.encode.
+
+        Returns:
+            A numpy array, or a torch tensor if `convert_to_tensor` is set.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if time.monotonic() < self._unavailable_until:
+            return self.fallback().encode(
+                sentences, convert_to_tensor=convert_to_tensor, **kwargs
+            )
+        try:
+            vectors = self.encode_remote(texts)
+        except (OSError, ValueError) as e:
+            logger.warning(
+                f"Embedding service unavailable, encoding in this process: {e}"
+            )
+            self._unavailable_until = time.monotonic() + self.retry_after
+            return self.fallback().encode(
+                sentences, convert_to_tensor=convert_to_tensor, **kwargs
+            )
+
+        if single:
+            vectors = vectors[0]
+        if convert_to_tensor:
+            import torch
+
+            return torch.from_numpy(vectors.copy())
+        return vectors
+
+
+def service_settings() -> dict:
+    """Returns the "embedding_service" settings from appsettings.json with defaults."""
+    settings = {
+        "enabled": False,
+        "managed": True,
+        "socket": "static/embedding.sock",
+        "batch_window_ms": 10,
+        "max_batch": 256,
+        "cache_entries": 50000,
+        "timeout_seconds": 30,
+    }
+    settings.update(get_setting("embedding_service", {}))
+    return settings
+
+
+def main():
+    from src.utils.data_preparer import DEFAULT_MODEL
+
+    settings = service_settings()
+    parser = argparse.ArgumentParser(
+        description="Serve sentence embeddings to the workers of this host."
+    )
+    parser.add_argument("--socket", default=settings["socket"])
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument(
+        "--batch-window-ms", type=float, default=settings["batch_window_ms"]
+    )
+    parser.add_argument("--max-batch", type=int, default=settings["max_batch"])
+    parser.add_argument("--cache-entries", type=int, default=settings["cache_entries"])
+    args = parser.parse_args()
+
+    EmbeddingService(
+        args.socket,
+        args.model,
+        batch_window=args.batch_window_ms / 1000,
+        max_batch=args.max_batch,
+        cache_entries=args.cache_entries,
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
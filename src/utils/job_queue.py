@@ -0,0 +1,534 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Callable, List, Optional
+from loguru import logger
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+SKIPPED = "skipped"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED, TIMED_OUT)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    record TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    runner_pid INTEGER,
+    runner_boot TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+def _boot_id() -> str:
+    """Returns an id of the current system boot, or "" where there is none."""
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill would terminate the process; assume it is still running.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobInterrupted(Exception):
+    """Raised inside a job when it has to stop before it is finished."""
+
+
+class JobCancelled(JobInterrupted):
+    """Raised inside a job after its cancellation was requested."""
+
+
+class JobTimedOut(JobInterrupted):
+    """Raised inside a job once it ran longer than its timeout."""
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    """
+    A unit of work running on the job queue, split into named stages. Stages can
+    be split further into steps, e.g. one per rendered chart.
+
+    Every stage and step emits a started and a finished event with its duration
+    and details, which clients can follow through `JobQueue.wait_for_events`.
+
+    Cancellation and timeouts are cooperative: they are checked whenever a stage
+    or step starts or a stage finishes, so a running step is completed first. The
+    timeout counts from when the job starts running, not from when it was queued.
+
+    Attributes:
+        id (str): Job id.
+        owner (str): Id of the browser session that submitted the job.
+        kind (str): What the job does, e.g. "analysis".
+        record (dict): Status, stages, message and result as reported to clients.
+    """
+
+    def __init__(
+        self,
+        queue: "JobQueue",
+        owner: str,
+        kind: str,
+        stages: List[str],
+        timeout: float,
+    ):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.kind = kind
+        self._queue = queue
+        self._timeout = timeout
+        self._deadline = None
+        self._seq = 0
+        self._current_stage = None
+        self.record = {
+            "id": self.id,
+            "kind": kind,
+            "status": QUEUED,
+            "stages": [{"name": name, "status": QUEUED} for name in stages],
+            "message": None,
+            "result": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+
+    def start(self):
+        """Marks the job as running and starts its timeout."""
+        if self._timeout:
+            self._deadline = time.monotonic() + self._timeout
+        self.record.update(status=RUNNING, started_at=time.time())
+
+    def check(self):
+        """Raises JobCancelled or JobTimedOut if the job has to stop."""
+        if self._queue.cancel_requested(self.id):
+            raise JobCancelled("The job was cancelled.")
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise JobTimedOut("The job took too long and was stopped.")
+
+    def emit(self, event_type: str, **fields):
+        """
+        Records an event of the job, e.g. emit("stage_started", stage="match").
+
+        Events are numbered per job and stored with the job, so they can be read
+        from every worker process.
+        """
+        self._seq += 1
+        event = {"seq": self._seq, "type": event_type, "time": time.time()}
+        event.update(fields)
+        self._queue.add_event(self.id, event)
+
+    def _stage(self, name: str) -> dict:
+        for stage in self.record["stages"]:
+            if stage["name"] == name:
+                return stage
+        stage = {"name": name, "status": QUEUED}
+        self.record["stages"].append(stage)
+        return stage
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Runs one stage of the job and records its status and duration.
+
+        Yields a dict the stage can fill with details such as row counts, which
+        are reported along with its status.
+        """
+        self.check()
+        stage = self._stage(name)
+        stage.update(status=RUNNING, started_at=time.time())
+        self._queue.save(self)
+        self._current_stage = name
+        self.emit("stage_started", stage=name)
+        start = time.perf_counter()
+        details = {}
+        try:
+            yield details
+        except Exception:
+            self._finish_stage(stage, FAILED, time.perf_counter() - start, details)
+            raise
+        self._finish_stage(stage, SUCCEEDED, time.perf_counter() - start, details)
+        self.check()
+
+    def _finish_stage(self, stage: dict, status: str, seconds: float, details: dict):
+        stage.update(status=status, seconds=seconds)
+        stage.update(details)
+        self._queue.save(self)
+        self._current_stage = None
+        self.emit(
+            "stage_finished",
+            stage=stage["name"],
+            status=status,
+            seconds=seconds,
+            **details,
+        )
+
+    @contextmanager
+    def step(self, name: str, **fields):
+        """
+        Runs one step of the current stage and emits its start and finish events.
+
+        Steps are only reported as events; the job record keeps stage totals.
+
+        Parameters:
+            name (str): What the step does, e.g. "render".
+            **fields: Identify the step in both events, e.g. chart="chart_1.jpg".
+
+        Yields a dict the step can fill with details reported when it finishes.
+        """
+        self.check()
+        stage = self._current_stage
+        self.emit("step_started", stage=stage, step=name, **fields)
+        start = time.perf_counter()
+        details = {}
+        try:
+            yield details
+        except Exception:
+            self.emit(
+                "step_finished",
+                stage=stage,
+                step=name,
+                status=FAILED,
+                seconds=time.perf_counter() - start,
+                **fields,
+                **details,
+            )
+            raise
+        self.emit(
+            "step_finished",
+            stage=stage,
+            step=name,
+            status=SUCCEEDED,
+            seconds=time.perf_counter() - start,
+            **fields,
+            **details,
+        )
+
+
+def job_stage(job: Optional[Job], name: str):
+    """Returns `job.stage(name)`, or a no-op context if the work runs outside a job."""
+    return job.stage(name) if job is not None else nullcontext({})
+
+
+def job_step(job: Optional[Job], name: str, **fields):
+    """Returns `job.step(name, **fields)`, or a no-op context outside a job."""
+    return job.step(name, **fields) if job is not None else nullcontext({})
+
+
+class JobQueue:
+    """
+    Runs jobs on a bounded pool of worker threads.
+
+    Job records and events live in SQLite, so every worker process can report the
+    progress of any job and pass on cancellation requests. Each job also records
+    the process running it; unfinished jobs whose process is gone, e.g. after a
+    restart, are marked as failed by `fail_orphaned_jobs`.
+
+    Attributes:
+        db_path (str): Path of the SQLite database file.
+        max_workers (int): Jobs running at the same time.
+        max_pending (int): Jobs waiting for a worker before submissions are refused.
+        timeout (float): Seconds a job may run; 0 disables the timeout.
+        keep_seconds (float): Finished jobs are removed after this many seconds.
+    """
+
+    # Seconds between two checks for events written by other processes.
+    EVENT_POLL_INTERVAL = 0.5
+
+    def __init__(
+        self,
+        db_path: str,
+        max_workers: int = 2,
+        max_pending: int = 8,
+        timeout: float = 900,
+        keep_seconds: float = 86400,
+    ):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.keep_seconds = keep_seconds
+        self._active = 0
+        self._boot = _boot_id()
+        # Ids of the unfinished jobs of this process.
+        self._jobs = set()
+        self._lock = threading.Lock()
+        # Wakes up readers waiting for events of jobs running in this process.
+        self._events_added = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(jobs)")}
+            if columns and "runner_pid" not in columns:
+                # Databases created before jobs recorded their process.
+                connection.execute("ALTER TABLE jobs ADD COLUMN runner_pid INTEGER")
+                connection.execute("ALTER TABLE jobs ADD COLUMN runner_boot TEXT")
+            connection.executescript(_SCHEMA)
+        self.fail_orphaned_jobs()
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def submit(
+        self, owner: str, kind: str, stages: List[str], function: Callable, *args
+    ) -> str:
+        """
+        Queues `function(job, *args)` and returns the job id.
+
+        The function returns a JSON-serializable result, or raises an exception
+        whose message is reported as the job's error.
+
+        Raises:
+            QueueFullError: If all workers are busy and the queue is full.
+        """
+        with self._lock:
+            if self._active >= self.max_workers + self.max_pending:
+                raise QueueFullError(
+                    "The server is busy with other analyses. Please try again shortly."
+                )
+            self._active += 1
+
+        job = Job(self, owner, kind, stages, self.timeout)
+        with self._lock:
+            self._jobs.add(job.id)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, owner, record, created_at, runner_pid, runner_boot)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    owner,
+                    json.dumps(job.record),
+                    job.record["created_at"],
+                    os.getpid(),
+                    self._boot,
+                ),
+            )
+        self._executor.submit(self._run, job, function, args)
+        logger.info(f"Queued {kind} job {job.id}.")
+        self.prune()
+        return job.id
+
+    def _run(self, job: Job, function: Callable, args: tuple):
+        try:
+            job.check()
+            job.start()
+            self.save(job)
+            job.emit("job_started", kind=job.kind)
+            result = function(job, *args)
+            job.record.update(status=SUCCEEDED, result=result)
+        except JobCancelled as e:
+            job.record.update(status=CANCELLED, message=str(e))
+        except JobTimedOut as e:
+            job.record.update(status=TIMED_OUT, message=str(e))
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+            job.record.update(status=FAILED, message=str(e))
+        finally:
+            with self._lock:
+                self._active -= 1
+        for stage in job.record["stages"]:
+            if stage["status"] in (QUEUED, RUNNING):
+                # Stages a successful job never entered were not needed.
+                succeeded = job.record["status"] == SUCCEEDED
+                stage["status"] = SKIPPED if succeeded else job.record["status"]
+        job.record["finished_at"] = time.time()
+        self.save(job)
+        with self._lock:
+            self._jobs.discard(job.id)
+        job.emit("job_finished", record=job.record)
+        logger.info(f"Job {job.id} finished with status {job.record['status']}.")
+
+    def _runner_alive(self, job_id: str, pid: Optional[int], boot: str) -> bool:
+        if pid is None or boot != self._boot:
+            # Queued before jobs recorded their process, or before a reboot.
+            return False
+        if pid == os.getpid():
+            with self._lock:
+                return job_id in self._jobs
+        return _process_alive(pid)
+
+    def fail_orphaned_jobs(self, job_id: str = None) -> int:
+        """
+        Marks unfinished jobs as failed whose process no longer runs them, e.g.
+        after a restart or a crashed worker. They would be reported as running
+        forever otherwise.
+
+        Parameters:
+            job_id (str): Only check this job; all jobs by default.
+
+        Returns:
+            int: Number of jobs marked as failed.
+        """
+        query = "SELECT id, record, runner_pid, runner_boot FROM jobs"
+        with self._connect() as connection:
+            if job_id is None:
+                rows = connection.execute(query).fetchall()
+            else:
+                rows = connection.execute(query + " WHERE id = ?", (job_id,)).fetchall()
+
+        failed = 0
+        for orphan_id, data, pid, boot in rows:
+            record = json.loads(data)
+            if record["status"] in FINISHED_STATUSES or self._runner_alive(
+                orphan_id, pid, boot
+            ):
+                continue
+            record.update(
+                status=FAILED,
+                message="The job stopped with its server process. Please try again.",
+                finished_at=time.time(),
+            )
+            for stage in record["stages"]:
+                if stage["status"] in (QUEUED, RUNNING):
+                    stage["status"] = FAILED
+            with self._connect() as connection:
+                # Only if the record was not updated in the meantime.
+                updated = connection.execute(
+                    "UPDATE jobs SET record = ? WHERE id = ? AND record = ?",
+                    (json.dumps(record, default=str), orphan_id, data),
+                ).rowcount
+            if updated:
+                logger.warning(f"Job {orphan_id} lost its process, marked as failed.")
+                failed += 1
+        return failed
+
+    def save(self, job: Job):
+        """Stores the current record of a job."""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET record = ? WHERE id = ?",
+                (json.dumps(job.record, default=str), job.id),
+            )
+
+    def add_event(self, job_id: str, event: dict):
+        """Stores an event of a job and wakes up readers waiting for it."""
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                (job_id, event["seq"], json.dumps(event, default=str)),
+            )
+        with self._events_added:
+            self._events_added.notify_all()
+
+    def events(self, job_id: str, after: int = 0) -> List[dict]:
+        """Returns the events of a job numbered above `after`, oldest first."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def wait_for_events(
+        self, job_id: str, after: int = 0, timeout: float = 15
+    ) -> List[dict]:
+        """
+        Waits until a job has events numbered above `after` and returns them.
+
+        Events of jobs running in this process are returned as soon as they are
+        stored; events of jobs running in another process are picked up within
+        `EVENT_POLL_INTERVAL` seconds.
+
+        Returns:
+            list: The new events, or an empty list if none arrived within `timeout`.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.events(job_id, after)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            with self._events_added:
+                self._events_added.wait(min(remaining, self.EVENT_POLL_INTERVAL))
+
+    def get(self, job_id: str, owner: str = None) -> Optional[dict]:
+        """Returns the record of a job, or None if it does not exist or has another owner."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT owner, record, cancel_requested FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None or (owner is not None and row[0] != owner):
+            return None
+        record = json.loads(row[1])
+        record["cancel_requested"] = bool(row[2])
+        return record
+
+    def job_ids(self, owner: str) -> List[str]:
+        """Returns the ids of the jobs of an owner that have not been removed yet."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id FROM jobs WHERE owner = ?", (owner,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def cancel(self, job_id: str, owner: str = None) -> bool:
+        """Requests cancellation of an unfinished job; returns False if there is none."""
+        record = self.get(job_id, owner)
+        if record is None or record["status"] in FINISHED_STATUSES:
+            return False
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,)
+            )
+        logger.info(f"Cancellation of job {job_id} requested.")
+        return True
+
+    def cancel_requested(self, job_id: str) -> bool:
+        """Returns True if cancellation of a job was requested."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def prune(self):
+        """Removes jobs created more than `keep_seconds` ago, with their events."""
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM jobs WHERE created_at < ?",
+                (time.time() - self.keep_seconds,),
+            )
+            connection.execute(
+                "DELETE FROM job_events WHERE job_id NOT IN (SELECT id FROM jobs)"
+            )
@@ -0,0 +1,76 @@
+from collections import deque
+from typing import Iterable, List
+from loguru import logger
+
+
+class KeywordMatcher:
+    """
+    Case-insensitive multi-keyword substring matcher (Aho-Corasick automaton).
+
+    All keywords are compiled into one automaton, so checking a text costs time
+    linear in the length of the text, independent of the number of keywords.
+
+    Attributes:
+        keywords (list of str): The lower-cased keywords the automaton was built from.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = [k.lower() for k in keywords]
+        # An empty keyword is a substring of every text.
+        self._matches_everything = any(k == "" for k in self.keywords)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [False]
+        for keyword in self.keywords:
+            if keyword:
+                self._add(keyword)
+        self._build_failure_links()
+        logger.debug(
+            f"Compiled {len(self.keywords)} keywords into {len(self._goto)} states."
+        )
+
+    def _add(self, keyword: str):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(False)
+            state = next_state
+        self._output[state] = True
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # A state matches if any keyword ending here (or in its suffix) matches.
+                self._output[next_state] = (
+                    self._output[next_state] or self._output[self._fail[next_state]]
+                )
+
+    def matches(self, text: str) -> bool:
+        """Returns True if any keyword occurs in `text`, ignoring case."""
+        if self._matches_everything:
+            return True
+        if len(self._goto) == 1:
+            return False
+
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
@@ -0,0 +1,345 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from loguru import logger
+
+from src.utils.chart_builder import ChartBuilder, ChartSpec
+from src.utils.chart_store import ChartStore
+
+# Name of the file that maps each rendered chart of a folder to its fingerprint.
+FINGERPRINT_INDEX = "fingerprints.json"
+# Name of the file holding the current plan of a folder: its token and the
+# fingerprint of every planned chart. Worker processes share it through the store.
+PLAN_FILE = "plan.json"
+# Number of plans kept per process; the least recently used ones are dropped.
+MAX_PLANS = 64
+
+
+def plan_token(fingerprints: dict) -> str:
+    """Returns a token that identifies a plan by the charts it contains."""
+    data = json.dumps(sorted(fingerprints.items())).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class LazyChartRenderer:
+    """
+    Renders charts on first request instead of up front.
+
+    An analysis registers a chart plan per charts folder. The first request for a
+    chart draws it; concurrent requests for the same chart wait for that single
+    render instead of drawing it again.
+
+    Every rendered chart is recorded with its fingerprint in the folder's
+    fingerprint index. When a plan is registered with `reuse=True` (e.g. when a
+    saved session is loaded), stored charts whose fingerprint still matches are
+    kept and only missing or stale charts are drawn, in the background.
+
+    Plans live in the process that registered them, but the charts are shared by
+    all worker processes. Each plan is therefore also written to the folder's
+    plan file. A process only serves or renders a chart for the plan in that file;
+    if its own plan is older, or missing, it asks `replan` for a current one.
+    A plan is dropped once all of its charts are rendered, unless the store
+    evicts charts, and at most
+    `max_plans` plans are kept; a dropped plan is simply registered again through
+    `replan` when one of its charts has to be drawn once more.
+
+    Attributes:
+        chart_store (ChartStore): Store the charts are rendered into.
+        replan (Callable): Registers the current plan of a charts folder in this
+            process, if it can, and returns True if it did.
+        max_plans (int): Number of plans kept in this process.
+        _plans (OrderedDict): Maps charts folders to their registered plan, least
+            recently used first.
+        _inflight (dict): Maps (charts folder, file name) to the Future of a running render.
+    """
+
+    def __init__(
+        self,
+        chart_store: ChartStore,
+        replan: Optional[Callable[[str], bool]] = None,
+        max_plans: int = MAX_PLANS,
+    ):
+        self.chart_store = chart_store
+        self.replan = replan
+        self.max_plans = max_plans
+        self._plans: "OrderedDict[str, dict]" = OrderedDict()
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+        self._executor = None
+
+    def register(
+        self,
+        chart_builder: ChartBuilder,
+        specs: Dict[str, ChartSpec],
+        reuse: bool = False,
+    ) -> int:
+        """
+        Registers a chart plan and removes charts rendered for an older plan.
+
+        Parameters:
+            chart_builder (ChartBuilder): Builder used to render the charts.
+            specs (dict): Chart file names mapped to their ChartSpec.
+            reuse (bool): Keep stored charts whose fingerprint matches the plan and
+                render the others in the background. Otherwise every stored chart
+                is removed and charts are only rendered when requested.
+
+        Returns:
+            int: Version of the plan.
+        """
+        charts_folder = chart_builder.charts_folder
+        fingerprints = {
+            filename: chart_builder.fingerprint(spec)
+            for filename, spec in specs.items()
+        }
+        token = plan_token(fingerprints)
+        with self._lock:
+            self._version += 1
+            version = self._version
+            if reuse:
+                index = self._keep_matching_charts(charts_folder, fingerprints)
+            else:
+                chart_builder.clear_existing_charts()
+                index = {}
+            plan = {
+                "builder": chart_builder,
+                "specs": specs,
+                "version": version,
+                "token": token,
+                "fingerprints": fingerprints,
+                "index": index,
+            }
+            self._plans.pop(charts_folder, None)
+            self._plans[charts_folder] = plan
+            while len(self._plans) > self.max_plans:
+                dropped, _ = self._plans.popitem(last=False)
+                logger.debug(f"Dropped least recently used chart plan of {dropped}.")
+            self._write_index(charts_folder, index)
+            self.chart_store.put(
+                charts_folder + PLAN_FILE,
+                json.dumps({"token": token, "charts": fingerprints}).encode("utf-8"),
+            )
+            self._drop_if_rendered(plan)
+
+        missing = [filename for filename in specs if filename not in index]
+        logger.info(
+            f"Registered {len(specs)} lazy charts for {charts_folder} (version {version}), "
+            f"{len(specs) - len(missing)} reused."
+        )
+        if reuse and missing:
+            self._render_in_background(charts_folder, version, missing)
+        return version
+
+    def _read_json(self, key: str) -> Optional[dict]:
+        data = self.chart_store.get(key)
+        if not data:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            logger.warning(f"Ignoring unreadable {key}.")
+            return None
+
+    def _read_index(self, charts_folder: str) -> dict:
+        return self._read_json(charts_folder + FINGERPRINT_INDEX) or {}
+
+    def shared_plan(self, charts_folder: str) -> Optional[dict]:
+        """Returns the current plan of a charts folder as stored by any process."""
+        return self._read_json(charts_folder + PLAN_FILE)
+
+    def _is_current(self, plan: dict) -> bool:
+        shared = self.shared_plan(plan["builder"].charts_folder)
+        return shared is not None and shared.get("token") == plan["token"]
+
+    def _drop_if_rendered(self, plan: dict):
+        # Called with the lock held. Every chart is stored, so the plan is only
+        # needed again if one is deleted, and `replan` can register it then.
+        charts_folder = plan["builder"].charts_folder
+        if self.chart_store.evicts:
+            return
+        if self._plans.get(charts_folder) is plan and all(
+            plan["index"].get(filename) == fingerprint
+            for filename, fingerprint in plan["fingerprints"].items()
+        ):
+            del self._plans[charts_folder]
+            logger.debug(f"All charts of {charts_folder} rendered, dropped its plan.")
+
+    def _write_index(self, charts_folder: str, index: dict):
+        self.chart_store.put(
+            charts_folder + FINGERPRINT_INDEX, json.dumps(index).encode("utf-8")
+        )
+
+    def _keep_matching_charts(self, charts_folder: str, fingerprints: dict) -> dict:
+        """
+        Deletes stored charts that are stale or no longer planned.
+
+        Returns:
+            dict: Index of the charts that were kept.
+        """
+        stored = self._read_index(charts_folder)
+        kept = {
+            filename: fingerprint
+            for filename, fingerprint in fingerprints.items()
+            if stored.get(filename) == fingerprint
+            and self.chart_store.exists(charts_folder + filename)
+        }
+        labels_files = {
+            f"{os.path.splitext(filename)[0]}_labels.csv" for filename in kept
+        }
+        for name in self.chart_store.list(charts_folder):
+            if name in (FINGERPRINT_INDEX, PLAN_FILE) or name in kept:
+                continue
+            if name in labels_files:
+                continue
+            self.chart_store.delete(charts_folder + name)
+        return kept
+
+    def _render_in_background(self, charts_folder: str, version: int, filenames):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="chart-render"
+            )
+        self._executor.submit(self._render_missing, charts_folder, version, filenames)
+
+    def _render_missing(self, charts_folder: str, version: int, filenames):
+        for filename in filenames:
+            # Stop once a newer plan replaced the one these charts belong to.
+            if self.version(charts_folder) != version:
+                return
+            try:
+                self.ensure_chart(charts_folder, filename)
+            except Exception as e:
+                logger.warning(f"Background rendering of {filename} failed: {e}")
+
+    def discard(self, charts_folder: str):
+        """Forgets the plan registered for a charts folder."""
+        with self._lock:
+            self._plans.pop(charts_folder, None)
+
+    def has_plan(self, charts_folder: str) -> bool:
+        """Returns True if a plan is registered for the charts folder by any process."""
+        return (
+            charts_folder in self._plans or self.shared_plan(charts_folder) is not None
+        )
+
+    def _planned_fingerprints(self, charts_folder: str) -> dict:
+        plan = self._plans.get(charts_folder)
+        if plan is not None:
+            return plan["fingerprints"]
+        return (self.shared_plan(charts_folder) or {}).get("charts", {})
+
+    def chart_names(self, charts_folder: str) -> List[str]:
+        """Returns the planned chart file names in rendering order."""
+        return list(self._planned_fingerprints(charts_folder))
+
+    def version(self, charts_folder: str) -> int:
+        """Returns the plan version for a charts folder, or 0 if none is registered."""
+        plan = self._plans.get(charts_folder)
+        return plan["version"] if plan else 0
+
+    def fingerprint(self, charts_folder: str, filename: str) -> str:
+        """Returns the fingerprint of a planned chart, or "" if it is not planned."""
+        return self._planned_fingerprints(charts_folder).get(filename, "")
+
+    def ensure_chart(self, charts_folder: str, filename: str) -> str:
+        """
+        Returns the store key of a chart, rendering it first if necessary.
+
+        A stored chart is only returned if it was rendered for the current plan.
+        A chart is only rendered from this process's plan while that plan is the
+        current one; otherwise `replan` is asked for the current plan first.
+
+        Parameters:
+            charts_folder (str): Folder of the session the chart belongs to.
+            filename (str): File name of the chart, e.g. "chart.jpg".
+
+        Returns:
+            str: Store key of the rendered chart.
+
+        Raises:
+            FileNotFoundError: If the chart is neither stored nor planned.
+        """
+        chart_key = charts_folder + filename
+        key = (charts_folder, filename)
+
+        for attempt in range(2):
+            with self._lock:
+                future = self._inflight.get(key)
+                if future is not None:
+                    is_owner = False
+                    break
+                shared = self.shared_plan(charts_folder)
+                fingerprint = (shared or {}).get("charts", {}).get(filename)
+                if self.chart_store.exists(chart_key) and (
+                    fingerprint is None
+                    or self._read_index(charts_folder).get(filename) == fingerprint
+                ):
+                    return chart_key
+
+                plan = self._plans.get(charts_folder)
+                if plan is not None and (
+                    shared is None or shared.get("token") != plan["token"]
+                ):
+                    # Another process planned the folder again, or it was deleted.
+                    logger.debug(f"Dropping outdated chart plan of {charts_folder}.")
+                    self._plans.pop(charts_folder, None)
+                    plan = None
+                if plan is not None:
+                    self._plans.move_to_end(charts_folder)
+                    spec = plan["specs"].get(filename)
+                    if spec is None:
+                        raise FileNotFoundError(f"Chart {filename} not found.")
+                    future = Future()
+                    self._inflight[key] = future
+                    is_owner = True
+                    break
+
+            if attempt == 0 and self.replan is not None and self.replan(charts_folder):
+                continue
+            raise FileNotFoundError(f"Chart {filename} not found.")
+
+        if not is_owner:
+            logger.debug(f"Waiting for running render of {filename}.")
+            return future.result()
+
+        try:
+            logger.info(f"Rendering chart on demand: {filename}")
+            plan["builder"].render_chart(spec)
+            with self._lock:
+                if self._is_current(plan):
+                    index = self._read_index(charts_folder)
+                    index[filename] = plan["fingerprints"][filename]
+                    plan["index"] = index
+                    self._write_index(charts_folder, index)
+                    self._drop_if_rendered(plan)
+                else:
+                    # The folder was planned again while this chart was drawn; the
+                    # image may have replaced one of the new plan, so drop it.
+                    self.chart_store.delete(chart_key)
+                    chart_key = None
+            if chart_key is None:
+                logger.warning(f"Dropped {filename}, its charts were planned again.")
+                future.set_exception(
+                    FileNotFoundError(f"Chart {filename} is outdated.")
+                )
+            else:
+                future.set_result(chart_key)
+        except Exception as e:
+            logger.error(f"Failed to render chart {filename}: {e}", exc_info=True)
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        return future.result()
+
+    def ensure_all(self, charts_folder: str) -> List[str]:
+        """Renders every planned chart that is not stored yet and returns their keys."""
+        return [
+            self.ensure_chart(charts_folder, filename)
+            for filename in self.chart_names(charts_folder)
+        ]
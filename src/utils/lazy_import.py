@@ -0,0 +1,38 @@
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule:
+    """
+    Stands in for a module and imports it on first attribute access.
+
+    Heavy libraries such as torch, sentence_transformers, scipy and matplotlib
+    take seconds to import. Modules that only need them inside functions use a
+    LazyModule instead, so importing the application stays fast and the cost is
+    paid by the first request that actually uses the library.
+
+    Example:
+        stats = LazyModule("scipy.stats")
+        stats.shapiro(values)  # scipy.stats is imported here
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        """Imports the module if that did not happen yet and returns it."""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.load(), attribute)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
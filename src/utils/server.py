@@ -0,0 +1,64 @@
+import os
+import sys
+from loguru import logger
+
+from src.utils.settings import get_setting
+
+# Environment variables read by the OpenMP, MKL, OpenBLAS, Accelerate and numexpr
+# thread pools when they are first loaded.
+COMPUTE_THREAD_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+def server_settings() -> dict:
+    """
+    Returns the "server" settings from appsettings.json with defaults filled in.
+
+    Returns:
+        dict: bind, workers, threads, compute_threads, preload and timeout. Unless
+            set, compute_threads splits the CPUs evenly between the workers, so
+            numerical work in all workers together does not oversubscribe them.
+    """
+    settings = {
+        "bind": f"0.0.0.0:{get_setting('port', 8000)}",
+        "workers": 2,
+        "threads": 8,
+        "compute_threads": None,
+        "preload": True,
+        "timeout": 120,
+    }
+    settings.update(get_setting("server", {}))
+    if not settings["compute_threads"]:
+        settings["compute_threads"] = max(
+            1, (os.cpu_count() or 1) // max(1, settings["workers"])
+        )
+    return settings
+
+
+def limit_compute_threads(threads: int):
+    """
+    Limits the threads torch and the BLAS libraries use for numerical work.
+
+    The environment variables only take effect if they are set before numpy and
+    torch are imported; variables that are already set are left alone. torch is
+    limited directly if it was imported already.
+
+    Parameters:
+        threads (int): Threads per process.
+    """
+    for variable in COMPUTE_THREAD_VARIABLES:
+        os.environ.setdefault(variable, str(threads))
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(threads)
+        except RuntimeError:
+            # Only possible before torch ran any parallel work.
+            pass
+    logger.info(f"Limited numerical work to {threads} threads per process.")
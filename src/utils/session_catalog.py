@@ -0,0 +1,243 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional, Tuple
+from loguru import logger
+
+# Columns the session list can be sorted by, mapped to their SQL expression.
+SORT_COLUMNS = {
+    "updated": "updated_at",
+    "created": "created_at",
+    "name": "name",
+    "size": "size_bytes",
+    "accessed": "accessed_at",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY,
+    survey1_id INTEGER,
+    survey2_id INTEGER,
+    survey1_group TEXT,
+    survey2_group TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    accessed_at TEXT,
+    survey1_rows INTEGER,
+    survey2_rows INTEGER,
+    survey1_questions INTEGER,
+    survey2_questions INTEGER,
+    size_bytes INTEGER,
+    alpha REAL,
+    test_method TEXT,
+    theme TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+CREATE INDEX IF NOT EXISTS sessions_accessed_at ON sessions (accessed_at);
+CREATE INDEX IF NOT EXISTS sessions_created_at ON sessions (created_at);
+CREATE INDEX IF NOT EXISTS sessions_size_bytes ON sessions (size_bytes);
+CREATE INDEX IF NOT EXISTS sessions_survey_ids ON sessions (survey1_id, survey2_id);
+"""
+
+
+def directory_size(path: str) -> int:
+    """Returns the size in bytes of a file or of all files in a directory."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+class SessionCatalog:
+    """
+    SQLite index of the saved sessions and their metadata.
+
+    The session list is served from indexed, paginated queries on this catalog
+    instead of reading the sessions directory, so it stays fast with thousands of
+    sessions. The catalog is updated whenever a session is saved, updated or
+    deleted, and `sync` reconciles it with the sessions directory.
+
+    Attributes:
+        db_path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            columns = {
+                row["name"] for row in connection.execute("PRAGMA table_info(sessions)")
+            }
+            if columns and "accessed_at" not in columns:
+                # Catalogs created before retention existed lack the access time.
+                connection.execute("ALTER TABLE sessions ADD COLUMN accessed_at TEXT")
+                connection.execute("UPDATE sessions SET accessed_at = updated_at")
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def upsert(self, name: str, manifest: Optional[dict], size_bytes: int):
+        """
+        Adds or updates the catalog entry of a session.
+
+        Parameters:
+            name (str): Session name, e.g. "18-10-2026_1-2.session".
+            manifest (dict): Session manifest, or None for legacy sessions.
+            size_bytes (int): Size of the session on disk.
+        """
+        manifest = manifest or {}
+        surveys = manifest.get("surveys", {})
+        survey1 = surveys.get("survey_1", {})
+        survey2 = surveys.get("survey_2", {})
+        now = datetime.now().isoformat(timespec="seconds")
+        row = {
+            "name": name,
+            "survey1_id": survey1.get("survey_id"),
+            "survey2_id": survey2.get("survey_id"),
+            "survey1_group": survey1.get("group"),
+            "survey2_group": survey2.get("group"),
+            "created_at": manifest.get("created_at") or manifest.get("saved_at") or now,
+            "updated_at": manifest.get("saved_at") or now,
+            "accessed_at": manifest.get("saved_at") or now,
+            "survey1_rows": survey1.get("participant_count"),
+            "survey2_rows": survey2.get("participant_count"),
+            "survey1_questions": len(survey1.get("questions", [])) or None,
+            "survey2_questions": len(survey2.get("questions", [])) or None,
+            "size_bytes": size_bytes,
+            "alpha": manifest.get("alpha"),
+            "test_method": manifest.get("test_method"),
+            "theme": manifest.get("selected_theme_name"),
+        }
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{column}" for column in row)
+        updates = ", ".join(
+            f"{column} = excluded.{column}"
+            for column in row
+            if column not in ("name", "created_at")
+        )
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                f"INSERT INTO sessions ({columns}) VALUES ({placeholders}) "
+                f"ON CONFLICT(name) DO UPDATE SET {updates}",
+                row,
+            )
+
+    def touch(self, name: str):
+        """Records that a session was just used, e.g. loaded."""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "UPDATE sessions SET accessed_at = ? WHERE name = ?", (now, name)
+            )
+
+    def delete(self, name: str):
+        """Removes a session from the catalog."""
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM sessions WHERE name = ?", (name,))
+
+    def get(self, name: str) -> Optional[dict]:
+        """Returns the catalog entry of a session, or None."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM sessions WHERE name = ?", (name,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def names(self) -> List[str]:
+        """Returns the names of all cataloged sessions."""
+        with self._connect() as connection:
+            return [row[0] for row in connection.execute("SELECT name FROM sessions")]
+
+    def least_recently_used(self) -> List[dict]:
+        """Returns name, last access time and size of all sessions, oldest access first."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT name, COALESCE(accessed_at, updated_at) AS accessed_at, "
+                "size_bytes FROM sessions ORDER BY accessed_at, name"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def query(
+        self,
+        search: str = "",
+        sort: str = "updated",
+        descending: bool = True,
+        page: int = 1,
+        per_page: int = 25,
+    ) -> Tuple[List[dict], int]:
+        """
+        Returns one page of sessions.
+
+        Parameters:
+            search (str): Only sessions whose name or groups contain this text.
+            sort (str): One of SORT_COLUMNS.
+            descending (bool): Sort order.
+            page (int): 1-based page number.
+            per_page (int): Sessions per page.
+
+        Returns:
+            tuple: (sessions on the page as dicts, total number of matching sessions).
+        """
+        order_column = SORT_COLUMNS.get(sort, SORT_COLUMNS["updated"])
+        direction = "DESC" if descending else "ASC"
+        where, parameters = "", []
+        if search:
+            pattern = f"%{search}%"
+            where = "WHERE name LIKE ? OR survey1_group LIKE ? OR survey2_group LIKE ?"
+            parameters = [pattern, pattern, pattern]
+
+        per_page = max(int(per_page), 1)
+        offset = (max(int(page), 1) - 1) * per_page
+        with self._connect() as connection:
+            total = connection.execute(
+                f"SELECT COUNT(*) FROM sessions {where}", parameters
+            ).fetchone()[0]
+            rows = connection.execute(
+                f"SELECT * FROM sessions {where} "
+                f"ORDER BY {order_column} {direction}, name LIMIT ? OFFSET ?",
+                parameters + [per_page, offset],
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def sync(self, session_names: List[str], read_metadata, sessions_path: str):
+        """
+        Reconciles the catalog with the sessions on disk.
+
+        Only sessions missing from the catalog are read, so syncing an up to date
+        catalog costs one directory listing.
+
+        Parameters:
+            session_names (list of str): Names of the sessions on disk.
+            read_metadata (Callable): Returns the manifest of a session path, or
+                None if it has none.
+            sessions_path (str): Directory containing the sessions.
+        """
+        on_disk = set(session_names)
+        cataloged = set(self.names())
+        for name in cataloged - on_disk:
+            self.delete(name)
+        for name in on_disk - cataloged:
+            path = os.path.join(sessions_path, name)
+            try:
+                self.upsert(name, read_metadata(path), directory_size(path))
+            except Exception as e:
+                logger.warning(f"Could not catalog session {name}: {e}")
+        logger.info(
+            f"Session catalog synced: {len(on_disk - cataloged)} added, "
+            f"{len(cataloged - on_disk)} removed."
+        )
@@ -0,0 +1,619 @@
+import dataclasses
+import gzip
+import json
+import lzma
+import os
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from loguru import logger
+
+from src.models.question import Question
+from src.models.result import Answer, Result
+from src.models.survey import AVG, SD, Survey
+
+FORMAT_VERSION = 1
+SESSION_SUFFIX = ".session"
+MANIFEST_FILE = "manifest.json"
+DELTA_PREFIX = "delta-"
+SURVEY_KEYS = ("survey_1", "survey_2")
+SETTINGS_KEYS = ("selected_theme_name", "alpha", "test_method", "isNormalized")
+
+# Block compressions: lz4 and zstd compress buffers inside the Arrow file, gzip and
+# lzma compress the whole file.
+COMPRESSIONS = ("none", "lz4", "zstd", "gzip", "lzma")
+IPC_CODECS = ("lz4", "zstd")
+FILE_CODECS = {"gzip": (".gz", gzip.open), "lzma": (".xz", lzma.open)}
+
+# Answer kinds in the answers block; they restore the Python type of each answer.
+KIND_NONE = 0
+KIND_INT = 1
+KIND_FLOAT = 2
+KIND_TEXT = 3
+
+
+def is_session_directory(path: str) -> bool:
+    """Returns True if `path` is a session stored in the columnar format."""
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def _json_default(value):
+    """Converts numpy scalars, which json cannot handle, into Python values."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def read_manifest(session_path: str) -> dict:
+    """
+    Reads only the manifest of a session, without touching its data blocks.
+
+    Parameters:
+        session_path (str): Session directory.
+
+    Returns:
+        dict: The manifest.
+
+    Raises:
+        FileNotFoundError: If the session has no manifest.
+        ValueError: If the session was written by a newer format version.
+    """
+    with open(os.path.join(session_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    version = manifest.get("format_version")
+    if not isinstance(version, int) or version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported session format version: {version}")
+    return manifest
+
+
+def _write_json(path: str, data: dict):
+    """Writes JSON to a temporary file and renames it into place."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=_json_default)
+    os.replace(temp_path, path)
+
+
+def write_manifest(session_path: str, manifest: dict):
+    """Writes the manifest of a session through a temporary file."""
+    _write_json(os.path.join(session_path, MANIFEST_FILE), manifest)
+
+
+# -----------------------------------------------------------------------------------------
+# Arrow blocks
+
+
+def resolve_compression(compression: str) -> str:
+    """
+    Validates a compression name and falls back to gzip if a fast codec is missing.
+
+    Parameters:
+        compression (str): One of COMPRESSIONS.
+
+    Returns:
+        str: The compression that will be used.
+
+    Raises:
+        ValueError: If the compression is unknown.
+    """
+    compression = (compression or "none").lower()
+    if compression not in COMPRESSIONS:
+        raise ValueError(
+            f"Unsupported session compression '{compression}'. "
+            f"Use one of: {', '.join(COMPRESSIONS)}."
+        )
+    if compression in IPC_CODECS and not pa.Codec.is_available(compression):
+        logger.warning(f"Codec {compression} is not available, using gzip instead.")
+        return "gzip"
+    return compression
+
+
+def write_table(path: str, table: pa.Table, compression: str = "none") -> str:
+    """
+    Writes a table as an Arrow IPC file.
+
+    lz4 and zstd compress the buffers inside the IPC file, which keeps the file
+    mappable. gzip and lzma compress the whole file and add ".gz" or ".xz" to its
+    name.
+
+    Parameters:
+        path (str): Path of the block.
+        table (pa.Table): Data to write.
+        compression (str): One of COMPRESSIONS.
+
+    Returns:
+        str: Path the block was written to.
+    """
+    options = None
+    if compression in IPC_CODECS:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+
+    if compression in FILE_CODECS:
+        suffix, opener = FILE_CODECS[compression]
+        path += suffix
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        with opener(path, "wb") as f:
+            f.write(sink.getvalue())
+        return path
+
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    return path
+
+
+def read_table(path: str) -> pa.Table:
+    """
+    Memory-maps an Arrow IPC file.
+
+    The returned table references the mapped file instead of copying it, so only
+    the pages that are actually read are loaded from disk. Blocks compressed as a
+    whole (".gz", ".xz") are decompressed into memory instead.
+    """
+    for suffix, opener in FILE_CODECS.values():
+        if path.endswith(suffix):
+            with opener(path, "rb") as f:
+                source = pa.BufferReader(f.read())
+            return pa.ipc.open_file(source).read_all()
+
+    source = pa.memory_map(path, "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def dataframe_to_table(df: pd.DataFrame) -> pa.Table:
+    """Converts a DataFrame to an Arrow table, storing mixed object columns as text."""
+    if df is None:
+        df = pd.DataFrame()
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        logger.debug("Storing mixed-type DataFrame columns as text.")
+        df = df.copy()
+        for column in df.columns:
+            if df[column].dtype == object:
+                df[column] = df[column].map(
+                    lambda value: None if pd.isna(value) else str(value)
+                )
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _answer_kind(value):
+    """Returns (kind, number, text) for one answer value."""
+    if value is None:
+        return KIND_NONE, None, None
+    if isinstance(value, (bool, np.bool_)):
+        return KIND_INT, float(value), None
+    if isinstance(value, (int, np.integer)):
+        return KIND_INT, float(value), None
+    if isinstance(value, (float, np.floating)):
+        return KIND_FLOAT, float(value), None
+    return KIND_TEXT, None, str(value)
+
+
+def answers_to_table(results: List[Result]) -> pa.Table:
+    """
+    Flattens the answers of all results into one long table with a row per answer.
+
+    Numeric answers go into the `number` column and everything else into the
+    dictionary-encoded `text` column; `kind` records which one holds the value.
+    """
+    rows, question_ids, kinds, numbers, texts = [], [], [], [], []
+    for row, result in enumerate(results):
+        for answer in result.answers:
+            kind, number, text = _answer_kind(answer.answer)
+            rows.append(row)
+            question_ids.append(answer.question_id)
+            kinds.append(kind)
+            numbers.append(number)
+            texts.append(text)
+    return pa.table(
+        {
+            "row": pa.array(rows, type=pa.int32()),
+            "question_id": pa.array(question_ids, type=pa.int32()),
+            "kind": pa.array(kinds, type=pa.int8()),
+            "number": pa.array(numbers, type=pa.float64()),
+            "text": pa.array(texts, type=pa.string()).dictionary_encode(),
+        }
+    )
+
+
+def participants_to_table(results: List[Result]) -> pa.Table:
+    """Returns a table with the participant and survey id of every result."""
+    participant_ids = [result.participant_id for result in results]
+    try:
+        participants = pa.array(participant_ids)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        participants = pa.array([str(p) for p in participant_ids], type=pa.string())
+    return pa.table(
+        {
+            "participant_id": participants,
+            "survey_id": pa.array(
+                [result.survey_id for result in results], type=pa.int64()
+            ),
+        }
+    )
+
+
+def results_from_tables(participants: pa.Table, answers: pa.Table) -> List[Result]:
+    """Rebuilds the results of a survey from its participants and answers blocks."""
+    participant_ids = participants.column("participant_id").to_pylist()
+    survey_ids = participants.column("survey_id").to_pylist()
+    results = [
+        Result(participant_id, survey_id, [])
+        for participant_id, survey_id in zip(participant_ids, survey_ids)
+    ]
+
+    rows = answers.column("row").to_pylist()
+    question_ids = answers.column("question_id").to_pylist()
+    kinds = answers.column("kind").to_pylist()
+    numbers = answers.column("number").to_pylist()
+    texts = answers.column("text").to_pylist()
+    for row, question_id, kind, number, text in zip(
+        rows, question_ids, kinds, numbers, texts
+    ):
+        if kind == KIND_INT:
+            value = int(number)
+        elif kind == KIND_FLOAT:
+            value = number
+        elif kind == KIND_TEXT:
+            value = text
+        else:
+            value = None
+        results[row].answers.append(Answer(question_id=question_id, answer=value))
+    return results
+
+
+def statistics_to_table(statistics: Optional[dict]) -> pa.Table:
+    """Returns the per-question average and standard deviation as a table."""
+    statistics = statistics or {}
+    return pa.table(
+        {
+            "question_id": pa.array(list(statistics.keys()), type=pa.int32()),
+            AVG: pa.array([s[AVG] for s in statistics.values()], type=pa.float64()),
+            SD: pa.array([s[SD] for s in statistics.values()], type=pa.float64()),
+        }
+    )
+
+
+def statistics_from_table(table: pa.Table) -> dict:
+    """Rebuilds the statistics dictionary of a survey."""
+    return {
+        question_id: {AVG: avg, SD: sd}
+        for question_id, avg, sd in zip(
+            table.column("question_id").to_pylist(),
+            table.column(AVG).to_pylist(),
+            table.column(SD).to_pylist(),
+        )
+    }
+
+
+class LazyResults(list):
+    """
+    List of results that is filled from the session blocks on first access.
+
+    Loading a session therefore only reads its manifest and maps its blocks;
+    the Result objects are built when the answers are actually used.
+    """
+
+    def __init__(self, loader: Callable[[], List[Result]]):
+        super().__init__()
+        self._loader = loader
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._loader is None:
+            return
+        with self._lock:
+            if self._loader is not None:
+                super().extend(self._loader())
+                self._loader = None
+
+    def __iter__(self):
+        self._load()
+        return super().__iter__()
+
+    def __len__(self):
+        self._load()
+        return super().__len__()
+
+    def __getitem__(self, index):
+        self._load()
+        return super().__getitem__(index)
+
+    def __eq__(self, other):
+        self._load()
+        return super().__eq__(other)
+
+    def __repr__(self):
+        self._load()
+        return super().__repr__()
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def append(self, item):
+        self._load()
+        super().append(item)
+
+    def extend(self, items):
+        self._load()
+        super().extend(items)
+
+
+# -----------------------------------------------------------------------------------------
+# Sessions
+
+
+def _survey_blocks(key: str, tag: str = "") -> dict:
+    return {
+        "dataframe": f"{key}{tag}.dataframe.arrow",
+        "participants": f"{key}{tag}.participants.arrow",
+        "answers": f"{key}{tag}.answers.arrow",
+        "statistics": f"{key}{tag}.statistics.arrow",
+    }
+
+
+def _write_block(
+    session_path: str, name: str, table: pa.Table, compression: str
+) -> str:
+    """Writes one block and returns its file name inside the session."""
+    return os.path.basename(
+        write_table(os.path.join(session_path, name), table, compression)
+    )
+
+
+def _is_block(name: str) -> bool:
+    return name.endswith(".arrow") or any(
+        name.endswith(".arrow" + suffix) for suffix, _ in FILE_CODECS.values()
+    )
+
+
+def _write_survey(
+    session_path: str,
+    key: str,
+    survey: Survey,
+    tag: str = "",
+    compression: str = "none",
+) -> dict:
+    """Writes the blocks of a survey and returns its manifest entry."""
+    tables = {
+        "dataframe": dataframe_to_table(survey.dataframe),
+        "participants": participants_to_table(survey.results),
+        "answers": answers_to_table(survey.results),
+        "statistics": statistics_to_table(survey.statistics),
+    }
+    blocks = {
+        name: _write_block(session_path, file_name, tables[name], compression)
+        for name, file_name in _survey_blocks(key, tag).items()
+    }
+    return {
+        "survey_id": survey.survey_id,
+        "group": survey.group,
+        "survey_type": survey.survey_type,
+        "participant_count": len(survey.results),
+        "questions": [dataclasses.asdict(q) for q in survey.questions],
+        "blocks": blocks,
+    }
+
+
+def _write_summary(
+    session_path: str,
+    summary_table: pd.DataFrame,
+    tag: str = "",
+    compression: str = "none",
+) -> str:
+    """Writes the summary table block and returns its file name."""
+    return _write_block(
+        session_path,
+        f"summary{tag}.arrow",
+        dataframe_to_table(summary_table),
+        compression,
+    )
+
+
+def write_session(session_path: str, state: dict, compression: str = "none"):
+    """
+    Writes a session state as a manifest plus Arrow blocks into `session_path`.
+
+    Parameters:
+        session_path (str): Empty or new directory for the session.
+        state (dict): Session state as built by the session routes.
+        compression (str): Block compression, one of COMPRESSIONS.
+    """
+    compression = resolve_compression(compression)
+    os.makedirs(session_path, exist_ok=True)
+    surveys = {
+        key: _write_survey(session_path, key, state[key], compression=compression)
+        for key in SURVEY_KEYS
+        if state.get(key) is not None
+    }
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "saved_at": datetime.now().isoformat(timespec="seconds"),
+        "compacted_seq": 0,
+        **{key: state.get(key) for key in SETTINGS_KEYS},
+        "surveys": surveys,
+        "summary_block": _write_summary(
+            session_path, state.get("global_summary_table"), compression=compression
+        ),
+        "compression": compression,
+    }
+    write_manifest(session_path, manifest)
+
+
+# -----------------------------------------------------------------------------------------
+# Delta records
+
+
+def delta_files(session_path: str) -> List[Tuple[int, str]]:
+    """Returns (sequence number, file name) of all delta records, oldest first."""
+    deltas = []
+    for name in os.listdir(session_path):
+        if name.startswith(DELTA_PREFIX) and name.endswith(".json"):
+            try:
+                deltas.append((int(name[len(DELTA_PREFIX) : -len(".json")]), name))
+            except ValueError:
+                continue
+    return sorted(deltas)
+
+
+def _apply_delta(manifest: dict, delta: dict):
+    manifest.update(delta.get("settings", {}))
+    manifest["surveys"].update(delta.get("surveys", {}))
+    if delta.get("summary_block"):
+        manifest["summary_block"] = delta["summary_block"]
+    manifest["saved_at"] = delta.get("saved_at", manifest.get("saved_at"))
+
+
+def read_merged_manifest(session_path: str) -> dict:
+    """
+    Returns the manifest with all delta records that were not compacted yet applied.
+
+    Parameters:
+        session_path (str): Session directory.
+
+    Returns:
+        dict: The current manifest of the session.
+    """
+    manifest = read_manifest(session_path)
+    compacted_seq = manifest.get("compacted_seq", 0)
+    for seq, name in delta_files(session_path):
+        if seq <= compacted_seq:
+            # Left behind by a compaction that stopped before deleting it.
+            continue
+        with open(os.path.join(session_path, name), "r", encoding="utf-8") as f:
+            _apply_delta(manifest, json.load(f))
+        manifest["last_seq"] = seq
+    return manifest
+
+
+def append_delta(session_path: str, changes: dict, compression: str = "none") -> int:
+    """
+    Records changed parts of a session state as a new delta record.
+
+    Settings are stored in the record itself. A changed survey or summary table is
+    written as new blocks that the record points to, so existing blocks are never
+    modified. The record is written to a temporary file and renamed into place,
+    which makes every update atomic.
+
+    Parameters:
+        session_path (str): Session directory.
+        changes (dict): The changed keys of the session state.
+        compression (str): Compression of new blocks, one of COMPRESSIONS.
+
+    Returns:
+        int: Sequence number of the new record.
+    """
+    compression = resolve_compression(compression)
+    manifest = read_manifest(session_path)
+    deltas = delta_files(session_path)
+    seq = max([manifest.get("compacted_seq", 0)] + [s for s, _ in deltas]) + 1
+    tag = f".{seq}"
+
+    delta = {
+        "seq": seq,
+        "saved_at": datetime.now().isoformat(timespec="seconds"),
+        "settings": {key: changes[key] for key in SETTINGS_KEYS if key in changes},
+        "surveys": {
+            key: _write_survey(session_path, key, changes[key], tag, compression)
+            for key in SURVEY_KEYS
+            if changes.get(key) is not None
+        },
+    }
+    if "global_summary_table" in changes:
+        delta["summary_block"] = _write_summary(
+            session_path, changes["global_summary_table"], tag, compression
+        )
+
+    _write_json(os.path.join(session_path, f"{DELTA_PREFIX}{seq:08d}.json"), delta)
+    return seq
+
+
+def compact_session(session_path: str) -> int:
+    """
+    Folds all delta records into the manifest and removes unreferenced blocks.
+
+    The new manifest is written before any record is deleted, and records up to
+    its `compacted_seq` are ignored when reading, so a crash at any point leaves
+    a readable session.
+
+    Parameters:
+        session_path (str): Session directory.
+
+    Returns:
+        int: Number of delta records that were folded in.
+    """
+    deltas = delta_files(session_path)
+    if not deltas:
+        return 0
+
+    manifest = read_merged_manifest(session_path)
+    manifest["compacted_seq"] = max(
+        manifest.get("compacted_seq", 0), manifest.pop("last_seq", 0)
+    )
+    write_manifest(session_path, manifest)
+
+    referenced = {manifest["summary_block"]}
+    for info in manifest["surveys"].values():
+        referenced.update(info["blocks"].values())
+    for name in os.listdir(session_path):
+        is_old_delta = any(name == delta_name for _, delta_name in deltas)
+        if is_old_delta or (_is_block(name) and name not in referenced):
+            os.remove(os.path.join(session_path, name))
+    return len(deltas)
+
+
+def _load_survey(session_path: str, info: dict) -> Survey:
+    # Mapping a block only reads its footer. The blocks are mapped right away so
+    # the results can still be built after a compaction removed the files.
+    blocks = {
+        name: read_table(os.path.join(session_path, file_name))
+        for name, file_name in info["blocks"].items()
+    }
+
+    def load_results():
+        return results_from_tables(blocks["participants"], blocks["answers"])
+
+    return Survey(
+        survey_id=info["survey_id"],
+        group=info["group"],
+        survey_type=info["survey_type"],
+        questions=[Question(**q) for q in info["questions"]],
+        results=LazyResults(load_results),
+        dataframe=blocks["dataframe"].to_pandas(),
+        statistics=statistics_from_table(blocks["statistics"]),
+    )
+
+
+def read_session(session_path: str) -> dict:
+    """
+    Reads a session written by `write_session`, including its delta records.
+
+    Parameters:
+        session_path (str): Session directory.
+
+    Returns:
+        dict: The session state; survey results are materialized on first use.
+    """
+    manifest = read_merged_manifest(session_path)
+    state = {key: manifest.get(key) for key in SETTINGS_KEYS}
+    for key in SURVEY_KEYS:
+        info = manifest["surveys"].get(key)
+        state[key] = _load_survey(session_path, info) if info else None
+
+    summary = read_table(os.path.join(session_path, manifest["summary_block"]))
+    summary_table = summary.to_pandas()
+    state["global_summary_table"] = summary_table
+    state["global_results"] = (
+        summary_table.set_index("Question").T.to_dict()
+        if "Question" in summary_table.columns
+        else {}
+    )
+    return state
@@ -1,59 +1,101 @@
+import argparse
 import os
 import pickle
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from loguru import logger
+from src.utils.session_format import (
+    COMPRESSIONS,
+    SESSION_SUFFIX,
+    append_delta,
+    compact_session,
+    delta_files,
+    is_session_directory,
+    read_manifest,
+    read_merged_manifest,
+    read_session,
+    write_session,
+)
 
+LEGACY_SUFFIX = ".pkl"
+# Number of delta records after which a session is compacted in the background.
+COMPACTION_THRESHOLD = 16
 
-def save_session_state(session_data: dict, save_path: str):
+_session_locks = {}
+_session_locks_guard = threading.Lock()
+_compaction_executor = None
+
+
+def _session_lock(session_path: str) -> threading.RLock:
+    """Returns the lock serializing writes and compactions of one session."""
+    with _session_locks_guard:
+        return _session_locks.setdefault(
+            os.path.abspath(session_path), threading.RLock()
+        )
+
+
+def save_session_state(
+    session_data: dict,
+    save_path: str,
+    compression: str = "none",
+    sync: bool = True,
+    raise_errors: bool = False,
+):
     """
-    Saves the current session state to a specified file path.
+    Saves the current session state to a specified session directory.
 
-    Converts any DataFrames within `session_data` to dictionaries for serializability
-    before saving, ensuring compatibility with the pickle format.
+    The session is written as a JSON manifest plus Arrow blocks into a temporary
+    directory that then replaces the previous version, so a crash while saving
+    never leaves a half-written session behind.
 
     Parameters:
         session_data (dict): Dictionary containing session data to be saved.
-        save_path (str): File path where session data will be saved.
+        save_path (str): Session directory where session data will be saved.
+        compression (str): Block compression: none, lz4, zstd, gzip or lzma.
+        sync (bool): Flush the session to disk before returning. Batched writers
+            pass False and call `sync_session` once per batch.
+        raise_errors (bool): Re-raise a failure after logging it, for callers
+            that must not treat the session as saved.
     """
     logger.info(f"Saving session state to {save_path}.")
     try:
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
-        # Convert DataFrames to dictionaries
-        if isinstance(session_data.get("survey_file_1"), pd.DataFrame):
-            session_data["survey_file_1"] = session_data["survey_file_1"].to_dict()
-        if isinstance(session_data.get("survey_file_2"), pd.DataFrame):
-            session_data["survey_file_2"] = session_data["survey_file_2"].to_dict()
-        if isinstance(session_data.get("global_summary_table"), pd.DataFrame):
-            session_data["global_summary_table"] = session_data[
-                "global_summary_table"
-            ].to_dict()
-
-        # Save the global results
-        if isinstance(session_data.get("global_results"), dict):
-            session_data["global_results"] = session_data["global_results"]
-
-        with open(save_path, "wb") as f:
-            pickle.dump(session_data, f)
+        temp_path = f"{save_path}.{os.getpid()}.tmp"
+        old_path = f"{save_path}.{os.getpid()}.old"
+        with _session_lock(save_path):
+            shutil.rmtree(temp_path, ignore_errors=True)
+            write_session(temp_path, session_data, compression)
+
+            if os.path.exists(save_path):
+                os.replace(save_path, old_path)
+            os.replace(temp_path, save_path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            if sync:
+                sync_session(save_path)
         logger.info(f"Session state saved successfully to {save_path}.")
     except Exception as e:
         logger.error(f"Failed to save session state: {e}", exc_info=True)
+        if raise_errors:
+            raise
 
 
 def load_session_state(session_path: str):
     """
-    Loads session state from a specified file path.
+    Loads session state from a specified session directory.
 
-    Converts dictionaries back to DataFrames for survey data if necessary.
+    Sessions saved as pickle files by earlier versions are still readable.
 
     Parameters:
-        session_path (str): File path from which session data will be loaded.
+        session_path (str): Session directory (or legacy .pkl file) to load.
 
     Returns:
         dict: Loaded session data with DataFrames restored.
 
     Raises:
-        FileNotFoundError: If the specified session file does not exist.
+        FileNotFoundError: If the specified session does not exist.
     """
     logger.info(f"Loading session state from {session_path}.")
     try:
@@ -61,21 +103,215 @@ def load_session_state(session_path: str):
             logger.error(f"Session file not found: {session_path}.")
             raise FileNotFoundError("Session not found.")
 
-        with open(session_path, "rb") as f:
-            state = pickle.load(f)
-
-        # Convert dictionaries back to DataFrames
-        if isinstance(state.get("survey_file_1"), dict):
-            state["survey_file_1"] = pd.DataFrame.from_dict(state["survey_file_1"])
-        if isinstance(state.get("survey_file_2"), dict):
-            state["survey_file_2"] = pd.DataFrame.from_dict(state["survey_file_2"])
-        if isinstance(state.get("global_summary_table"), dict):
-            state["global_summary_table"] = pd.DataFrame.from_dict(
-                state["global_summary_table"]
-            )
+        if session_path.endswith(LEGACY_SUFFIX):
+            state = _load_pickle_session(session_path)
+        else:
+            state = read_session(session_path)
 
         logger.info(f"Session state loaded successfully from {session_path}.")
         return state
     except Exception as e:
         logger.error(f"Failed to load session state: {e}", exc_info=True)
         raise
+
+
+def update_session_state(
+    session_path: str, changes: dict, compression: str = "none", sync: bool = True
+):
+    """
+    Records changes to an existing session without rewriting it.
+
+    The changes are appended as a delta record, so saving a theme costs a few
+    hundred bytes. Once `COMPACTION_THRESHOLD` records have piled up, they are
+    folded into the manifest on a background thread.
+
+    Parameters:
+        session_path (str): Session directory.
+        changes (dict): The changed keys of the session state, e.g.
+            {"selected_theme_name": "dark"}.
+        compression (str): Compression of changed data blocks.
+        sync (bool): Flush the session to disk before returning.
+
+    Raises:
+        FileNotFoundError: If the session does not exist.
+    """
+    logger.info(f"Updating session {session_path} with {sorted(changes)}.")
+    if not is_session_directory(session_path):
+        raise FileNotFoundError("Session not found.")
+
+    with _session_lock(session_path):
+        seq = append_delta(session_path, changes, compression)
+        pending = len(delta_files(session_path))
+        if sync:
+            sync_session(session_path)
+    logger.debug(f"Wrote delta record {seq}, {pending} pending compaction.")
+
+    if pending >= COMPACTION_THRESHOLD:
+        schedule_compaction(session_path)
+
+
+def sync_session(session_path: str):
+    """
+    Flushes all files of a session, the session directory and its parent to disk.
+
+    Parameters:
+        session_path (str): Session directory.
+    """
+    for name in os.listdir(session_path):
+        path = os.path.join(session_path, name)
+        if os.path.isfile(path):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+    for directory in (session_path, os.path.dirname(os.path.abspath(session_path))):
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def compact_session_state(session_path: str) -> int:
+    """Folds the delta records of a session into its manifest."""
+    try:
+        with _session_lock(session_path):
+            if not is_session_directory(session_path):
+                return 0
+            compacted = compact_session(session_path)
+            sync_session(session_path)
+        logger.info(f"Compacted {compacted} delta records of {session_path}.")
+        return compacted
+    except Exception as e:
+        logger.error(f"Failed to compact session {session_path}: {e}", exc_info=True)
+        return 0
+
+
+def schedule_compaction(session_path: str):
+    """Compacts a session on the background compaction thread."""
+    global _compaction_executor
+    with _session_locks_guard:
+        if _compaction_executor is None:
+            _compaction_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="session-compaction"
+            )
+    _compaction_executor.submit(compact_session_state, session_path)
+
+
+def load_session_metadata(session_path: str) -> dict:
+    """
+    Returns the manifest of a session without loading any survey data.
+
+    Parameters:
+        session_path (str): Session directory.
+
+    Returns:
+        dict: The session manifest with pending delta records applied.
+    """
+    return read_merged_manifest(session_path)
+
+
+def list_session_names(sessions_path: str) -> list:
+    """Returns the names of all sessions (and not yet converted pickle sessions)."""
+    if not os.path.isdir(sessions_path):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(sessions_path)
+        if name.endswith(LEGACY_SUFFIX)
+        or (
+            name.endswith(SESSION_SUFFIX)
+            and is_session_directory(os.path.join(sessions_path, name))
+        )
+    )
+
+
+def _load_pickle_session(session_path: str) -> dict:
+    """Loads a session saved as a pickle file by earlier versions."""
+    with open(session_path, "rb") as f:
+        state = pickle.load(f)
+
+    # Convert dictionaries back to DataFrames
+    if isinstance(state.get("survey_file_1"), dict):
+        state["survey_file_1"] = pd.DataFrame.from_dict(state["survey_file_1"])
+    if isinstance(state.get("survey_file_2"), dict):
+        state["survey_file_2"] = pd.DataFrame.from_dict(state["survey_file_2"])
+    if isinstance(state.get("global_summary_table"), dict):
+        state["global_summary_table"] = pd.DataFrame.from_dict(
+            state["global_summary_table"]
+        )
+    return state
+
+
+def convert_pickle_session(
+    pickle_path: str, remove_original: bool = False, compression: str = "none"
+) -> str:
+    """
+    Converts a pickle session into the columnar session format.
+
+    Parameters:
+        pickle_path (str): Path of the .pkl session.
+        remove_original (bool): Delete the .pkl file once the conversion succeeded.
+        compression (str): Block compression of the converted session.
+
+    Returns:
+        str: Path of the converted session directory.
+    """
+    session_path = os.path.splitext(pickle_path)[0] + SESSION_SUFFIX
+    logger.info(f"Converting {pickle_path} to {session_path}.")
+    state = _load_pickle_session(pickle_path)
+    save_session_state(state, session_path, compression, raise_errors=True)
+
+    # Reading the manifest back makes sure the new session is complete.
+    read_manifest(session_path)
+    if remove_original:
+        os.remove(pickle_path)
+    return session_path
+
+
+def convert_pickle_sessions(
+    sessions_path: str, remove_original: bool = False, compression: str = "none"
+) -> list:
+    """Converts every .pkl session in `sessions_path` and returns the new paths."""
+    converted = []
+    for name in list_session_names(sessions_path):
+        if name.endswith(LEGACY_SUFFIX):
+            converted.append(
+                convert_pickle_session(
+                    os.path.join(sessions_path, name), remove_original, compression
+                )
+            )
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert pickle sessions to the columnar session format."
+    )
+    parser.add_argument(
+        "sessions_path",
+        nargs="?",
+        default=os.path.join(os.getcwd(), "static", "sessions"),
+        help="Directory containing the .pkl sessions.",
+    )
+    parser.add_argument(
+        "--remove-original",
+        action="store_true",
+        help="Delete each .pkl file after it has been converted.",
+    )
+    parser.add_argument(
+        "--compression",
+        default="none",
+        choices=COMPRESSIONS,
+        help="Block compression of the converted sessions.",
+    )
+    args = parser.parse_args()
+    converted = convert_pickle_sessions(
+        args.sessions_path, args.remove_original, args.compression
+    )
+    logger.info(f"Converted {len(converted)} sessions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, Optional
+from loguru import logger
+
+from src.utils.chart_store import ChartStore
+from src.utils.session_catalog import SessionCatalog
+
+
+def chart_folder_size(chart_store: ChartStore, charts_folder: str) -> int:
+    """Returns the number of bytes stored below a charts folder."""
+    total = 0
+    for name in chart_store.list(charts_folder):
+        try:
+            total += chart_store.size(charts_folder + name)
+        except (FileNotFoundError, OSError):
+            # Evicted or deleted while listing.
+            pass
+    return total
+
+
+def charts_folder_of(session_name: str) -> str:
+    """Returns the chart store prefix of a session, e.g. "<date>_<ids>/"."""
+    return os.path.splitext(session_name)[0] + "/"
+
+
+class SessionRetention:
+    """
+    Removes old sessions and keeps sessions and charts below a disk quota.
+
+    A sweep removes sessions not opened for `max_age_days`, then the least
+    recently used sessions until sessions plus their charts fit into `max_bytes`,
+    and finally chart folders whose session no longer exists. Protected sessions
+    (e.g. the one currently open) are never removed. Sweeps run periodically on a
+    background thread once `start` was called.
+
+    Attributes:
+        catalog (SessionCatalog): Catalog providing sizes and last access times.
+        chart_store (ChartStore): Store holding the charts of the sessions.
+        remove_session (Callable): Removes a session with its charts and cached
+            state and returns the number of bytes freed.
+        protected_sessions (Callable): Returns names of sessions that must be kept.
+        on_charts_removed (Callable): Called with each orphaned chart folder after
+            it was removed, e.g. to forget its chart plan.
+        max_age_days (float): Maximum days since last access; 0 disables it.
+        max_bytes (int): Quota for sessions plus charts; 0 disables it.
+        interval (float): Seconds between two background sweeps.
+        last_report (dict): Result of the most recent sweep.
+    """
+
+    def __init__(
+        self,
+        catalog: SessionCatalog,
+        chart_store: ChartStore,
+        remove_session: Callable[[str], int],
+        protected_sessions: Callable[[], Iterable[str]] = lambda: (),
+        on_charts_removed: Callable[[str], None] = lambda charts_folder: None,
+        max_age_days: float = 0,
+        max_bytes: int = 0,
+        interval: float = 3600,
+    ):
+        self.catalog = catalog
+        self.chart_store = chart_store
+        self.remove_session = remove_session
+        self.protected_sessions = protected_sessions
+        self.on_charts_removed = on_charts_removed
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.last_report: Optional[dict] = None
+        self._sweep_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def select_sessions(self, now: datetime = None) -> List[str]:
+        """
+        Returns the sessions a sweep would remove, expired ones first and then the
+        least recently used ones needed to get below the quota.
+        """
+        now = now or datetime.now()
+        protected = set(self.protected_sessions())
+        sessions = self.catalog.least_recently_used()
+        selected = []
+
+        if self.max_age_days:
+            cutoff = (now - timedelta(days=self.max_age_days)).isoformat()
+            selected = [
+                s["name"]
+                for s in sessions
+                if s["accessed_at"]
+                and s["accessed_at"] < cutoff
+                and s["name"] not in protected
+            ]
+
+        if self.max_bytes:
+            sizes = {
+                s["name"]: (s["size_bytes"] or 0)
+                + chart_folder_size(self.chart_store, charts_folder_of(s["name"]))
+                for s in sessions
+            }
+            total = sum(size for name, size in sizes.items() if name not in selected)
+            for s in sessions:
+                if total <= self.max_bytes:
+                    break
+                if s["name"] in protected or s["name"] in selected:
+                    continue
+                selected.append(s["name"])
+                total -= sizes[s["name"]]
+        return selected
+
+    def orphaned_chart_folders(self) -> List[str]:
+        """Returns chart folders that belong to no cataloged or protected session."""
+        known = {
+            charts_folder_of(name)
+            for name in list(self.catalog.names()) + list(self.protected_sessions())
+        }
+        return [
+            folder
+            for folder in self.chart_store.prefixes()
+            if folder not in known and folder != "/"
+        ]
+
+    def sweep(self) -> dict:
+        """
+        Removes expired and over-quota sessions and orphaned charts.
+
+        Returns:
+            dict: Removed sessions, removed chart folders and bytes reclaimed.
+        """
+        with self._sweep_lock:
+            removed, reclaimed = [], 0
+            for name in self.select_sessions():
+                try:
+                    reclaimed += self.remove_session(name)
+                    removed.append(name)
+                except Exception as e:
+                    logger.error(f"Failed to remove session {name}: {e}", exc_info=True)
+
+            orphans = []
+            for folder in self.orphaned_chart_folders():
+                try:
+                    reclaimed += self.chart_store.delete_prefix(folder)
+                    self.on_charts_removed(folder)
+                    orphans.append(folder)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to remove charts {folder}: {e}", exc_info=True
+                    )
+
+            self.last_report = {
+                "swept_at": datetime.now().isoformat(timespec="seconds"),
+                "removed_sessions": removed,
+                "removed_chart_folders": orphans,
+                "reclaimed_bytes": reclaimed,
+            }
+        logger.info(
+            f"Retention sweep removed {len(removed)} sessions and {len(orphans)} "
+            f"orphaned chart folders, reclaiming {reclaimed} bytes."
+        )
+        return self.last_report
+
+    def start(self):
+        """Starts sweeping every `interval` seconds on a daemon thread."""
+        if not self.interval or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="session-retention", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background sweeps."""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}", exc_info=True)
@@ -0,0 +1,242 @@
+import atexit
+import dataclasses
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from loguru import logger
+
+from src.models.survey import Survey
+from src.utils.session_manager import (
+    save_session_state,
+    sync_session,
+    update_session_state,
+)
+
+
+def _copy_dict(value: dict) -> dict:
+    # Copies a dict and the dicts it holds, e.g. test results keyed by question.
+    return {
+        key: dict(item) if isinstance(item, dict) else item
+        for key, item in value.items()
+    }
+
+
+def snapshot(state: dict) -> dict:
+    """
+    Returns a copy of a session state that later changes to the live state do not
+    affect.
+
+    Containers are copied: the question and result lists and the statistics of
+    each survey, and dicts and lists such as the test results. What they hold is
+    shared: questions, results and their answers are not changed once a survey is
+    built, and DataFrames are replaced rather than modified by the routes.
+    """
+    copied = {}
+    for key, value in state.items():
+        if isinstance(value, Survey):
+            value = dataclasses.replace(
+                value,
+                questions=list(value.questions),
+                results=list(value.results),
+                statistics=_copy_dict(value.statistics) if value.statistics else None,
+            )
+        elif isinstance(value, dict):
+            value = _copy_dict(value)
+        elif isinstance(value, list):
+            value = list(value)
+        copied[key] = value
+    return copied
+
+
+class SessionWriter:
+    """
+    Persists sessions on a background thread so requests do not wait for disk I/O.
+
+    Writes are queued per session. A newer save replaces a queued save or update
+    of the same session, and updates are merged into whatever is queued, so a
+    burst of changes results in one write. The worker takes everything queued at
+    once, writes it, and then flushes the touched sessions to disk together.
+
+    The worker thread starts with the first write or an explicit `start`, so a
+    writer created before the process forks starts its thread in the child.
+
+    Attributes:
+        batch_delay (float): Seconds the worker waits for more writes before it
+            starts a batch.
+        on_written (Callable): Called with the session path after it was written.
+        written (int): Writes completed.
+        coalesced (int): Writes merged into an already queued write.
+        failed (int): Writes that raised an exception.
+    """
+
+    def __init__(
+        self,
+        batch_delay: float = 0.05,
+        on_written: Optional[Callable[[str], None]] = None,
+    ):
+        self.batch_delay = batch_delay
+        self.on_written = on_written
+        self.written = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._pending: "OrderedDict[str, dict]" = OrderedDict()
+        self._in_progress = set()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+        atexit.register(self.close)
+
+    def start(self):
+        """Starts the worker thread unless it is running in this process already."""
+        with self._condition:
+            # Threads do not survive a fork, so a copied thread is not alive.
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._closed = False
+            self._thread = threading.Thread(
+                target=self._run, name="session-writer", daemon=True
+            )
+            self._thread.start()
+
+    def save(self, session_path: str, state: dict, compression: str = "none"):
+        """Queues a full save of a session, replacing any queued write of it."""
+        self.start()
+        with self._condition:
+            if self._pending.pop(session_path, None) is not None:
+                self.coalesced += 1
+            self._pending[session_path] = {
+                "kind": "save",
+                "state": snapshot(state),
+                "compression": compression,
+            }
+            self._condition.notify_all()
+
+    def update(self, session_path: str, changes: dict, compression: str = "none"):
+        """Queues changes to a session, merging them into a queued write of it."""
+        changes = snapshot(changes)
+        self.start()
+        with self._condition:
+            queued = self._pending.get(session_path)
+            if queued is None:
+                self._pending[session_path] = {
+                    "kind": "update",
+                    "changes": changes,
+                    "compression": compression,
+                }
+            else:
+                target = queued["state" if queued["kind"] == "save" else "changes"]
+                target.update(changes)
+                self.coalesced += 1
+            self._condition.notify_all()
+
+    def discard(self, session_path: str):
+        """Drops queued writes of a session and waits for a running one to finish."""
+        with self._condition:
+            self._pending.pop(session_path, None)
+            while session_path in self._in_progress:
+                self._condition.wait()
+
+    def is_pending(self, session_path: str) -> bool:
+        """Returns True if a write of the session is queued or running."""
+        with self._condition:
+            return session_path in self._pending or session_path in self._in_progress
+
+    def pending_count(self) -> int:
+        """Returns the number of queued or running writes."""
+        with self._condition:
+            return len(self._pending) + len(self._in_progress)
+
+    def flush(self, session_path: str = None, timeout: float = None) -> bool:
+        """
+        Waits until queued writes are on disk.
+
+        Parameters:
+            session_path (str): Only wait for this session; all sessions if None.
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            bool: True if the writes finished within the timeout.
+        """
+
+        def done():
+            if session_path is None:
+                return not self._pending and not self._in_progress
+            return (
+                session_path not in self._pending
+                and session_path not in self._in_progress
+            )
+
+        with self._condition:
+            self._condition.notify_all()
+            return self._condition.wait_for(done, timeout=timeout)
+
+    def close(self, timeout: float = 30):
+        """Writes everything that is queued and stops the worker."""
+        with self._condition:
+            if self._closed or self._thread is None:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        logger.info(
+            f"Session writer stopped: {self.written} written, "
+            f"{self.coalesced} coalesced, {self.failed} failed."
+        )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending and self._closed:
+                    return
+            if not self._closed:
+                # Give rapid successive changes a moment to coalesce.
+                time.sleep(self.batch_delay)
+
+            with self._condition:
+                batch = list(self._pending.items())
+                self._pending.clear()
+                self._in_progress.update(path for path, _ in batch)
+
+            written = []
+            for session_path, job in batch:
+                try:
+                    if job["kind"] == "save":
+                        save_session_state(
+                            job["state"],
+                            session_path,
+                            job["compression"],
+                            sync=False,
+                            raise_errors=True,
+                        )
+                    else:
+                        update_session_state(
+                            session_path,
+                            job["changes"],
+                            job["compression"],
+                            sync=False,
+                        )
+                    written.append(session_path)
+                except Exception as e:
+                    with self._condition:
+                        self.failed += 1
+                    logger.error(
+                        f"Failed to write session {session_path}: {e}", exc_info=True
+                    )
+
+            for session_path in written:
+                try:
+                    sync_session(session_path)
+                    if self.on_written is not None:
+                        self.on_written(session_path)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to finish writing {session_path}: {e}", exc_info=True
+                    )
+            logger.debug(f"Wrote a batch of {len(written)} sessions.")
+
+            with self._condition:
+                self.written += len(written)
+                self._in_progress.clear()
+                self._condition.notify_all()
@@ -0,0 +1,29 @@
+import json
+import os
+from functools import lru_cache
+from loguru import logger
+
+SETTINGS_FILE = "appsettings.json"
+
+
+@lru_cache(maxsize=None)
+def load_settings(path: str = SETTINGS_FILE) -> dict:
+    """
+    Loads the application settings once per process.
+
+    Parameters:
+        path (str): Path of the settings file (default is "appsettings.json").
+
+    Returns:
+        dict: The settings, or an empty dict if the file does not exist.
+    """
+    if not os.path.exists(path):
+        logger.warning(f"Settings file not found: {path}")
+        return {}
+    with open(path, "r", encoding="utf-8") as settings_file:
+        return json.load(settings_file)
+
+
+def get_setting(key: str, default=None):
+    """Returns a single setting from appsettings.json, or `default` if it is not set."""
+    return load_settings().get(key, default)
@@ -0,0 +1,244 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional
+from loguru import logger
+
+from src.models.user_state import UserState
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_states (
+    sid TEXT PRIMARY KEY,
+    settings TEXT NOT NULL,
+    current_session_name TEXT,
+    data_version TEXT NOT NULL,
+    data BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_states_updated_at ON user_states (updated_at);
+"""
+
+
+class StateStore(ABC):
+    """
+    Keeps the working state of every browser session, keyed by a session id.
+    """
+
+    @abstractmethod
+    def get(self, sid: str) -> Optional[UserState]:
+        """Returns the state of a browser session, or None if it has none."""
+
+    @abstractmethod
+    def put(self, sid: str, state: UserState, include_data: bool = True):
+        """
+        Stores the state of a browser session.
+
+        Parameters:
+            sid (str): Browser session id.
+            state (UserState): State to store.
+            include_data (bool): Also store surveys and results. Pass False when
+                only settings (alpha, theme, ...) changed.
+        """
+
+    @abstractmethod
+    def delete(self, sid: str):
+        """Forgets the state of a browser session."""
+
+    @abstractmethod
+    def session_names(self) -> List[str]:
+        """Returns the saved sessions some browser session is working on."""
+
+
+class MemoryStateStore(StateStore):
+    """
+    Keeps states in this process and forgets the least recently used ones once
+    more than `max_entries` browser sessions are active. Only suitable when the
+    application runs in a single process.
+
+    Attributes:
+        max_entries (int): Maximum number of states kept.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._states: "OrderedDict[str, UserState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid: str) -> Optional[UserState]:
+        with self._lock:
+            state = self._states.get(sid)
+            if state is not None:
+                self._states.move_to_end(sid)
+            return state
+
+    def put(self, sid: str, state: UserState, include_data: bool = True):
+        with self._lock:
+            self._states[sid] = state
+            self._states.move_to_end(sid)
+            while len(self._states) > self.max_entries:
+                evicted, _ = self._states.popitem(last=False)
+                logger.debug(f"Evicted state of browser session {evicted[:8]}.")
+
+    def delete(self, sid: str):
+        with self._lock:
+            self._states.pop(sid, None)
+
+    def session_names(self) -> List[str]:
+        with self._lock:
+            return sorted(
+                {s.current_session_name for s in self._states.values()} - {"", None}
+            )
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Keeps states in a SQLite database shared by all worker processes.
+
+    Settings are stored as JSON on every change; surveys and results are pickled
+    only when they change and are tagged with a data version. Each process keeps
+    recently used states in memory and reloads the pickled data only when the
+    stored data version differs from its cached copy.
+
+    Attributes:
+        db_path (str): Path of the SQLite database file.
+        max_idle_seconds (float): States not stored for this long are removed.
+    """
+
+    # Seconds between two removals of idle states.
+    PRUNE_INTERVAL = 600
+
+    def __init__(
+        self, db_path: str, cache_entries: int = 64, max_idle_seconds: float = 259200
+    ):
+        self.db_path = db_path
+        self.max_idle_seconds = max_idle_seconds
+        self._cache = MemoryStateStore(max_entries=cache_entries)
+        self._last_prune = 0.0
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, sid: str) -> Optional[UserState]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT settings, data_version FROM user_states WHERE sid = ?", (sid,)
+            ).fetchone()
+            if row is None:
+                self._cache.delete(sid)
+                return None
+            settings, data_version = row
+
+            state = self._cache.get(sid)
+            if state is None or state.data_version != data_version:
+                (data,) = connection.execute(
+                    "SELECT data FROM user_states WHERE sid = ?", (sid,)
+                ).fetchone()
+                state = UserState(**pickle.loads(data), data_version=data_version)
+                self._cache.put(sid, state)
+
+        state.apply_settings(json.loads(settings))
+        return state
+
+    def put(self, sid: str, state: UserState, include_data: bool = True):
+        settings = json.dumps(state.settings())
+        now = time.time()
+        with self._connect() as connection:
+            if not include_data:
+                updated = connection.execute(
+                    "UPDATE user_states SET settings = ?, current_session_name = ?, "
+                    "updated_at = ? WHERE sid = ?",
+                    (settings, state.current_session_name, now, sid),
+                ).rowcount
+                include_data = updated == 0
+
+            if include_data:
+                state.data_version = uuid.uuid4().hex
+                connection.execute(
+                    "INSERT OR REPLACE INTO user_states "
+                    "(sid, settings, current_session_name, data_version, data, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        sid,
+                        settings,
+                        state.current_session_name,
+                        state.data_version,
+                        pickle.dumps(state.data(), protocol=pickle.HIGHEST_PROTOCOL),
+                        now,
+                    ),
+                )
+        self._cache.put(sid, state)
+
+        if now - self._last_prune > self.PRUNE_INTERVAL:
+            self._last_prune = now
+            self.prune(now - self.max_idle_seconds)
+
+    def delete(self, sid: str):
+        self._cache.delete(sid)
+        with self._connect() as connection:
+            connection.execute("DELETE FROM user_states WHERE sid = ?", (sid,))
+
+    def session_names(self) -> List[str]:
+        with self._connect() as connection:
+            return [
+                row[0]
+                for row in connection.execute(
+                    "SELECT DISTINCT current_session_name FROM user_states "
+                    "WHERE current_session_name != ''"
+                )
+            ]
+
+    def prune(self, older_than: float) -> int:
+        """Removes states last stored before the UNIX timestamp `older_than`."""
+        with self._connect() as connection:
+            removed = connection.execute(
+                "DELETE FROM user_states WHERE updated_at < ?", (older_than,)
+            ).rowcount
+        if removed:
+            logger.info(f"Removed {removed} idle browser session states.")
+        return removed
+
+
+def create_state_store(store_settings: dict, default_path: str) -> StateStore:
+    """
+    Creates the state store configured in appsettings.json.
+
+    Parameters:
+        store_settings (dict): The "state_store" settings, e.g.
+            {"backend": "sqlite", "path": "instance/states.db"}.
+        default_path (str): Database path of the SQLite backend if none is set.
+
+    Returns:
+        StateStore: The configured store.
+    """
+    store_settings = store_settings or {}
+    backend = store_settings.get("backend", "memory")
+    if backend == "sqlite":
+        db_path = store_settings.get("path", default_path)
+        logger.info(f"Using SQLite state store at {db_path}.")
+        return SQLiteStateStore(
+            db_path,
+            cache_entries=int(store_settings.get("cache_entries", 64)),
+            max_idle_seconds=float(store_settings.get("max_idle_hours", 72)) * 3600,
+        )
+    if backend != "memory":
+        logger.warning(f"Unknown state store backend '{backend}', using memory.")
+    max_entries = int(store_settings.get("max_entries", 256))
+    logger.info(f"Using in-memory state store for {max_entries} browser sessions.")
+    return MemoryStateStore(max_entries=max_entries)
@@ -0,0 +1,171 @@
+import math
+import threading
+import weakref
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from src.models.survey import Survey
+
+PARTICIPANT_SORT_KEYS = ("participant", "answered")
+
+# Separates answers in the text a participant filter searches, so a search never
+# matches across two answers.
+_FIELD_SEPARATOR = "\x1f"
+
+
+def json_value(value):
+    """Returns an answer as a JSON-safe value; missing answers become None."""
+    if hasattr(value, "item"):
+        # numpy scalar
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def is_answered(value) -> bool:
+    """Returns True if an answer holds a value."""
+    value = json_value(value)
+    return value is not None and value != ""
+
+
+def _natural_key(participant_id) -> tuple:
+    try:
+        return 0, float(participant_id), ""
+    except (TypeError, ValueError):
+        return 1, 0.0, str(participant_id)
+
+
+class _ParticipantIndex:
+    """Sort keys and search text of every participant of a survey."""
+
+    def __init__(self, survey: Survey):
+        self.rows = []
+        for position, result in enumerate(survey.results):
+            answers = [json_value(a.answer) for a in result.answers]
+            self.rows.append(
+                {
+                    "position": position,
+                    "participant_id": json_value(result.participant_id),
+                    "answered": sum(is_answered(a) for a in answers),
+                    "text": _FIELD_SEPARATOR.join(
+                        [str(result.participant_id)]
+                        + [str(a) for a in answers if a is not None]
+                    ).lower(),
+                }
+            )
+        self.orders = {
+            "participant": sorted(
+                self.rows, key=lambda row: _natural_key(row["participant_id"])
+            ),
+            "answered": sorted(self.rows, key=lambda row: row["answered"]),
+        }
+        # Keyed by row position, as participant IDs may repeat within a survey.
+        self.by_key = {str(row["position"]): row for row in self.rows}
+
+
+_indexes: "OrderedDict[int, tuple]" = OrderedDict()
+_indexes_lock = threading.Lock()
+# Surveys whose index is kept; one per survey of the most recently viewed states.
+MAX_INDEXES = 16
+
+
+def _index_of(survey: Survey) -> _ParticipantIndex:
+    """
+    Returns the participant index of a survey, building it on first use.
+
+    Surveys are replaced rather than changed when data is uploaded or loaded, so
+    an index stays valid as long as its survey object is alive.
+    """
+    key = id(survey)
+    with _indexes_lock:
+        entry = _indexes.get(key)
+        if (
+            entry is not None
+            and entry[0]() is survey
+            and entry[2] == len(survey.results)
+        ):
+            _indexes.move_to_end(key)
+            return entry[1]
+
+    index = _ParticipantIndex(survey)
+    with _indexes_lock:
+        _indexes[key] = (weakref.ref(survey), index, len(survey.results))
+        _indexes.move_to_end(key)
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def query_participants(
+    survey: Survey,
+    search: str = "",
+    sort: str = "participant",
+    descending: bool = False,
+    page: int = 1,
+    per_page: int = 25,
+) -> Tuple[List[dict], int]:
+    """
+    Returns one page of the participants of a survey.
+
+    Parameters:
+        survey (Survey): Survey whose participants are listed.
+        search (str): Only participants whose ID or any answer contains this text.
+        sort (str): One of PARTICIPANT_SORT_KEYS.
+        descending (bool): Sort order.
+        page (int): 1-based page number.
+        per_page (int): Participants per page.
+
+    Returns:
+        tuple: (participants on the page as dicts with "participant_id",
+            "answered" and "key", which identifies the participant's row for
+            `participant_answers`; total number of matching participants).
+    """
+    index = _index_of(survey)
+    rows = index.orders.get(sort, index.orders["participant"])
+    if descending:
+        rows = rows[::-1]
+    search = search.strip().lower()
+    if search:
+        rows = [row for row in rows if search in row["text"]]
+
+    per_page = max(int(per_page), 1)
+    offset = (max(int(page), 1) - 1) * per_page
+    participants = [
+        {
+            "participant_id": row["participant_id"],
+            "answered": row["answered"],
+            "key": str(row["position"]),
+        }
+        for row in rows[offset : offset + per_page]
+    ]
+    return participants, len(rows)
+
+
+def participant_answers(survey: Survey, key: str) -> Optional[dict]:
+    """
+    Returns the answers of one participant with their question texts.
+
+    Parameters:
+        survey (Survey): Survey the participant took part in.
+        key (str): "key" of the participant in the participant list.
+
+    Returns:
+        dict: "participant_id" and "answers", a list of dicts with "question_id",
+            "question" and "answer"; None if the survey has no such participant.
+    """
+    row = _index_of(survey).by_key.get(key)
+    if row is None:
+        return None
+    questions = survey.get_question_text_by_id()
+    return {
+        "participant_id": row["participant_id"],
+        "answers": [
+            {
+                "question_id": answer.question_id,
+                "question": questions.get(answer.question_id, ""),
+                "answer": json_value(answer.answer),
+            }
+            for answer in survey.results[row["position"]].answers
+        ],
+    }
@@ -0,0 +1,160 @@
+import gzip
+import io
+import os
+import zipfile
+from typing import Callable, Dict, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+from src.utils.lazy_import import LazyModule
+
+openpyxl = LazyModule("openpyxl")
+
+# An uploaded file's content, or the path of a file on disk. Paths of Parquet and
+# Arrow files are memory-mapped instead of read.
+Source = Union[bytes, str]
+
+
+def _open_binary(source: Source):
+    return open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+
+
+def read_csv(source: Source) -> pd.DataFrame:
+    """Reads a UTF-8 CSV file."""
+    with _open_binary(source) as stream:
+        return pd.read_csv(stream, encoding="utf-8")
+
+
+def read_gzip_csv(source: Source) -> pd.DataFrame:
+    """Reads a gzip-compressed CSV file, decompressing it while it is parsed."""
+    with _open_binary(source) as raw, gzip.GzipFile(fileobj=raw) as stream:
+        return pd.read_csv(stream, encoding="utf-8")
+
+
+def read_zip_csv(source: Source) -> pd.DataFrame:
+    """
+    Reads the CSV file inside a ZIP archive, decompressing it while it is parsed.
+
+    Raises:
+        ValueError: If the archive does not hold exactly one CSV file.
+    """
+    with _open_binary(source) as raw, zipfile.ZipFile(raw) as archive:
+        members = [
+            name
+            for name in archive.namelist()
+            if name.lower().endswith(".csv") and not name.startswith("__MACOSX/")
+        ]
+        if len(members) != 1:
+            raise ValueError(
+                f"The ZIP archive must hold exactly one CSV file, found {len(members)}."
+            )
+        with archive.open(members[0]) as stream:
+            return pd.read_csv(stream, encoding="utf-8")
+
+
+def _arrow_source(source: Source):
+    # Memory-map files and wrap uploads without copying them.
+    if isinstance(source, str):
+        return pa.memory_map(source, "r")
+    return pa.BufferReader(pa.py_buffer(source))
+
+
+def _to_pandas(table: pa.Table) -> pd.DataFrame:
+    return table.to_pandas(split_blocks=True)
+
+
+def read_parquet(source: Source) -> pd.DataFrame:
+    """Reads a Parquet file, keeping the column types it was written with."""
+    with _arrow_source(source) as arrow_source:
+        table = pq.read_table(arrow_source)
+    return _to_pandas(table)
+
+
+def read_arrow(source: Source) -> pd.DataFrame:
+    """Reads an Arrow IPC file (Feather v2) or stream, keeping its column types."""
+    with _arrow_source(source) as arrow_source:
+        try:
+            table = pa.ipc.open_file(arrow_source).read_all()
+        except pa.ArrowInvalid:
+            arrow_source.seek(0)
+            table = pa.ipc.open_stream(arrow_source).read_all()
+    return _to_pandas(table)
+
+
+def read_xlsx(source: Source) -> pd.DataFrame:
+    """
+    Reads the first sheet of an Excel workbook such as a LimeSurvey export, row by
+    row in read-only mode; the first row holds the column names. Numbers and
+    dates keep the types Excel stored them with.
+    """
+    workbook = openpyxl.load_workbook(
+        source if isinstance(source, str) else io.BytesIO(source),
+        read_only=True,
+        data_only=True,
+    )
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        columns = [
+            str(name) if name is not None else f"Unnamed: {index}"
+            for index, name in enumerate(header)
+        ]
+        data = [row for row in rows if any(value is not None for value in row)]
+    finally:
+        workbook.close()
+    return pd.DataFrame.from_records(data, columns=columns).infer_objects()
+
+
+# File name suffix -> reader; longer suffixes are tried first, so ".csv.gz" wins
+# over ".gz".
+SURVEY_READERS: Dict[str, Callable[[Source], pd.DataFrame]] = {
+    ".csv": read_csv,
+    ".csv.gz": read_gzip_csv,
+    ".gz": read_gzip_csv,
+    ".zip": read_zip_csv,
+    ".parquet": read_parquet,
+    ".arrow": read_arrow,
+    ".feather": read_arrow,
+    ".ipc": read_arrow,
+    ".xlsx": read_xlsx,
+}
+SURVEY_EXTENSIONS = tuple(sorted(SURVEY_READERS, key=len, reverse=True))
+
+
+def is_survey_file(filename: str) -> bool:
+    """Returns True if a file has a format a survey can be read from."""
+    return filename.lower().endswith(SURVEY_EXTENSIONS)
+
+
+def read_survey_dataframe(source: Source, filename: str = None) -> pd.DataFrame:
+    """
+    Reads the answers of a survey, one row per participant with the participant
+    ID in the first column, from any format in SURVEY_READERS.
+
+    Parameters:
+        source (bytes or str): Uploaded content, or the path of a file.
+        filename (str): Name the format is taken from; the path by default.
+
+    Returns:
+        pd.DataFrame: The answers. Columns of typed formats keep their types.
+
+    Raises:
+        ValueError: If the format is not supported or the file cannot be read.
+    """
+    filename = (filename or (source if isinstance(source, str) else "")).lower()
+    suffix = next((s for s in SURVEY_EXTENSIONS if filename.endswith(s)), None)
+    if suffix is None:
+        raise ValueError(
+            f"Unsupported file format of {os.path.basename(filename) or 'the upload'}. "
+            f"Supported formats: {', '.join(sorted(SURVEY_READERS))}."
+        )
+    try:
+        return SURVEY_READERS[suffix](source)
+    except Exception as e:
+        logger.error(f"Failed to read survey file {filename}: {e}", exc_info=True)
+        raise ValueError(f"Failed to read {suffix} file ({e}). Check file format.")
@@ -0,0 +1,195 @@
+import csv
+import io
+from typing import Iterable, Iterator, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.models.survey import Survey
+from src.utils.lazy_import import LazyModule
+from src.utils.survey_query import json_value
+
+openpyxl = LazyModule("openpyxl")
+
+# Export type -> (MIME type, file extension).
+SUMMARY_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "latex": ("application/x-tex", ".tex"),
+    "xlsx": (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        ".xlsx",
+    ),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+PARTICIPANT_FORMATS = {
+    "participants_csv": ("text/csv", ".csv"),
+    "participants_parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+# Columns of the per-participant long format: one row per answer.
+LONG_COLUMNS = [
+    "survey_id",
+    "group",
+    "survey_type",
+    "participant_id",
+    "question_id",
+    "question",
+    "answer",
+]
+LONG_SCHEMA = pa.schema(
+    [
+        ("survey_id", pa.int64()),
+        ("group", pa.string()),
+        ("survey_type", pa.string()),
+        ("participant_id", pa.string()),
+        ("question_id", pa.string()),
+        ("question", pa.string()),
+        ("answer", pa.string()),
+        # The answer as a number, if it is one; saves consumers from parsing.
+        ("answer_value", pa.float64()),
+    ]
+)
+# Answers per chunk of a streamed participant export.
+CHUNK_ROWS = 10000
+
+
+class _ChunkSink:
+    """
+    Write-only file object that collects what a writer produces until the
+    generator hands it to the client, like zip_stream's buffer, but seekable
+    far enough for `tell`, which the Parquet writer needs.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        if data:
+            self._chunks.append(data)
+            self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        """Returns and forgets everything written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_summary(table: pd.DataFrame, export_type: str) -> bytes:
+    """
+    Renders the summary table in memory in one of SUMMARY_FORMATS.
+
+    Raises:
+        ValueError: If the export type is unknown.
+    """
+    if export_type == "csv":
+        return table.to_csv(index=False).encode("utf-8")
+    if export_type == "latex":
+        return table.to_latex(
+            index=False, header=True, caption="Survey Analysis Results"
+        ).encode("utf-8")
+    if export_type == "xlsx":
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Summary")
+        sheet.append([str(column) for column in table.columns])
+        for row in table.itertuples(index=False):
+            sheet.append([json_value(value) for value in row])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
+    if export_type == "parquet":
+        buffer = pa.BufferOutputStream()
+        pq.write_table(pa.Table.from_pandas(table, preserve_index=False), buffer)
+        return buffer.getvalue().to_pybytes()
+    raise ValueError(f"Unknown export type '{export_type}'.")
+
+
+def long_rows(surveys: Iterable[Survey]) -> Iterator[list]:
+    """Yields one row of LONG_COLUMNS per answer of every participant of the surveys."""
+    for survey in surveys:
+        questions = survey.get_question_text_by_id()
+        for result in survey.results:
+            participant_id = str(json_value(result.participant_id))
+            for answer in result.answers:
+                yield [
+                    survey.survey_id,
+                    survey.group,
+                    survey.survey_type,
+                    participant_id,
+                    str(answer.question_id),
+                    questions.get(answer.question_id, ""),
+                    json_value(answer.answer),
+                ]
+
+
+def chunked(rows: Iterator[list], size: int) -> Iterator[List[list]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_long_csv(
+    surveys: Iterable[Survey], chunk_rows: int = CHUNK_ROWS
+) -> Iterator[bytes]:
+    """
+    Yields a per-participant long-format CSV (LONG_COLUMNS) in chunks of
+    `chunk_rows` answers, so memory stays flat however many participants there are.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(LONG_COLUMNS)
+    for chunk in chunked(long_rows(surveys), chunk_rows):
+        writer.writerows(
+            [value if value is not None else "" for value in row] for row in chunk
+        )
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _answer_value(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def stream_long_parquet(
+    surveys: Iterable[Survey], chunk_rows: int = CHUNK_ROWS
+) -> Iterator[bytes]:
+    """
+    Yields a per-participant long-format Parquet file (LONG_SCHEMA) with one row
+    group per `chunk_rows` answers; each row group is sent as soon as it is written.
+    """
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, LONG_SCHEMA) as writer:
+        for chunk in chunked(long_rows(surveys), chunk_rows):
+            columns = dict(zip(LONG_COLUMNS, zip(*chunk)))
+            answers = columns["answer"]
+            columns["answer"] = [None if a is None else str(a) for a in answers]
+            columns["answer_value"] = [_answer_value(a) for a in answers]
+            writer.write_table(pa.Table.from_pydict(columns, schema=LONG_SCHEMA))
+            yield sink.drain()
+    yield sink.drain()
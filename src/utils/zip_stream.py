@@ -0,0 +1,87 @@
+import os
+import time
+import zipfile
+from typing import BinaryIO, Iterable, Iterator, Tuple
+from loguru import logger
+
+# Already compressed formats are stored as they are; deflating them again costs
+# CPU without making the archive smaller.
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gz", ".zip")
+CHUNK_SIZE = 64 * 1024
+
+
+class _StreamBuffer:
+    """
+    Write-only, non-seekable file object that collects what ZipFile writes until
+    the generator hands it to the client.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        """Returns and forgets everything written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def compress_type_for(arcname: str) -> int:
+    """Returns ZIP_STORED for already compressed files and ZIP_DEFLATED otherwise."""
+    if arcname.lower().endswith(STORED_EXTENSIONS):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def stream_zip(
+    entries: Iterable[Tuple[str, BinaryIO]], chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Generates a ZIP archive piece by piece.
+
+    Every entry is read in chunks and written as soon as it is read, so memory use
+    stays bounded by the chunk size no matter how many entries the archive has.
+    Images that are already compressed are stored, everything else (CSV, SVG) is
+    deflated.
+
+    Parameters:
+        entries (iterable): (archive name, readable binary stream) pairs. The
+            streams are closed once they have been written.
+        chunk_size (int): Number of bytes read from an entry at a time.
+
+    Yields:
+        bytes: The next part of the archive.
+    """
+    buffer = _StreamBuffer()
+    entry_count = 0
+    with zipfile.ZipFile(buffer, mode="w") as zip_file:
+        for arcname, stream in entries:
+            zip_info = zipfile.ZipInfo(
+                os.path.basename(arcname), date_time=time.localtime()[:6]
+            )
+            zip_info.compress_type = compress_type_for(arcname)
+            logger.debug(f"Streaming {arcname} into ZIP.")
+            with stream, zip_file.open(zip_info, mode="w") as destination:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    destination.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            entry_count += 1
+            data = buffer.drain()
+            if data:
+                yield data
+    # Closing the archive writes the central directory.
+    yield buffer.drain()
+    logger.info(f"Streamed ZIP with {entry_count} entries.")
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from app import create_app
+from src.blueprints import routemanager as routes
+
+
+@pytest.fixture
+def client():
+    app = create_app(start_background_tasks=False)
+    return app.test_client()
+
+
+@pytest.fixture
+def sentinel():
+    """A file next to the sessions folder that must survive every request."""
+    path = os.path.join(os.path.dirname(routes.sessions_path.rstrip("/")), "sentinel")
+    with open(path, "w") as f:
+        f.write("keep")
+    yield path
+    os.remove(path)
+
+
+@pytest.mark.parametrize("name", ["..", "../x", "..%2Fx", "x.txt", "..%2F..%2Fapp.py"])
+def test_delete_session_rejects_paths(client, sentinel, name):
+    response = client.delete(f"/delete_session/{name}")
+    assert response.status_code in (400, 404)
+    assert os.path.isdir(routes.sessions_path)
+    assert os.path.exists(sentinel)
+
+
+@pytest.mark.parametrize("name", ["..", "../x", "..%2Fx"])
+def test_load_session_rejects_paths(client, sentinel, name):
+    response = client.post(f"/load_session/{name}")
+    assert response.status_code in (400, 404)
+    assert os.path.exists(sentinel)
+
+
+@pytest.mark.parametrize(
+    "name", ["", ".", "..", "../x.session", "a/b.session", "x.txt", "/etc/x.pkl"]
+)
+def test_session_path_of_rejects_invalid_names(name):
+    with pytest.raises(ValueError):
+        routes.session_path_of(name)
+
+
+def test_session_path_of_accepts_session_names():
+    assert routes.session_path_of("01-01-2025_1-2.session") == (
+        routes.sessions_path + "01-01-2025_1-2.session"
+    )